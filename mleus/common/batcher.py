@@ -13,29 +13,218 @@ __email__ = "ahmed.hani.ibrahim@gmail.com"
 
 from sklearn.utils import shuffle
 import numpy as np
+import collections
+import threading
+import hashlib
+import codecs
+import queue
+import json
 
+from mleus.common.utils import process_context
 
-class Batcher(object):
+
+_END_OF_BATCHES = object()
+
+# the collate function of a CollateWorkers process, set once when the worker starts
+_WORKER_COLLATE_FN = None
+
+
+def _init_collate_worker(collate_fn):
+    global _WORKER_COLLATE_FN
+
+    _WORKER_COLLATE_FN = collate_fn
+
+
+def _collate_in_worker(current_batch):
+    return _WORKER_COLLATE_FN(current_batch)
+
+
+class CollateWorkers(object):
+    """
+    Process pool that applies collate_fn (e.g. transformations + encoding) to batches off the main process.
+
+    collate_fn is handed to every worker once at start-up (inherited through fork where available), batches
+    come back in their original order and at most max_in_flight of them are being prepared at any time.
+    """
+
+    def __init__(self, collate_fn, num_workers, max_in_flight=None):
+        self.num_workers = num_workers
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * num_workers
+
+        context = process_context()
+
+        self.pool = context.Pool(num_workers, initializer=_init_collate_worker, initargs=(collate_fn,))
+
+    def imap(self, batches):
+        in_flight = collections.deque()
+
+        try:
+            for current_batch in batches:
+                in_flight.append(self.pool.apply_async(_collate_in_worker, (current_batch,)))
+
+                if len(in_flight) >= self.max_in_flight:
+                    yield in_flight.popleft().get()
+
+            while len(in_flight) > 0:
+                yield in_flight.popleft().get()
+        finally:
+            batches.close()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _BaseBatcher(object):
+
+    def iter_batches(self, target='train', prefetch=0, collate_fn=None, workers=None, timer=None):
+        if workers is not None:
+            for current_batch in workers.imap(self.iter_batches(target=target, prefetch=prefetch, timer=timer)):
+                yield current_batch
+
+            return
+
+        if prefetch <= 0:
+            while self.hasnext(target=target):
+                current_batch = self.__nextbatch(target, timer)
+
+                yield current_batch if collate_fn is None else collate_fn(current_batch)
+
+            return
+
+        batches = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                while not stop.is_set() and self.hasnext(target=target):
+                    current_batch = self.__nextbatch(target, timer)
+
+                    if collate_fn is not None:
+                        current_batch = collate_fn(current_batch)
+
+                    if not self.__put(batches, stop, (current_batch, None)):
+                        return
+            except Exception as error:
+                self.__put(batches, stop, (None, error))
+
+                return
+
+            self.__put(batches, stop, (_END_OF_BATCHES, None))
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                current_batch, error = batches.get()
+
+                if error is not None:
+                    raise error
+
+                if current_batch is _END_OF_BATCHES:
+                    break
+
+                yield current_batch
+        finally:
+            # reached on exhaustion, on close() and on KeyboardInterrupt raised in the consumer
+            stop.set()
+            producer.join()
+
+    def __nextbatch(self, target, timer):
+        if timer is None:
+            return self.nextbatch(target=target)
+
+        with timer.stage('nextbatch'):
+            return self.nextbatch(target=target)
+
+    @staticmethod
+    def __put(batches, stop, item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+
+class Batcher(_BaseBatcher):
 
     def __init__(self, data, 
                  batch_size=64, 
                  with_shuffle=True, 
-                 divide_train_valid_test=True):
+                 divide_train_valid_test=True,
+                 zero_copy=False,
+                 seed=20,
+                 block_size=None,
+                 rank=0,
+                 world_size=1,
+                 drop_last=False,
+                 split_indexes=None):
+        if world_size > 1 and not zero_copy:
+            raise ValueError('rank-aware sharding requires zero_copy=True')
+
+        if split_indexes is not None and not zero_copy:
+            raise ValueError('explicit split indexes require zero_copy=True')
+
+        if not 0 <= rank < world_size:
+            raise ValueError('rank must be in [0, {}), got {}'.format(world_size, rank))
+
         self.data = data
         self.size = len(self.data)
         self.batch_size = batch_size
+        self.zero_copy = zero_copy
+        self.seed = seed
+        self.block_size = block_size
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+        self.with_shuffle = with_shuffle
+        self.epoch = 0
+        self.split_indexes = split_indexes
 
-        if with_shuffle:
-            self.data = shuffle(self.data, random_state=20)
+        if self.zero_copy:
+            # the data is never reordered, batches are gathered through this permutation instead
+            self.random_state = np.random.RandomState(self.seed)
+            self.permutation = self.__base_permutation()
+        elif with_shuffle:
+            self.data = shuffle(self.data, random_state=self.seed)
 
         if divide_train_valid_test:
             self.__set_flags()
 
+            if self.world_size > 1:
+                # every rank holds the same global permutation (same seed) and keeps its own strided share of it
+                self.global_permutation = self.permutation
+                self.permutation = np.empty(self.test_end_idx + 1, dtype=self.global_permutation.dtype)
+
+                for target in ['train', 'valid', 'test']:
+                    self.__shard(target)
+
     def __set_flags(self):
-        # TODO make train size an argument
-        train_size = int(0.8 * self.size)
-        valid_size = int(0.1 * self.size)
-        test_size = int(0.1 * self.size)
+        if self.split_indexes is not None:
+            train_size, valid_size, test_size = [len(indexes) for indexes in self.split_indexes]
+        else:
+            # TODO make train size an argument
+            train_size = int(0.8 * self.size)
+            valid_size = int(0.1 * self.size)
+            test_size = int(0.1 * self.size)
+
+        if self.world_size > 1:
+            self.global_bounds = {'train': (0, train_size),
+                                  'valid': (train_size, train_size + valid_size),
+                                  'test': (train_size + valid_size, train_size + valid_size + test_size)}
+
+            train_size, valid_size, test_size = [self.__shard_size(size) for size in (train_size, valid_size, test_size)]
 
         self.train_start_idx, self.train_end_idx = 0, (train_size - 1)
         self.train_batch_idx = 0
@@ -48,65 +237,91 @@ class Batcher(object):
 
     def hasnext(self, target='train'):
         if target == 'train':
-            if self.train_batch_idx < self.train_end_idx:
+            if not self.__exhausted(self.train_batch_idx, self.train_end_idx):
                 return True
             else:
                 self.train_batch_idx = self.train_start_idx
 
                 return False
         elif target == 'valid':
-            if self.valid_batch_idx < self.valid_end_idx:
+            if not self.__exhausted(self.valid_batch_idx, self.valid_end_idx):
                 return True
             else:
                 self.valid_batch_idx = self.valid_start_idx
 
                 return False
         else:
-            if self.test_batch_idx < self.test_end_idx:
+            if not self.__exhausted(self.test_batch_idx, self.test_end_idx):
                 return True
             else:
                 self.test_batch_idx = self.test_start_idx
 
                 return False
 
+    def __exhausted(self, batch_idx, end_idx):
+        # end_idx is inclusive, the copying mode has always stopped one sample short of it and is kept as is
+        if self.zero_copy:
+            return batch_idx > end_idx
+
+        return batch_idx >= end_idx
+
+    def __stop(self, end_idx):
+        # the exclusive slice bound of a split, see __exhausted
+        return end_idx + 1 if self.zero_copy else end_idx
+
     def total_batches(self, target='train'):
         if target == 'train':
-            return int(int(0.8 * self.size) / self.batch_size)
+            return int(self.total_train_samples / self.batch_size)
         elif target == 'valid':
-            return int(int(0.1 * self.size) / self.batch_size)
+            return int(self.total_valid_samples / self.batch_size)
         else:
-            return int(int(0.1 * self.size) / self.batch_size)
+            return int(self.total_test_samples / self.batch_size)
 
     def nextbatch(self, target='train'):
         if target == 'train':
-            if self.train_batch_idx >= self.train_end_idx:
+            if self.__exhausted(self.train_batch_idx, self.train_end_idx):
                 print('Start from beginning')
 
                 self.train_batch_idx = self.train_start_idx
 
             self.train_batch_idx += self.batch_size
 
-            return self.data[self.train_batch_idx - self.batch_size:self.train_batch_idx]
+            return self.__take(self.train_batch_idx - self.batch_size, min(self.train_batch_idx, self.train_end_idx + 1))
         elif target == 'valid':
-            if self.valid_batch_idx >= self.valid_end_idx:
+            if self.__exhausted(self.valid_batch_idx, self.valid_end_idx):
                 print('Start from beginning')
 
                 self.valid_batch_idx = self.valid_start_idx
 
             self.valid_batch_idx += self.batch_size
 
-            return self.data[self.valid_batch_idx - self.batch_size:self.valid_batch_idx]
+            return self.__take(self.valid_batch_idx - self.batch_size, min(self.valid_batch_idx, self.valid_end_idx + 1))
         else:
-            if self.test_batch_idx >= self.test_end_idx:
+            if self.__exhausted(self.test_batch_idx, self.test_end_idx):
                 print('Start from beginning')
 
                 self.test_batch_idx = self.test_start_idx
 
             self.test_batch_idx += self.batch_size
 
-            return self.data[self.test_batch_idx - self.batch_size:self.test_batch_idx]
+            return self.__take(self.test_batch_idx - self.batch_size, min(self.test_batch_idx, self.test_end_idx + 1))
 
     def shuffle_me(self, target='train'):
+        if self.zero_copy:
+            if self.world_size > 1:
+                global_start, global_end = self.global_bounds[target if target in ('train', 'valid') else 'test']
+
+                self.__shuffle_range(self.global_permutation, global_start, global_end)
+                self.__shard(target)
+            elif target == 'train':
+                self.__shuffle_range(self.permutation, self.train_start_idx, self.__stop(self.train_end_idx))
+            elif target == 'valid':
+                self.__shuffle_range(self.permutation, self.valid_start_idx, self.__stop(self.valid_end_idx))
+            else:
+                self.__shuffle_range(self.permutation, self.test_start_idx, self.__stop(self.test_end_idx))
+
+            return
+
         if target == 'train':
             import copy as cp
 
@@ -132,21 +347,179 @@ class Batcher(object):
 
             del test
 
+    def __take(self, start, end):
+        if not self.zero_copy:
+            return self.data[start:end]
+
+        return self._gather(self.permutation[start:end])
+
+    def _gather(self, indexes):
+        if isinstance(self.data, np.ndarray):
+            return self.data[indexes]
+
+        if hasattr(self.data, 'take'):
+            return self.data.take(indexes)
+
+        return [self.data[index] for index in indexes]
+
+    def __base_permutation(self):
+        if self.split_indexes is None:
+            permutation = np.arange(self.size)
+
+            if self.with_shuffle:
+                self.__shuffle_range(permutation, 0, self.size)
+
+            return permutation
+
+        permutation = np.concatenate([np.asarray(indexes, dtype=np.int64) for indexes in self.split_indexes])
+
+        if self.with_shuffle:
+            start = 0
+
+            for indexes in self.split_indexes:
+                self.__shuffle_range(permutation, start, start + len(indexes))
+                start += len(indexes)
+
+        return permutation
+
+    def __shard_size(self, size):
+        if self.drop_last:
+            return size // self.world_size
+
+        return -(-size // self.world_size)
+
+    def __shard(self, target):
+        if target == 'train':
+            start = self.train_start_idx
+        elif target == 'valid':
+            start = self.valid_start_idx
+        else:
+            start = self.test_start_idx
+            target = 'test'
+
+        global_start, global_end = self.global_bounds[target]
+        local_size = self.__shard_size(global_end - global_start)
+
+        # without drop_last the split wraps around so that every rank gets the same number of samples
+        positions = np.resize(np.arange(global_start, global_end), local_size * self.world_size)
+        positions = positions[self.rank::self.world_size]
+
+        self.permutation[start:start + local_size] = self.global_permutation[positions]
+
+    def __shuffle_range(self, permutation, start, end):
+        view = permutation[start:end]
+
+        if self.block_size is None:
+            self.random_state.shuffle(view)
+
+            return
+
+        # out-of-core data: shuffle the order of the shards (of a ShardedDataset), of the contiguous blocks inside
+        # each shard and of the rows inside each block only, so an epoch reads the shards one after the other and
+        # every batch touches a few blocks of the underlying storage instead of random pages
+        shard_starts = getattr(self.data, 'shard_starts', None)
+
+        if shard_starts is None:
+            shards = [view.copy()]
+        else:
+            shard_ids = np.searchsorted(shard_starts, view, side='right') - 1
+            shards = [view[shard_ids == shard_idx] for shard_idx in np.unique(shard_ids)]
+
+        self.random_state.shuffle(shards)
+
+        blocks = []
+
+        for shard in shards:
+            shard_blocks = [shard[i:i + self.block_size].copy() for i in range(0, len(shard), self.block_size)]
+
+            for block in shard_blocks:
+                self.random_state.shuffle(block)
+
+            self.random_state.shuffle(shard_blocks)
+            blocks.extend(shard_blocks)
+
+        if len(blocks) > 0:
+            view[:] = np.concatenate(blocks)
+
     def initialize(self):
         self.__set_flags()
 
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+        if self.zero_copy:
+            # rebuild the epoch's order from (seed, epoch) alone, independently of the previous epochs
+            permutation = self.global_permutation if self.world_size > 1 else self.permutation
+
+            self.random_state = np.random.RandomState(self.seed)
+            permutation[:] = self.__base_permutation()
+
+            if self.world_size > 1:
+                for target in ['train', 'valid', 'test']:
+                    self.__shard(target)
+
+            if self.epoch > 0 and self.with_shuffle:
+                self.random_state = np.random.RandomState([self.seed, self.epoch])
+                self.shuffle_me('train')
+
+        self.initialize()
+
+    @property
+    def steps_per_epoch(self):
+        last = self.train_end_idx if self.zero_copy else self.train_end_idx - 1
+
+        return max(0, -(-(last - self.train_start_idx + 1) // self.batch_size))
+
+    @property
+    def step(self):
+        return (self.train_batch_idx - self.train_start_idx) // self.batch_size
+
+    @property
+    def global_step(self):
+        return self.epoch * self.steps_per_epoch + self.step
+
+    def seek(self, step):
+        self.train_batch_idx = self.train_start_idx + step * self.batch_size
+
+    def seek_global(self, global_step):
+        epoch, step = divmod(global_step, self.steps_per_epoch)
+
+        self.set_epoch(epoch)
+        self.seek(step)
+
+    def state_dict(self):
+        return {'seed': self.seed,
+                'epoch': self.epoch,
+                'step': self.step,
+                'batch_size': self.batch_size,
+                'rank': self.rank,
+                'world_size': self.world_size}
+
+    def load_state_dict(self, state):
+        if state['batch_size'] != self.batch_size or state['world_size'] != self.world_size:
+            raise ValueError('the state was saved with batch_size={} and world_size={}'.format(state['batch_size'],
+                                                                                           state['world_size']))
+
+        # another rank's position would resume this rank's shard at the wrong samples
+        if state['rank'] != self.rank:
+            raise ValueError('the state was saved by rank {}, not rank {}'.format(state['rank'], self.rank))
+
+        self.seed = state['seed']
+        self.set_epoch(state['epoch'])
+        self.seek(state['step'])
+
     @property
     def total_train_samples(self):
         return self.train_end_idx - self.train_start_idx + 1
 
     @property
     def total_train_batches(self):
-        local_size = int(0.8 * self.size)
+        local_size = self.total_train_samples
 
         if local_size <= self.batch_size:
             return 1
 
-        return int(int(0.8 * self.size) / self.batch_size)
+        return int(local_size / self.batch_size)
 
     @property
     def total_valid_samples(self):
@@ -154,12 +527,12 @@ class Batcher(object):
 
     @property
     def total_valid_batches(self):
-        local_size = int(0.1 * self.size)
+        local_size = self.total_valid_samples
 
         if local_size <= self.batch_size:
             return 1
 
-        return int(int(0.1 * self.size) / self.batch_size)
+        return int(local_size / self.batch_size)
 
     @property
     def total_test_samples(self):
@@ -167,21 +540,562 @@ class Batcher(object):
 
     @property
     def total_test_batches(self):
-        local_size = int(0.1 * self.size)
+        local_size = self.total_test_samples
 
         if local_size <= self.batch_size:
             return 1
 
-        return int(int(0.1 * self.size) / self.batch_size)
+        return int(local_size / self.batch_size)
     
     @property
     def train_data(self):
-        return self.data[self.train_start_idx:self.train_end_idx]
+        return self.__take(self.train_start_idx, self.__stop(self.train_end_idx))
     
     @property
     def valid_data(self):
-        return self.data[self.valid_start_idx:self.valid_end_idx]
+        return self.__take(self.valid_start_idx, self.__stop(self.valid_end_idx))
     
     @property
     def test_data(self):
-        return self.data[self.test_start_idx:self.test_end_idx]
+        return self.__take(self.test_start_idx, self.__stop(self.test_end_idx))
+
+
+class BucketBatcher(Batcher):
+    """
+    Zero-copy Batcher that groups samples of similar length to reduce padding.
+
+    Every pass sorts windows of window_size samples of the split by length_fn and cuts them into batches
+    of at most batch_size samples and, if max_tokens is set, at most max_tokens padded tokens
+    (batch length * longest sample). Train batches are reshuffled every pass.
+    """
+
+    def __init__(self, data,
+                 length_fn=len,
+                 batch_size=64,
+                 max_tokens=None,
+                 window_size=None,
+                 with_shuffle=True,
+                 seed=20,
+                 block_size=None):
+        super(BucketBatcher, self).__init__(data,
+                                            batch_size=batch_size,
+                                            with_shuffle=with_shuffle,
+                                            divide_train_valid_test=True,
+                                            zero_copy=True,
+                                            seed=seed,
+                                            block_size=block_size)
+        self.length_fn = length_fn
+        self.max_tokens = max_tokens
+        self.window_size = window_size if window_size is not None else 50 * batch_size
+
+        self.lengths = np.fromiter((self.length_fn(self.data[i]) for i in range(self.size)),
+                                   dtype=np.int64, count=self.size)
+
+        self.__batches = {}
+        self.__batch_idx = {}
+
+    def hasnext(self, target='train'):
+        if target not in self.__batches:
+            self.__batches[target] = self.__build(target)
+            self.__batch_idx[target] = 0
+
+        if self.__batch_idx[target] < len(self.__batches[target]):
+            return True
+
+        del self.__batches[target]
+        del self.__batch_idx[target]
+
+        return False
+
+    def nextbatch(self, target='train'):
+        if not self.hasnext(target=target):
+            print('Start from beginning')
+
+            if not self.hasnext(target=target):
+                return []
+
+        indexes = self.__batches[target][self.__batch_idx[target]]
+        self.__batch_idx[target] += 1
+
+        return self._gather(indexes)
+
+    def total_batches(self, target='train'):
+        if target not in self.__batches:
+            self.__batches[target] = self.__build(target)
+            self.__batch_idx[target] = 0
+
+        return len(self.__batches[target])
+
+    def initialize(self):
+        super(BucketBatcher, self).initialize()
+
+        self.__batches = {}
+        self.__batch_idx = {}
+
+    @property
+    def steps_per_epoch(self):
+        return self.total_batches(target='train')
+
+    @property
+    def step(self):
+        return self.__batch_idx.get('train', 0)
+
+    def seek(self, step):
+        self.total_batches(target='train')
+        self.__batch_idx['train'] = step
+
+    def __build(self, target):
+        if target == 'train':
+            start, end = self.train_start_idx, self.train_end_idx
+        elif target == 'valid':
+            start, end = self.valid_start_idx, self.valid_end_idx
+        else:
+            start, end = self.test_start_idx, self.test_end_idx
+
+        if target == 'train' and self.with_shuffle:
+            self.shuffle_me(target)
+
+        indexes = self.permutation[start:end + 1]
+        batches = []
+
+        for i in range(0, len(indexes), self.window_size):
+            window = indexes[i:i + self.window_size]
+            window = window[np.argsort(self.lengths[window], kind='stable')]
+
+            batches.extend(self.__cut(window))
+
+        if target == 'train' and self.with_shuffle:
+            self.random_state.shuffle(batches)
+
+        return batches
+
+    def __cut(self, window):
+        batches = []
+        begin, longest = 0, 0
+
+        for position, index in enumerate(window):
+            count = position - begin + 1
+            candidate = max(longest, self.lengths[index])
+
+            if position > begin and (count > self.batch_size or
+                                     (self.max_tokens is not None and count * candidate > self.max_tokens)):
+                batches.append(window[begin:position])
+                begin, longest = position, self.lengths[index]
+            else:
+                longest = candidate
+
+        if begin < len(window):
+            batches.append(window[begin:])
+
+        return batches
+
+
+class WeightedBatcher(Batcher):
+    """
+    Zero-copy Batcher that draws train batches with replacement through an alias table (Walker's method).
+
+    weights is a per-sample sequence aligned with data, a {label: weight} dict, or None for class-balanced
+    weights; labels are read with item[label_axis]. Every epoch has steps_per_epoch batches (by default as
+    many as the train split holds) and batch k of epoch e only depends on (seed, e, k).
+    """
+
+    def __init__(self, data,
+                 weights=None,
+                 label_axis=None,
+                 batch_size=64,
+                 steps_per_epoch=None,
+                 with_shuffle=True,
+                 seed=20):
+        super(WeightedBatcher, self).__init__(data,
+                                              batch_size=batch_size,
+                                              with_shuffle=with_shuffle,
+                                              divide_train_valid_test=True,
+                                              zero_copy=True,
+                                              seed=seed)
+        self.train_indexes = self.permutation[self.train_start_idx:self.train_end_idx + 1].copy()
+
+        if weights is None or isinstance(weights, dict):
+            labels = [self.data[index][label_axis] for index in self.train_indexes]
+
+            if weights is None:
+                counts = collections.Counter(labels)
+                weights = {label: 1.0 / count for label, count in counts.items()}
+
+            sample_weights = [weights[label] for label in labels]
+        else:
+            sample_weights = np.asarray(weights, dtype=np.float64)[self.train_indexes]
+
+        self.sample_weights = np.asarray(sample_weights, dtype=np.float64)
+        self.table = _AliasTable(self.sample_weights)
+
+        if steps_per_epoch is None:
+            steps_per_epoch = max(1, len(self.train_indexes) // self.batch_size)
+
+        self.__steps_per_epoch = steps_per_epoch
+        self.__train_step = 0
+
+    def hasnext(self, target='train'):
+        if target != 'train':
+            return super(WeightedBatcher, self).hasnext(target=target)
+
+        if self.__train_step < self.__steps_per_epoch:
+            return True
+
+        self.__train_step = 0
+
+        return False
+
+    def nextbatch(self, target='train'):
+        if target != 'train':
+            return super(WeightedBatcher, self).nextbatch(target=target)
+
+        if self.__train_step >= self.__steps_per_epoch:
+            print('Start from beginning')
+
+            self.__train_step = 0
+
+        random_state = np.random.RandomState([self.seed, self.epoch, self.__train_step])
+        positions = self.table.sample(self.batch_size, random_state)
+
+        self.__train_step += 1
+
+        return self._gather(self.train_indexes[positions])
+
+    def total_batches(self, target='train'):
+        if target == 'train':
+            return self.__steps_per_epoch
+
+        return super(WeightedBatcher, self).total_batches(target=target)
+
+    def initialize(self):
+        super(WeightedBatcher, self).initialize()
+
+        self.__train_step = 0
+
+    @property
+    def steps_per_epoch(self):
+        return self.__steps_per_epoch
+
+    @property
+    def step(self):
+        return self.__train_step
+
+    def seek(self, step):
+        self.__train_step = step
+
+
+class _AliasTable(object):
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+
+        if len(weights) == 0 or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError('weights must be non-negative with a positive sum')
+
+        size = len(weights)
+        scaled = weights * size / weights.sum()
+
+        self.probability = np.ones(size)
+        self.alias = np.arange(size)
+
+        small = [i for i in range(size) if scaled[i] < 1.0]
+        large = [i for i in range(size) if scaled[i] >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def sample(self, size, random_state):
+        columns = random_state.randint(len(self.probability), size=size)
+        coins = random_state.random_sample(size)
+
+        return np.where(coins < self.probability[columns], columns, self.alias[columns])
+
+
+class StreamingBatcher(_BaseBatcher):
+    """
+    Batcher over data of unknown length, e.g. a generator or a (growing) JSONL file.
+
+    source is a re-iterable (e.g. a list), or a callable returning a fresh iterable for every pass; every split
+    of every epoch is a separate pass, so one-shot iterators and generators are refused. Records are assigned
+    to train/valid/test by hashing key(record), and train records are shuffled approximately through a
+    fixed-size buffer, so memory does not depend on the size of the corpus.
+    """
+
+    def __init__(self, source,
+                 batch_size=64,
+                 buffer_size=10000,
+                 key=None,
+                 split_ratios=(0.8, 0.1, 0.1),
+                 seed=20):
+        if not callable(source) and iter(source) is source:
+            raise TypeError('source is a one-shot iterator, pass a callable that returns a fresh one instead '
+                            '(e.g. the generator function rather than the generator)')
+
+        self.source = source
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.key = key
+        self.split_ratios = split_ratios
+        self.seed = seed
+        self.epoch = 0
+
+        self.__streams = {}
+        self.__pending = {}
+
+    @classmethod
+    def from_jsonl(cls, path, **kwargs):
+        def read_lines():
+            with codecs.open(path, 'r', encoding='utf-8') as reader:
+                for line in reader:
+                    if line.strip():
+                        yield json.loads(line)
+
+        return cls(read_lines, **kwargs)
+
+    def split_of(self, record):
+        key = record if self.key is None else self.key(record)
+        digest = hashlib.md5(str(key).encode('utf-8')).digest()
+        point = int.from_bytes(digest[:8], 'big') / float(2 ** 64)
+
+        if point < self.split_ratios[0]:
+            return 'train'
+        elif point < self.split_ratios[0] + self.split_ratios[1]:
+            return 'valid'
+        else:
+            return 'test'
+
+    def hasnext(self, target='train'):
+        if self.__pending.get(target) is None:
+            if target not in self.__streams:
+                self.__streams[target] = self.__batches(target)
+
+            self.__pending[target] = next(self.__streams[target], None)
+
+            if self.__pending[target] is None:
+                del self.__streams[target]
+
+                return False
+
+        return True
+
+    def nextbatch(self, target='train'):
+        if not self.hasnext(target=target):
+            print('Start from beginning')
+
+            if not self.hasnext(target=target):
+                return []
+
+        return self.__pending.pop(target)
+
+    def total_batches(self, target='train'):
+        return None
+
+    def initialize(self):
+        self.epoch += 1
+        self.__streams = {}
+        self.__pending = {}
+
+    def set_epoch(self, epoch):
+        self.initialize()
+
+        self.epoch = epoch
+
+    def __records(self, target):
+        source = self.source() if callable(self.source) else self.source
+
+        for record in source:
+            if self.split_of(record) == target:
+                yield record
+
+    def __shuffled(self, records):
+        random_state = np.random.RandomState(self.seed + self.epoch)
+        buffer = []
+
+        for record in records:
+            if len(buffer) < self.buffer_size:
+                buffer.append(record)
+
+                continue
+
+            idx = random_state.randint(len(buffer))
+
+            yield buffer[idx]
+
+            buffer[idx] = record
+
+        random_state.shuffle(buffer)
+
+        for record in buffer:
+            yield record
+
+    def __batches(self, target):
+        records = self.__records(target)
+
+        if target == 'train' and self.buffer_size > 1:
+            records = self.__shuffled(records)
+
+        current_batch = []
+
+        for record in records:
+            current_batch.append(record)
+
+            if len(current_batch) == self.batch_size:
+                yield current_batch
+
+                current_batch = []
+
+        if len(current_batch) > 0:
+            yield current_batch
+
+
+class MixingBatcher(_BaseBatcher):
+    """
+    Interleaves several sources sample by sample without concatenating them.
+
+    A source is a Batcher/StreamingBatcher, an in-memory sequence (wrapped in a zero-copy Batcher) or an
+    iterable/callable (wrapped in a StreamingBatcher). Train samples are drawn from source i with probability
+    proportional to weights[i] ** (1 / temperature); weights default to the sources' train sizes and are
+    required when a source has an unknown length.
+    Exhausted sources start over, so a train epoch is steps_per_epoch batches. Valid and test go through the
+    sources one after another.
+    """
+
+    def __init__(self, sources,
+                 weights=None,
+                 temperature=1.0,
+                 batch_size=64,
+                 steps_per_epoch=None,
+                 seed=20):
+        self.batch_size = batch_size
+        self.seed = seed
+        self.epoch = 0
+        self.temperature = temperature
+        self.sources = [source if isinstance(source, _BaseBatcher) else self.__wrap(source) for source in sources]
+
+        if weights is None:
+            if not all(isinstance(source, Batcher) for source in self.sources):
+                raise ValueError('weights are required when a source has an unknown length')
+
+            weights = [source.total_train_samples for source in self.sources]
+
+        weights = np.asarray(weights, dtype=np.float64) ** (1.0 / self.temperature)
+        self.probabilities = weights / weights.sum()
+
+        if steps_per_epoch is None:
+            totals = [source.total_batches(target='train') for source in self.sources]
+
+            if None in totals:
+                raise ValueError('steps_per_epoch is required when a source has an unknown length')
+
+            steps_per_epoch = max(1, sum(totals))
+
+        self.steps_per_epoch = steps_per_epoch
+        self.step = 0
+
+        self.__buffers = [[] for _ in self.sources]
+        self.__chains = {}
+        self.__pending = {}
+
+    def __wrap(self, source):
+        if hasattr(source, '__len__') and hasattr(source, '__getitem__'):
+            return Batcher(source, batch_size=self.batch_size, zero_copy=True, seed=self.seed)
+
+        return StreamingBatcher(source, batch_size=self.batch_size, seed=self.seed)
+
+    def hasnext(self, target='train'):
+        if target == 'train':
+            if self.step < self.steps_per_epoch:
+                return True
+
+            self.step = 0
+
+            return False
+
+        if self.__pending.get(target) is None:
+            if target not in self.__chains:
+                self.__chains[target] = self.__chain(target)
+
+            self.__pending[target] = next(self.__chains[target], None)
+
+            if self.__pending[target] is None:
+                del self.__chains[target]
+
+                return False
+
+        return True
+
+    def nextbatch(self, target='train'):
+        if target != 'train':
+            if not self.hasnext(target=target):
+                print('Start from beginning')
+
+                if not self.hasnext(target=target):
+                    return []
+
+            return self.__pending.pop(target)
+
+        if self.step >= self.steps_per_epoch:
+            print('Start from beginning')
+
+            self.step = 0
+
+        random_state = np.random.RandomState([self.seed, self.epoch, self.step])
+        choices = random_state.choice(len(self.sources), size=self.batch_size, p=self.probabilities)
+
+        self.step += 1
+
+        return [self.__pop(source_idx) for source_idx in choices]
+
+    def total_batches(self, target='train'):
+        if target == 'train':
+            return self.steps_per_epoch
+
+        totals = [source.total_batches(target=target) for source in self.sources]
+
+        return None if None in totals else sum(totals)
+
+    def initialize(self):
+        self.epoch += 1
+        self.step = 0
+        self.__chains = {}
+        self.__pending = {}
+
+    def set_epoch(self, epoch):
+        self.initialize()
+
+        self.epoch = epoch
+
+        # the sources reshuffle for the epoch and start their pass over
+        for source in self.sources:
+            source.set_epoch(epoch)
+
+        self.__buffers = [[] for _ in self.sources]
+
+    def __pop(self, source_idx):
+        buffer = self.__buffers[source_idx]
+
+        if len(buffer) == 0:
+            source = self.sources[source_idx]
+
+            # hasnext() rewinds the source once its pass is over, so the next call starts it again
+            if not source.hasnext(target='train') and not source.hasnext(target='train'):
+                raise ValueError('source {} has no train samples'.format(source_idx))
+
+            buffer.extend(reversed(list(source.nextbatch(target='train'))))
+
+        return buffer.pop()
+
+    def __chain(self, target):
+        for source in self.sources:
+            for current_batch in source.iter_batches(target=target):
+                yield current_batch
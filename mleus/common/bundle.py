@@ -0,0 +1,295 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import re
+import json
+import functools
+import importlib
+import numpy as np
+import pickle as pkl
+
+from mleus.common.utils import atomic_directory
+
+
+BUNDLE_FORMAT = 'mleus-bundle'
+BUNDLE_VERSION = 1
+
+# the special tokens of TextEncoder('word_index')
+_WORD_INDEX_SPECIALS = {'<sos>': 0, '<eos>': 1, '<pad>': 2}
+
+
+def _reference(target, kind):
+    reference = {'module': target.__module__, 'qualname': target.__qualname__}
+
+    if '<locals>' in reference['qualname'] or '<lambda>' in reference['qualname']:
+        raise ValueError('{} {}.{} cannot be imported by name, use a module level one'.format(
+            kind, reference['module'], reference['qualname']))
+
+    return reference
+
+
+def _resolve(reference):
+    # the qualname may be nested (e.g. Preprocessor.normalize_text), so it is walked from the module
+    target = importlib.import_module(reference['module'])
+
+    for attribute in reference['qualname'].split('.'):
+        target = getattr(target, attribute)
+
+    return target
+
+
+def transformation_spec(transformation):
+    if isinstance(transformation, functools.partial):
+        spec = transformation_spec(transformation.func)
+        spec['args'] = list(transformation.args)
+        spec['kwargs'] = dict(transformation.keywords)
+
+        # bundle.json has to hold the arguments, a set or an object would only fail when it is written
+        for name, value in list(enumerate(transformation.args)) + sorted(transformation.keywords.items()):
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                raise ValueError('argument {} of transformation {}.{} is not a json value: {!r}'.format(
+                    name, spec['module'], spec['qualname'], value))
+
+        return spec
+
+    return _reference(transformation, 'transformation')
+
+
+def build_transformation(spec):
+    function = _resolve(spec)
+
+    if 'args' in spec or 'kwargs' in spec:
+        return functools.partial(function, *spec.get('args', []), **spec.get('kwargs', {}))
+
+    return function
+
+
+def _save_vocabulary(directory, name, token2index):
+    tokens = sorted(token2index.keys())
+    encoded = [token.encode('utf-8') for token in tokens]
+    width = max([len(token) for token in encoded] + [1])
+
+    # fixed-width sorted bytes, searched with np.searchsorted straight from the memory map
+    np.save(os.path.join(directory, name + '.npy'), np.asarray(encoded, dtype='S{}'.format(width)))
+    np.save(os.path.join(directory, name + '_ids.npy'), np.asarray([token2index[token] for token in tokens],
+                                                                    dtype=np.int64))
+
+
+def encoder_spec(encoder, directory):
+    """
+    Writes the arrays of the encoder into directory and returns its declarative spec. TextEncoder vocabularies
+    and word embeddings become memory-mappable arrays, any other encoder is pickled as is.
+    """
+    loader = getattr(encoder, 'model', encoder)
+    kind = type(loader).__name__
+
+    if kind == '_WordIndexLoader':
+        _save_vocabulary(directory, 'vocabulary', loader.word2indexes)
+
+        return {'type': 'word_index', 'unit': 'word', 'unknown': 3, 'specials': _WORD_INDEX_SPECIALS}
+    elif kind == '_CharIndexLoader':
+        _save_vocabulary(directory, 'vocabulary', loader.char2indexes)
+
+        return {'type': 'char_index', 'unit': 'char', 'unknown': 0}
+    elif kind in ('_WordOneHotLoader', '_CharOneHotLoader'):
+        token2index = loader.word2indexes if kind == '_WordOneHotLoader' else loader.char2indexes
+        _save_vocabulary(directory, 'vocabulary', token2index)
+
+        return {'type': 'one_hot', 'unit': 'word' if kind == '_WordOneHotLoader' else 'char', 'size': len(token2index)}
+    elif kind == '_WordEmbeddingLoader':
+        vectors = loader._WordEmbeddingLoader__model.precomputed_word_embeddings
+        words = getattr(vectors, 'index_to_key', None) or vectors.index2word
+
+        _save_vocabulary(directory, 'vocabulary', {word: index for index, word in enumerate(words)})
+        np.save(os.path.join(directory, 'embeddings.npy'), np.asarray(vectors.vectors, dtype=np.float32))
+
+        return {'type': 'embedding', 'unit': 'word'}
+    elif kind in ('_BERTEmbedding', '_ELMoEmbedding'):
+        raise ValueError('contextual embeddings ({}) cannot be exported to a bundle'.format(kind))
+
+    with open(os.path.join(directory, 'encoder.pkl'), 'wb') as writer:
+        pkl.dump(encoder, writer)
+
+    return {'type': 'pickle'}
+
+
+class BundleEncoder(object):
+    """
+    TextEncoder equivalent over the memory-mapped arrays of a bundle, the pages of the vocabulary and the
+    embedding table are shared by every process that loads (or forks after loading) the same bundle.
+    """
+
+    def __init__(self, directory, spec):
+        self.spec = spec
+        self.vocabulary = np.load(os.path.join(directory, 'vocabulary.npy'), mmap_mode='r')
+        self.vocabulary_ids = np.load(os.path.join(directory, 'vocabulary_ids.npy'), mmap_mode='r')
+
+        if spec['type'] == 'embedding':
+            self.embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+        else:
+            self.embeddings = None
+
+    def encode(self, text):
+        if isinstance(text, list):
+            return [self.__encode_one(sentence) for sentence in text]
+
+        return self.__encode_one(text)
+
+    def lookup(self, tokens):
+        """
+        Vocabulary ids of tokens, -1 for the unknown ones.
+        """
+        if len(tokens) == 0 or len(self.vocabulary) == 0:
+            return np.full(len(tokens), -1, dtype=np.int64)
+
+        encoded = [token.encode('utf-8') for token in tokens]
+        queries = np.asarray(encoded, dtype=self.vocabulary.dtype)
+
+        positions = np.minimum(np.searchsorted(self.vocabulary, queries), len(self.vocabulary) - 1)
+
+        # tokens wider than the vocabulary are truncated by the cast, so they are never a match
+        fits = np.asarray([len(token) <= self.vocabulary.dtype.itemsize for token in encoded])
+        found = (self.vocabulary[positions] == queries) & fits
+
+        return np.where(found, self.vocabulary_ids[positions], -1)
+
+    def __encode_one(self, sentence):
+        tokens = sentence.split() if self.spec['unit'] == 'word' else list(sentence)
+        kind = self.spec['type']
+
+        if kind == 'word_index':
+            ids = self.lookup(tokens)
+            specials = self.spec['specials']
+
+            return [specials[token] if token in specials else (int(index) if index >= 0 else self.spec['unknown'])
+                    for token, index in zip(tokens, ids)]
+
+        if kind == 'char_index':
+            return [int(index) if index >= 0 else self.spec['unknown'] for index in self.lookup(tokens)]
+
+        if kind == 'one_hot':
+            vectors = []
+
+            for index in self.lookup(tokens):
+                vector = [0.0] * self.spec['size']
+
+                if index >= 0:
+                    vector[int(index)] = 1.0
+
+                vectors.append(vector)
+
+            return vectors
+
+        # the lookup order of flair's WordEmbeddings: the word, its lower case form, then the lower case form
+        # with its digits replaced by '#' and by '0', and a zero vector for a word that is still unknown
+        ids = self.lookup(tokens)
+
+        for normalize in (str.lower, lambda token: re.sub(r'\d', '#', token.lower()),
+                          lambda token: re.sub(r'\d', '0', token.lower())):
+            if np.all(ids >= 0):
+                break
+
+            ids = np.where(ids >= 0, ids, self.lookup([normalize(token) for token in tokens]))
+
+        return [self.embeddings[int(index)].tolist() if index >= 0 else [0.0] * self.embeddings.shape[1]
+                for index in ids]
+
+    def encoding_size(self):
+        if self.spec['type'] == 'embedding':
+            return self.embeddings.shape[1]
+
+        if self.spec['type'] == 'one_hot':
+            return self.spec['size']
+
+        return int(np.max(self.vocabulary_ids)) + 1 + (3 if self.spec['type'] == 'word_index' else 0)
+
+
+def save_bundle(directory, trainer, encoder, transformations=None, index2class=None):
+    """
+    Writes the inference bundle of a trained model into directory: bundle.json (model class and args, classes,
+    transformation and encoder specs), weights.pt and the .npy arrays of the encoder.
+    """
+    model = _reference(trainer.model_class(), 'model class')
+    model.update({'args': trainer.model_args(), 'weights': 'weights.pt'})
+
+    index2class = index2class if index2class is not None else trainer.index2class
+
+    manifest = {'format': BUNDLE_FORMAT,
+                'version': BUNDLE_VERSION,
+                'model': model,
+                'classes': [index2class[index] for index in sorted(index2class.keys())],
+                'transformations': [transformation_spec(transformation) for transformation in (transformations or [])]}
+
+    with atomic_directory(directory) as temp_dir:
+        trainer.save(os.path.join(temp_dir, manifest['model']['weights']))
+        manifest['encoder'] = encoder_spec(encoder, temp_dir)
+
+        with open(os.path.join(temp_dir, 'bundle.json'), 'w') as writer:
+            json.dump(manifest, writer, indent=2)
+
+    return directory
+
+
+class Predictor(object):
+
+    def __init__(self, model, encoder, transformations, classes):
+        self.model = model
+        self.encoder = encoder
+        self.transformations = transformations
+        self.classes = classes
+
+    def encode(self, texts):
+        for transformation in self.transformations:
+            texts = transformation(texts)
+
+        return self.encoder.encode(texts)
+
+    def predict_classes(self, texts):
+        return self.model.predict_classes(self.encode(texts))
+
+    def predict(self, texts):
+        return [self.classes[int(index)] for index in self.predict_classes(texts)]
+
+    def predict_probs(self, texts):
+        return self.model.predict_probs(self.encode(texts))
+
+
+def load_bundle(directory):
+    """
+    Predictor of a bundle written by save_bundle, the encoder arrays are memory-mapped instead of read.
+    """
+    with open(os.path.join(directory, 'bundle.json'), 'r') as reader:
+        manifest = json.load(reader)
+
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise ValueError('{} is not an inference bundle'.format(directory))
+
+    if manifest['version'] > BUNDLE_VERSION:
+        raise ValueError('bundle version {} is newer than the supported version {}'.format(manifest['version'],
+                                                                                           BUNDLE_VERSION))
+
+    model = _resolve(manifest['model'])(**manifest['model']['args'])
+    model.load_weights(os.path.join(directory, manifest['model']['weights']))
+
+    if manifest['encoder']['type'] == 'pickle':
+        with open(os.path.join(directory, 'encoder.pkl'), 'rb') as reader:
+            encoder = pkl.load(reader)
+    else:
+        encoder = BundleEncoder(directory, manifest['encoder'])
+
+    transformations = [build_transformation(spec) for spec in manifest['transformations']]
+
+    return Predictor(model, encoder, transformations, manifest['classes'])
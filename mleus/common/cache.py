@@ -0,0 +1,466 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import time
+import types
+import shutil
+import hashlib
+import functools
+import itertools
+import numpy as np
+from glob import glob
+
+from mleus.common.batcher import CollateWorkers
+from mleus.common.shards import ShardWriter, ShardedDataset
+from mleus.common.utils import atomic_directory
+
+
+# bump when the layout of a cache directory changes, older entries are then simply never matched
+CACHE_FORMAT = 1
+
+
+def value_bytes(value):
+    if isinstance(value, np.ndarray):
+        return value.dtype.str.encode('utf-8') + str(value.shape).encode('utf-8') + value.tobytes()
+
+    return repr(value).encode('utf-8')
+
+
+def row_key(value):
+    return int.from_bytes(hashlib.md5(value_bytes(value)).digest()[:8], 'little')
+
+
+# the TextEncoder loaders of pretrained embeddings, described by the name of their model instead of its weights
+_PRETRAINED_LOADERS = ('_WordEmbeddingLoader', '_BERTEmbedding', '_ELMoEmbedding')
+
+
+def _state(value):
+    """
+    Json description of the configuration of value (settings, vocabularies, arrays), free of memory addresses
+    so that it is the same in every run.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, bytes):
+        return repr(value)
+
+    if isinstance(value, np.ndarray):
+        return hashlib.md5(value_bytes(value)).hexdigest()
+
+    if isinstance(value, (list, tuple)):
+        return [_state(item) for item in value]
+
+    if isinstance(value, (set, frozenset)):
+        return sorted([_state(item) for item in value], key=repr)
+
+    if isinstance(value, dict):
+        return sorted([[_state(key), _state(item)] for key, item in value.items()], key=repr)
+
+    if isinstance(value, functools.partial) or hasattr(value, '__qualname__'):
+        return _describe(value)
+
+    if type(value).__name__ in _PRETRAINED_LOADERS:
+        return {'type': type(value).__name__, 'model_name': value.model_name}
+
+    if hasattr(value, '__dict__'):
+        return {'type': '{}.{}'.format(type(value).__module__, type(value).__qualname__), 'vars': _state(vars(value))}
+
+    raise ValueError('{}.{} cannot be fingerprinted for the cache, its configuration is not plain data'.format(
+        type(value).__module__, type(value).__qualname__))
+
+
+def _code_bytes(code):
+    parts = [code.co_code, repr(code.co_names).encode('utf-8')]
+
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            parts.append(_code_bytes(constant))
+        elif isinstance(constant, frozenset):
+            # the iteration order of a frozenset of strings changes with the hash seed
+            parts.append(repr(sorted(constant, key=repr)).encode('utf-8'))
+        else:
+            parts.append(repr(constant).encode('utf-8'))
+
+    return b''.join(parts)
+
+
+def code_hash(target):
+    """
+    Hash of the code of a function, or of the methods of a class and its bases, so that editing a body changes
+    the key of everything that runs it. Builtins have no code and hash to the same value.
+    """
+    fingerprint = hashlib.md5()
+
+    if isinstance(target, type):
+        for cls in target.__mro__:
+            if cls.__module__ == 'builtins':
+                continue
+
+            for name, attribute in sorted(vars(cls).items()):
+                # staticmethod / classmethod wrap their function, a property its getter
+                function = getattr(attribute, '__func__', getattr(attribute, 'fget', attribute))
+
+                if hasattr(function, '__code__'):
+                    fingerprint.update(name.encode('utf-8') + _code_bytes(function.__code__))
+    else:
+        function = getattr(target, '__func__', target)
+
+        if hasattr(function, '__code__'):
+            fingerprint.update(_code_bytes(function.__code__))
+
+    return fingerprint.hexdigest()
+
+
+def _describe(value):
+    if isinstance(value, functools.partial):
+        return 'partial({}, {}, {})'.format(_describe(value.func), repr(value.args), repr(sorted(value.keywords.items())))
+
+    if hasattr(value, '__qualname__') and hasattr(value, '__module__'):
+        return '{}.{}:{}'.format(value.__module__, value.__qualname__, code_hash(value))
+
+    state = hashlib.md5(json.dumps(_state(value)).encode('utf-8')).hexdigest()
+
+    return '{}.{}:{}:{}'.format(type(value).__module__, type(value).__qualname__, code_hash(type(value)), state)
+
+
+def pipeline_fingerprint(prepare):
+    description = json.dumps({'format': CACHE_FORMAT,
+                              'input': repr(prepare.data_axis['X']),
+                              'transformations': [_describe(transformation)
+                                                  for transformation in (prepare.transformations or [])],
+                              'encoder': _describe(prepare.encoder)})
+
+    return hashlib.md5(description.encode('utf-8')).hexdigest()
+
+
+class EncodedCache(object):
+    """
+    Disk cache of transformed + encoded inputs, shared by every experiment of a project under shared/cache.
+
+    Entries are keyed by the fingerprint of the pipeline (input axis, transformations, encoder) and hold the
+    encoded rows keyed by the content of their raw input, so a different split or subset of the same data
+    reuses the rows it has in common. Numeric rows are stored in memory-mapped shards. When max_size_mb is set,
+    the least recently used entries are deleted until the cache fits.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=None):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @classmethod
+    def for_research(cls, research_interface, **kwargs):
+        project_dir = os.path.dirname(os.path.dirname(research_interface))
+
+        return cls(os.path.join(project_dir, 'shared', 'cache'), **kwargs)
+
+    def preparer(self, prepare, batcher=None, num_workers=0):
+        directory = os.path.join(self.cache_dir, pipeline_fingerprint(prepare))
+        os.makedirs(directory, exist_ok=True)
+
+        marker = os.path.join(directory, 'pipeline.json')
+
+        if not os.path.exists(marker):
+            with open(marker, 'w') as writer:
+                json.dump({'format': CACHE_FORMAT, 'encoder': _describe(prepare.encoder)}, writer)
+
+        # the marker's mtime is the entry's last use
+        os.utime(marker, None)
+
+        cached_prepare = CachedPreparer(directory, prepare)
+
+        if batcher is not None:
+            workers = CollateWorkers(prepare, num_workers) if num_workers > 0 else None
+
+            try:
+                cached_prepare.warm(batcher, workers=workers)
+            finally:
+                if workers is not None:
+                    workers.close()
+
+        self.evict(keep=[directory])
+
+        return cached_prepare
+
+    def evict(self, keep=()):
+        if self.max_size_mb is None:
+            return []
+
+        entries = [(os.path.getmtime(os.path.join(directory, 'pipeline.json')), directory)
+                   for directory in glob(os.path.join(self.cache_dir, '*'))
+                   if os.path.exists(os.path.join(directory, 'pipeline.json'))]
+
+        sizes = {directory: EncodedCache.directory_size(directory) for _, directory in entries}
+        total, budget, evicted = sum(sizes.values()), self.max_size_mb * 1024 * 1024, []
+
+        for _, directory in sorted(entries):
+            if total <= budget:
+                break
+
+            if directory in keep:
+                continue
+
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= sizes[directory]
+            evicted.append(directory)
+
+        return evicted
+
+    @staticmethod
+    def directory_size(directory):
+        size = 0
+
+        for root, _, files in os.walk(directory):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+
+        return size
+
+
+class CachedPreparer(object):
+    """
+    Drop-in replacement of BatchPreparer that reads the encoded inputs from a cache entry, only the rows
+    missing from the cache are transformed and encoded (and not written back, call warm for that).
+    """
+
+    def __init__(self, directory, prepare):
+        self.directory = directory
+        self.prepare = prepare
+
+        self.__index = None
+
+    def __call__(self, current_batch):
+        return self.encode_inputs(current_batch), self.prepare.encode_labels(current_batch)
+
+    def encode_inputs(self, current_batch):
+        index = self.__load()
+        current_batch = list(current_batch)
+
+        keys = self.__keys(current_batch)
+        hits, positions = self.__find(keys)
+
+        x = [None] * len(current_batch)
+
+        for i in np.flatnonzero(hits):
+            x[i] = self.__row(index, positions[i])
+
+        misses = np.flatnonzero(~hits)
+
+        if len(misses) > 0:
+            for i, row in zip(misses, self.prepare.encode_inputs([current_batch[i] for i in misses])):
+                x[i] = row
+
+        if index['batch'] == 'ndarray':
+            return np.stack([np.asarray(row) for row in x]) if len(x) > 0 else np.zeros(0)
+
+        return x
+
+    def warm(self, batcher, targets=('train', 'valid', 'test'), workers=None, rows_per_shard=1000000):
+        self.__load()
+
+        seen = set()
+        encoded, reused = 0, 0
+
+        def misses():
+            nonlocal reused
+
+            for target in targets:
+                for current_batch in batcher.iter_batches(target=target):
+                    current_batch = list(current_batch)
+                    keys = self.__keys(current_batch)
+                    hits, _ = self.__find(keys)
+
+                    missing = []
+
+                    for key, item, hit in zip(keys.tolist(), current_batch, hits):
+                        if hit or key in seen:
+                            reused += 1
+                        else:
+                            seen.add(key)
+                            missing.append((key, item))
+
+                    if len(missing) > 0:
+                        yield missing
+
+            batcher.initialize()
+
+        missing_batches = misses()
+
+        if workers is not None:
+            batches_keys = []
+
+            def items_of(batches):
+                for missing in batches:
+                    batches_keys.append([key for key, _ in missing])
+
+                    yield [item for _, item in missing]
+
+            encoded_batches = ((batches_keys.pop(0), x) for x, _ in workers.imap(items_of(missing_batches)))
+        else:
+            encoded_batches = (([key for key, _ in missing], self.prepare.encode_inputs([item for _, item in missing]))
+                               for missing in missing_batches)
+
+        def laid_out(batches):
+            layout = None
+
+            for batch_keys, x in batches:
+                layout = CachedPreparer.__layout(x, previous=layout)
+
+                yield layout, batch_keys, x
+
+        # consecutive batches of the same layout share a segment, a batch that disagrees opens a new one
+        for layout_key, run in itertools.groupby(laid_out(encoded_batches), key=lambda item: sorted(item[0].items())):
+            layout = dict(layout_key)
+
+            segment_dir = os.path.join(self.directory, 'segments', 'segment-{}-{}'.format(time.time_ns(), os.getpid()))
+            temp_dir = os.path.join(self.directory, 'segments', '.tmp-{}-{}'.format(os.getpid(), time.time_ns()))
+
+            with atomic_directory(segment_dir, temp_dir=temp_dir):
+                writer = ShardWriter(temp_dir, fmt=layout['fmt'], rows_per_shard=rows_per_shard, dtype=layout['dtype'])
+                keys = []
+
+                for _, batch_keys, x in run:
+                    for row in x:
+                        writer.write(CachedPreparer.__shard_row(row, layout))
+
+                    keys.extend(batch_keys)
+                    encoded += len(batch_keys)
+
+                writer.close()
+
+                np.save(os.path.join(temp_dir, 'keys.npy'), np.asarray(keys, dtype=np.uint64))
+
+                with open(os.path.join(temp_dir, 'layout.json'), 'w') as layout_writer:
+                    json.dump(layout, layout_writer)
+
+        print('cache: {} rows encoded, {} rows reused'.format(encoded, reused))
+
+        self.__index = None
+        self.__load()
+
+        return encoded, reused
+
+    def __keys(self, current_batch):
+        axis = self.prepare.data_axis['X']
+
+        return np.asarray([row_key(item[axis]) for item in current_batch], dtype=np.uint64)
+
+    def __find(self, keys):
+        sorted_keys = self.__load()['keys']
+
+        if len(sorted_keys) == 0:
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+
+        return sorted_keys[positions] == keys, positions
+
+    def __row(self, index, position):
+        segment = index['segments'][index['segment_ids'][position]]
+        row = segment['dataset'][int(index['rows'][position])]
+
+        if segment['rows'] == 'list' and isinstance(row, np.ndarray):
+            return row.tolist()
+
+        if segment['rows'] == 'ndarray' and not isinstance(row, np.ndarray):
+            return np.asarray(row)
+
+        return row
+
+    def __load(self):
+        if self.__index is not None:
+            return self.__index
+
+        segments, keys, segment_ids, rows = [], [], [], []
+        batch = 'list'
+
+        for segment_dir in sorted(glob(os.path.join(self.directory, 'segments', 'segment-*'))):
+            with open(os.path.join(segment_dir, 'layout.json'), 'r') as reader:
+                layout = json.load(reader)
+
+            segment_keys = np.load(os.path.join(segment_dir, 'keys.npy'))
+
+            keys.append(segment_keys)
+            segment_ids.append(np.full(len(segment_keys), len(segments), dtype=np.int32))
+            rows.append(np.arange(len(segment_keys), dtype=np.int64))
+
+            segments.append({'dataset': ShardedDataset(segment_dir), 'rows': layout['rows']})
+            batch = layout['batch']
+
+        if len(keys) > 0:
+            keys, segment_ids, rows = np.concatenate(keys), np.concatenate(segment_ids), np.concatenate(rows)
+            order = np.argsort(keys, kind='stable')
+            keys, segment_ids, rows = keys[order], segment_ids[order], rows[order]
+        else:
+            keys = np.zeros(0, dtype=np.uint64)
+
+        self.__index = {'segments': segments, 'keys': keys, 'segment_ids': segment_ids, 'rows': rows,
+                        'batch': batch}
+
+        return self.__index
+
+    @staticmethod
+    def __layout(x, previous=None):
+        layout = {'batch': 'ndarray' if isinstance(x, np.ndarray) else 'list',
+                  'rows': 'ndarray' if len(x) > 0 and isinstance(x[0], np.ndarray) else 'list'}
+
+        try:
+            rows = [np.asarray(row) for row in x]
+        except ValueError:
+            rows = None
+
+        # empty rows (e.g. an empty sentence) tell neither the dtype nor the number of dimensions
+        filled = [row for row in rows if row.size > 0] if rows is not None else []
+
+        if rows is not None and len(filled) == 0 and previous is not None:
+            return previous
+
+        # rows that are not numeric arrays of one number of dimensions (e.g. nested ragged lists) fall back to json
+        if len(filled) == 0 or any(row.dtype.kind not in 'biuf' for row in filled) \
+                or len(set(row.ndim for row in filled)) > 1:
+            layout.update({'fmt': 'json', 'dtype': 'float32', 'ndim': None})
+        else:
+            dtype = functools.reduce(np.promote_types, set(row.dtype for row in filled))
+            layout.update({'fmt': 'tensor', 'dtype': dtype.str, 'ndim': filled[0].ndim})
+
+        return layout
+
+    @staticmethod
+    def __shard_row(row, layout):
+        if layout['fmt'] == 'json':
+            return row.tolist() if isinstance(row, np.ndarray) else row
+
+        row = np.asarray(row)
+
+        if row.size == 0:
+            return np.zeros((0,) * layout['ndim'], dtype=layout['dtype'])
+
+        return row
+
+    def __getstate__(self):
+        # memory maps are reopened in the process that unpickles the preparer instead of being copied
+        state = self.__dict__.copy()
+        state['_CachedPreparer__index'] = None
+
+        return state
@@ -0,0 +1,130 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import time
+import shutil
+import threading
+import copy as cp
+from glob import glob
+
+from mleus.common.utils import atomic_directory
+
+
+class Checkpointer(object):
+    """
+    Saves the model weights and the training position every every_steps steps and/or every_minutes minutes,
+    keeping the last keep_last checkpoints under directory/step-<step>/.
+
+    The model is copied in memory on the training thread and written to disk by a background thread,
+    so fit_batch only waits for the copy (or for the previous write, if it is still running).
+    Checkpoints saved under a name (e.g. 'best') are never rotated out.
+    """
+
+    def __init__(self, directory, every_steps=None, every_minutes=None, keep_last=3):
+        self.directory = directory
+        self.every_steps = every_steps
+        self.every_minutes = every_minutes
+        self.keep_last = keep_last
+
+        self.__last_time = time.monotonic()
+        self.__writer = None
+        self.__error = None
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def maybe_save(self, trainer, state):
+        due = False
+
+        if self.every_steps is not None and state['step'] > 0 and state['step'] % self.every_steps == 0:
+            due = True
+
+        if self.every_minutes is not None and time.monotonic() - self.__last_time >= 60.0 * self.every_minutes:
+            due = True
+
+        if due:
+            self.save(trainer, state)
+
+        return due
+
+    def save(self, trainer, state, name=None):
+        self.wait()
+
+        self.__last_time = time.monotonic()
+
+        snapshot = cp.deepcopy(trainer.model)
+        state = cp.deepcopy(state)
+
+        self.__writer = threading.Thread(target=self.__write, args=(snapshot, state, name), daemon=True)
+        self.__writer.start()
+
+    def wait(self):
+        if self.__writer is not None:
+            self.__writer.join()
+            self.__writer = None
+
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+
+            raise error
+
+    def close(self):
+        self.wait()
+
+    def promote(self, weights_path, state, name):
+        """
+        Turns weights already saved by trainer.save (e.g. a validation snapshot) into the checkpoint name.
+        """
+        self.wait()
+
+        self.__commit(name, lambda path: os.replace(weights_path, path), state)
+
+    def __write(self, snapshot, state, name):
+        try:
+            self.__commit(name or 'step-{:09d}'.format(state['step']), snapshot.save_weights, state)
+
+            for old_checkpoint in Checkpointer.list(self.directory)[:-self.keep_last]:
+                shutil.rmtree(old_checkpoint)
+        except Exception as error:
+            self.__error = error
+
+    def __commit(self, name, write_weights, state):
+        with atomic_directory(os.path.join(self.directory, name)) as temp_dir:
+            write_weights(os.path.join(temp_dir, 'weights.pt'))
+
+            with open(os.path.join(temp_dir, 'state.json'), 'w') as writer:
+                json.dump(state, writer)
+
+    @staticmethod
+    def list(directory):
+        return sorted([path for path in glob(os.path.join(directory, 'step-*')) if not path.endswith('.tmp')])
+
+    @staticmethod
+    def latest(directory):
+        checkpoints = Checkpointer.list(directory)
+
+        return checkpoints[-1] if len(checkpoints) > 0 else None
+
+    @staticmethod
+    def restore(checkpoint_dir, trainer, batcher=None):
+        with open(os.path.join(checkpoint_dir, 'state.json'), 'r') as reader:
+            state = json.load(reader)
+
+        trainer.load(os.path.join(checkpoint_dir, 'weights.pt'))
+
+        if batcher is not None and state.get('batcher') is not None:
+            batcher.load_state_dict(state['batcher'])
+
+        return state
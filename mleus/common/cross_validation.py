@@ -0,0 +1,126 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import multiprocessing
+import numpy as np
+
+from mleus.common.batcher import Batcher
+from mleus.common.evaluator import SupervisedEvaluator
+from mleus.common.experiment import BatchPreparer
+from mleus.common.utils import process_context
+
+
+# set in the parent before the pool forks, so the workers share the data pages instead of receiving copies
+_SHARED = {}
+
+
+def kfold_indexes(size, k=5, seed=20):
+    permutation = np.random.RandomState(seed).permutation(size)
+    folds = np.array_split(permutation, k)
+
+    return [(np.concatenate(folds[:i] + folds[i + 1:]), folds[i]) for i in range(k)]
+
+
+class KFoldCrossValidation(object):
+    """
+    Runs k folds of train + validate concurrently in a process pool over the same, non-copied data.
+
+    setup_fn(fold) is called inside the worker and returns (trainer, encoder, transformations, class2index),
+    so every fold builds its own fresh model. The per-fold confusion matrices are summed into one report.
+    """
+
+    def __init__(self, data, data_axis, k=5, epochs=1, batch_size=64, seed=20, workers=None):
+        self.data = data
+        self.data_axis = data_axis
+        self.k = k
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.seed = seed
+        self.workers = workers if workers is not None else min(k, multiprocessing.cpu_count())
+
+        self.folds = kfold_indexes(len(self.data), k=self.k, seed=self.seed)
+        self.folds_conf_matrices = None
+        self.complete_conf_matrix = None
+
+    def run(self, setup_fn):
+        _SHARED.update(data=self.data,
+                       data_axis=self.data_axis,
+                       folds=self.folds,
+                       epochs=self.epochs,
+                       batch_size=self.batch_size,
+                       seed=self.seed,
+                       setup_fn=setup_fn)
+
+        try:
+            if self.workers <= 1:
+                self.folds_conf_matrices = [_run_fold(fold) for fold in range(self.k)]
+            else:
+                context = process_context()
+
+                pool = context.Pool(self.workers, initializer=_init_worker, initargs=(dict(_SHARED),))
+
+                try:
+                    self.folds_conf_matrices = pool.map(_run_fold, range(self.k))
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _SHARED.clear()
+
+        # a fold without any validation batch has no confusion matrix
+        conf_matrices = [conf_matrix for conf_matrix in self.folds_conf_matrices if conf_matrix is not None]
+
+        if len(conf_matrices) == 0:
+            raise ValueError('no fold was evaluated, every validation fold is empty')
+
+        self.complete_conf_matrix = sum(conf_matrices)
+
+        return self.complete_conf_matrix
+
+    def show_evaluation(self, index2class, precision_recall_fscore=True, conf_matrix=True, accuracy=True,
+                        stdout='stdout', pickle_path=None):
+        SupervisedEvaluator.evaluate_batches(self.complete_conf_matrix,
+                                             precision_recall_fscore,
+                                             conf_matrix,
+                                             accuracy,
+                                             index2class,
+                                             stdout,
+                                             pickle_path)
+
+
+def _init_worker(shared):
+    _SHARED.update(shared)
+
+
+def _run_fold(fold):
+    train_indexes, valid_indexes = _SHARED['folds'][fold]
+
+    batcher = Batcher(_SHARED['data'],
+                      batch_size=_SHARED['batch_size'],
+                      zero_copy=True,
+                      seed=_SHARED['seed'],
+                      split_indexes=(train_indexes, valid_indexes, []))
+
+    trainer, encoder, transformations, class2index = _SHARED['setup_fn'](fold)
+    prepare = BatchPreparer(encoder, _SHARED['data_axis'], transformations=transformations, class2index=class2index)
+
+    for epoch in range(_SHARED['epochs']):
+        batcher.set_epoch(epoch)
+
+        for x_train, y_train in batcher.iter_batches(target='train', collate_fn=prepare):
+            trainer.fit_batch(x_train, y_train)
+
+    for x_valid, y_valid in batcher.iter_batches(target='valid', collate_fn=prepare):
+        trainer.eval_batch(x_valid, y_valid)
+
+    return trainer.complete_conf_matrix
@@ -17,6 +17,8 @@ from terminaltables import AsciiTable
 
 
 class SupervisedEvaluator:
+    # the keys of compute_metrics
+    metric_names = ('accuracy', 'average_precision', 'average_recall', 'average_fscore')
 
     @staticmethod
     def evaluate_batches(complete_matrix,
@@ -164,6 +166,23 @@ class SupervisedEvaluator:
         with open(pickle_path, 'wb') as writer:
             pkl.dump(results, writer)
 
+    @staticmethod
+    def compute_metrics(complete_matrix):
+        # the results of evaluate_batches, without writing the report
+        tp = np.diag(complete_matrix)
+        fp = np.sum(complete_matrix, axis=1) - tp
+        fn = np.sum(complete_matrix, axis=0) - tp
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = tp / (tp + fp)
+            recall = tp / (tp + fn)
+            fscore = 2.0 * ((precision * recall) / (precision + recall))
+
+        return {'accuracy': round(float(np.sum(tp)) / float(np.sum(complete_matrix)), 3),
+                'average_precision': float(np.mean(precision)),
+                'average_recall': float(np.mean(recall)),
+                'average_fscore': float(np.mean(fscore))}
+
     @staticmethod
     def get_confusion_matrix(prediction, target, classes):
         prediction = np.asarray(prediction)
@@ -22,9 +22,72 @@ import matplotlib
 matplotlib.use('Agg')
 import pandas as pd
 import pickle as pkl
-from glob import glob
 import matplotlib.pyplot as plt
 
+from mleus.common.batcher import CollateWorkers
+from mleus.common.metrics import ConsoleSink, MultiSink, NpySink, StageTimer
+from mleus.common.checkpoint import Checkpointer
+from mleus.common.evaluator import SupervisedEvaluator
+from mleus.common.validation import BackgroundValidator
+from mleus.common.index import COLUMNS, ExperimentIndex
+from mleus.common.results import ResultStore
+from mleus.common.bundle import save_bundle, transformation_spec
+
+
+class BatchPreparer(object):
+
+    def __init__(self, encoder, data_axis, transformations=None, class2index=None):
+        self.encoder = encoder
+        self.data_axis = data_axis
+        self.transformations = transformations
+        self.class2index = class2index
+
+        # a StageTimer, set by SupervisedExperiment.run when the batches are prepared in its own process
+        self.timer = None
+
+    def __call__(self, current_batch):
+        return self.encode_inputs(current_batch), self.encode_labels(current_batch)
+
+    def encode_inputs(self, current_batch):
+        X = [item[self.data_axis['X']] for item in current_batch]
+
+        if self.timer is None:
+            return self.encoder.encode(self.__transform(X))
+
+        with self.timer.stage('transformations'):
+            X = self.__transform(X)
+
+        with self.timer.stage('encode'):
+            return self.encoder.encode(X)
+
+    def __transform(self, X):
+        if self.transformations is not None:
+            for transformation in self.transformations:
+                X = transformation(X)
+
+        return X
+
+    def encode_labels(self, current_batch):
+        Y = [item[self.data_axis['Y']] for item in current_batch]
+
+        if self.class2index is None:
+            return Y
+
+        return [self.class2index[item] for item in Y]
+
+
+def _count_tokens(x):
+    # the length of the encoded rows, i.e. words or characters depending on the encoder
+    tokens = 0
+
+    for row in x:
+        try:
+            tokens += len(row)
+        except TypeError:
+            tokens += 1
+
+    return tokens
+
 
 class SupervisedExperiment(object):
 
@@ -57,8 +120,30 @@ class SupervisedExperiment(object):
         self.pickle_file_path = None
         self.info_file_path = None
         self.learning_curve_image = None
+        self.metrics_dir = None
+        self.timings_file_path = None
+        self.results_dir = None
+        self.skipped = False
 
-    def create(self, research_interface):
+    def locate(self, research_interface, suffix=None):
+        project_dir = os.path.dirname(os.path.dirname(research_interface))
+        research_name = os.path.splitext(os.path.basename(research_interface))[0]
+
+        experiment_name = 'nclasses({})ninput({})model({})epochs({})batchsize({})device({})'.format(
+            self.number_classes,
+            self.input_length,
+            self.model_name,
+            self.epochs,
+            self.batch_size,
+            self.device
+        )
+
+        if suffix is not None:
+            experiment_name += '_{}'.format(suffix)
+
+        return os.path.join(project_dir, 'shared', 'experiments', research_name, experiment_name)
+
+    def create(self, research_interface, if_exists=None, suffix=None):
         project_dir = os.path.dirname(os.path.dirname(research_interface))
 
         if not os.path.exists(os.path.join(project_dir, 'shared')):
@@ -75,20 +160,26 @@ class SupervisedExperiment(object):
         if not os.path.exists(os.path.join(experiment_resources, experiment_name)):
             os.mkdir(os.path.join(experiment_resources, experiment_name))
         
-        experiment_resources = os.path.join(experiment_resources, experiment_name)
-        
-        experiment_name = 'nclasses({})ninput({})model({})epochs({})batchsize({})device({})'.format(
-            self.number_classes,
-            self.input_length,
-            self.model_name,
-            self.epochs,
-            self.batch_size,
-            self.device
-        )
+        self.experiment_dir = self.locate(research_interface, suffix=suffix)
+        self.skipped = False
+
+        if os.path.exists(self.experiment_dir) and if_exists is not None:
+            if if_exists == 'skip':
+                self.skipped = True
+
+                return self.experiment_dir
+            elif if_exists == 'overwrite':
+                shutil.rmtree(self.experiment_dir)
+            elif if_exists == 'suffix':
+                base_dir, counter = self.experiment_dir, 2
 
-        self.experiment_dir = os.path.join(experiment_resources, experiment_name)
+                while os.path.exists('{}_{}'.format(base_dir, counter)):
+                    counter += 1
 
-        if os.path.exists(self.experiment_dir):
+                self.experiment_dir = '{}_{}'.format(base_dir, counter)
+            else:
+                raise ValueError('if_exists must be one of skip, overwrite or suffix, got {}'.format(if_exists))
+        elif os.path.exists(self.experiment_dir):
             print('this experiment setup is already done before, do you want to repeat it? [yes/no]')
             answer = str(input())
 
@@ -101,7 +192,7 @@ class SupervisedExperiment(object):
                 else:
                     print('write a suffix for the new experiment name')
                     answer = str(input())
-                    self.experiment_dir = os.path.join(experiment_resources, experiment_name + '_{}'.format(answer))
+                    self.experiment_dir = self.experiment_dir + '_{}'.format(answer)
             else:
                 print('experiment will be terminated')
                 exit()
@@ -119,6 +210,9 @@ class SupervisedExperiment(object):
         self.pickle_file_path = os.path.join(self.experiment_dir, 'eval.pkl')
         self.info_file_path = os.path.join(self.experiment_dir, 'info.txt')
         self.learning_curve_image = os.path.join(self.experiment_dir, 'learning_curve.png')
+        self.metrics_dir = os.path.join(self.experiment_dir, 'metrics')
+        self.timings_file_path = os.path.join(self.experiment_dir, 'timings.json')
+        self.results_dir = os.path.join(project_dir, 'shared', 'results')
 
         with codecs.open(self.info_file_path, 'w', encoding='utf-8') as writer:
             writer.write('author: {}\n'.format(self.author_name))
@@ -149,87 +243,343 @@ class SupervisedExperiment(object):
             transformations=None, 
             class2index=None, 
             index2class=None, 
-            with_pipeline_save=False):
+            with_pipeline_save=False,
+            prefetch=0,
+            num_workers=0,
+            metrics=None,
+            checkpoint_every_steps=None,
+            checkpoint_every_minutes=None,
+            keep_checkpoints=3,
+            resume_from=None,
+            final_checkpoint=False,
+            cache=None,
+            validate_every_steps=None,
+            validate_every_epochs=None,
+            early_stopping_metric='average_fscore',
+            patience=None,
+            min_delta=0.0,
+            background_validation=False,
+            force=False):
+        if self.skipped:
+            # create() found the experiment directory and left it as it is
+            pickle_file_path = os.path.join(self.experiment_dir, 'eval.pkl')
+
+            if not os.path.exists(pickle_file_path):
+                raise ValueError('{} was skipped but holds no eval.pkl, create it with if_exists="overwrite" '
+                                 'to run it again'.format(self.experiment_dir))
+
+            print('skipped, the results are in {}'.format(self.experiment_dir))
+
+            with open(pickle_file_path, 'rb') as reader:
+                return pkl.load(reader)
+
+        prepare = BatchPreparer(encoder, data_axis, transformations=transformations, class2index=class2index)
 
-        try:
-            epochs_average_losses = []
+        if with_pipeline_save:
+            # a transformation the bundle cannot describe fails here rather than after the training
+            for transformation in transformations or []:
+                transformation_spec(transformation)
+
+        # a resumed run continues another one, it is neither looked up nor stored
+        if resume_from is None and self.results_dir is not None:
+            results_store = ResultStore(self.results_dir)
+            results_key = ResultStore.key(self, trainer, batcher, prepare,
+                                          settings={'validate_every_steps': validate_every_steps,
+                                                    'validate_every_epochs': validate_every_epochs,
+                                                    'early_stopping_metric': early_stopping_metric,
+                                                    'patience': patience,
+                                                    'min_delta': min_delta,
+                                                    'background_validation': background_validation,
+                                                    'final_checkpoint': final_checkpoint})
+        else:
+            results_store, results_key = None, None
+
+        if results_key is not None and not force:
+            stored = results_store.lookup(results_key)
+
+            if stored is not None:
+                print('same run as {}, reusing its results (pass force=True to run it again)'.format(
+                    stored['experiment_dir']))
+
+                return ResultStore.reuse(stored, self)
+
+        # the npy store is always kept in the experiment dir, metrics (console by default) is an extra sink
+        metrics = MultiSink([NpySink(self.metrics_dir), metrics if metrics is not None else ConsoleSink()])
+
+        timer = StageTimer()
+
+        if num_workers <= 0:
+            prepare.timer = timer
+
+        if cache is not None:
+            # every row is transformed + encoded once here, the epochs (and later experiments) read the cache
+            prepare = cache.preparer(prepare, batcher=batcher, num_workers=num_workers)
+
+        periodic_validation = validate_every_steps is not None or validate_every_epochs is not None
+
+        if (patience is not None or background_validation) and not periodic_validation:
+            raise ValueError('early stopping and background validation need validate_every_steps or '
+                             'validate_every_epochs')
+
+        if periodic_validation and early_stopping_metric not in SupervisedEvaluator.metric_names:
+            raise ValueError('early_stopping_metric must be one of {}, got {}'.format(
+                ', '.join(SupervisedEvaluator.metric_names), early_stopping_metric))
+
+        if background_validation:
+            # started before the collate workers, so the evaluator process does not inherit their pool
+            validator = BackgroundValidator(trainer, batcher, prepare, os.path.join(self.experiment_dir, 'snapshots'))
+        else:
+            validator = None
+
+        if num_workers > 0:
+            # transformations + encoding run in worker processes, batches still arrive in order
+            workers = CollateWorkers(prepare, num_workers, max_in_flight=max(prefetch, 2 * num_workers))
+            prepare = None
+        else:
+            workers = None
+
+        if (checkpoint_every_steps is not None or checkpoint_every_minutes is not None or final_checkpoint
+                or periodic_validation):
+            checkpointer = Checkpointer(os.path.join(self.experiment_dir, 'checkpoints'),
+                                        every_steps=checkpoint_every_steps,
+                                        every_minutes=checkpoint_every_minutes,
+                                        keep_last=keep_checkpoints)
+        else:
+            checkpointer = None
+
+        start_epoch, step, epoch_step = 1, 0, 0
+        epoch = start_epoch
+
+        if resume_from is not None:
+            if os.path.basename(os.path.normpath(resume_from)) == 'checkpoints':
+                resume_from = Checkpointer.latest(resume_from)
+
+            resumed_state = Checkpointer.restore(resume_from, trainer, batcher)
+            start_epoch, step = resumed_state['epoch'], resumed_state['step']
+
+            if resumed_state.get('batcher') is not None:
+                epoch_step = resumed_state['batcher']['step']
+
+            print('resuming from epoch: {}\tstep: {}'.format(start_epoch, step))
+
+        def checkpoint_state():
+            if hasattr(batcher, 'state_dict'):
+                # with prefetching the batcher runs ahead, so the position is the number of consumed batches
+                batcher_state = batcher.state_dict()
+                batcher_state['step'] = epoch_step
+            else:
+                batcher_state = None
 
-            for epoch in range(1, self.epochs + 1):
-                batches_losses = []
-                cnter = 0
+            return {'epoch': epoch, 'step': step, 'batcher': batcher_state, 'early_stopping': early_stopping_state()}
+
+        def early_stopping_state():
+            return {name: early_stopping[name] for name in ('best', 'best_step', 'stale')}
+
+        early_stopping = {'best': float('-inf'), 'best_step': None, 'stale': 0, 'stopped': False}
+        interrupted = False
+
+        if resume_from is not None and resumed_state.get('early_stopping') is not None:
+            # the best score and the patience carry over, so checkpoints/best is only replaced by a better model
+            early_stopping.update(resumed_state['early_stopping'])
+
+        def validate():
+            if validator is not None:
+                # the snapshot is evaluated in the validator process, the results come back through poll
+                validator.submit(trainer, checkpoint_state())
+
+                return
+
+            # the periodic validations use their own confusion matrix, the final one starts from scratch
+            trainer.complete_conf_matrix = None
+
+            with timer.stage('validation'):
+                for x_valid, y_valid in batcher.iter_batches(target='valid', prefetch=prefetch, collate_fn=prepare,
+                                                             workers=workers, timer=timer):
+                    trainer.eval_batch(x_valid, y_valid)
 
-                while batcher.hasnext(target='train'):
-                    current_batch = batcher.nextbatch(target='train')
-                    X = [item[data_axis['X']] for item in current_batch]
-                    Y = [item[data_axis['Y']] for item in current_batch]
+            if trainer.complete_conf_matrix is None:
+                return
 
-                    if transformations is not None:
-                        for transformation in transformations:
-                            X = transformation(X)
+            results = SupervisedEvaluator.compute_metrics(trainer.complete_conf_matrix)
+            trainer.complete_conf_matrix = None
 
-                    x_train = encoder.encode(X)
+            record_validation(results, checkpoint_state())
+
+        def record_validation(results, state, snapshot=None):
+            for name, value in results.items():
+                metrics.log('valid_{}'.format(name), value, state['step'])
+
+            score = results.get(early_stopping_metric, float('nan'))
+            print('validation at step: {}\t{}: {}'.format(state['step'], early_stopping_metric, score))
+
+            # nan (e.g. a class that is never predicted) is never an improvement
+            if score > early_stopping['best'] + min_delta:
+                early_stopping.update({'best': score, 'best_step': state['step'], 'stale': 0})
+
+                state[early_stopping_metric] = score
+                state['early_stopping'] = early_stopping_state()
+
+                if snapshot is None:
+                    checkpointer.save(trainer, state, name='best')
+                else:
+                    checkpointer.promote(snapshot, state, name='best')
+            else:
+                early_stopping['stale'] += 1
 
-                    if class2index is None:
-                        y_train = Y
-                    else:
-                        y_train = [class2index[item] for item in Y]
+                if snapshot is not None:
+                    os.remove(snapshot)
 
-                    batch_loss = trainer.fit_batch(x_train, y_train)
+            if patience is not None and early_stopping['stale'] >= patience:
+                early_stopping['stopped'] = True
+
+        try:
+            for epoch in range(start_epoch, self.epochs + 1):
+                batches_losses = []
+                batch_start = time.perf_counter()
+
+                if resume_from is None or epoch != start_epoch:
+                    batcher.set_epoch(epoch - 1)
+                    epoch_step = 0
+
+                epoch_start = time.perf_counter()
+                train_batches = batcher.iter_batches(target='train', prefetch=prefetch, collate_fn=prepare,
+                                                     workers=workers, timer=timer)
+
+                for x_train, y_train in timer.iterate(train_batches, 'wait_batch'):
+                    with timer.stage('fit_batch'):
+                        batch_loss = trainer.fit_batch(x_train, y_train)
+
+                    timer.count('train_samples', len(y_train))
+                    timer.count('train_tokens', _count_tokens(x_train))
 
                     batches_losses.append(batch_loss)
 
-                    print("Epoch: {}/{}\tBatch: {}/{}\tLoss: {}".format(epoch,
-                                                                        self.epochs,
-                                                                        cnter,
-                                                                        batcher.total_batches(target='train'),
-                                                                        batch_loss))
-                    cnter += 1
+                    batch_end = time.perf_counter()
+                    metrics.log('train_loss', batch_loss, step)
+                    metrics.log('batch_seconds', batch_end - batch_start, step)
+                    batch_start = batch_end
+
+                    step += 1
+                    epoch_step += 1
 
-                print("\nEpoch: {}/{}\tAverageLoss: {}\n".format(epoch, self.epochs,
-                                                                 sum(batches_losses) / float(len(batches_losses))))
-                epochs_average_losses.append(sum(batches_losses) / float(len(batches_losses)))
+                    if validate_every_steps is not None and step % validate_every_steps == 0:
+                        validate()
 
-                time.sleep(3)
+                    if validator is not None:
+                        for job in validator.poll():
+                            record_validation(job['results'], job['state'], job['snapshot'])
+
+                    # after the validation of the step, so that the checkpoint holds its early stopping state
+                    if checkpointer is not None:
+                        checkpointer.maybe_save(trainer, checkpoint_state())
+
+                    if early_stopping['stopped']:
+                        break
+
+                train_batches.close()
+
+                if len(batches_losses) > 0:
+                    print("\nEpoch: {}/{}\tAverageLoss: {}\n".format(epoch, self.epochs,
+                                                                     sum(batches_losses) / float(len(batches_losses))))
+                    metrics.log('epoch_loss', sum(batches_losses) / float(len(batches_losses)), epoch)
+
+                timer.record('train', time.perf_counter() - epoch_start)
+
+                if not early_stopping['stopped'] and validate_every_epochs is not None \
+                        and epoch % validate_every_epochs == 0:
+                    validate()
 
                 batcher.initialize()
                 # batcher.shuffle_me('train')
+
+                if early_stopping['stopped']:
+                    print('early stopping at epoch: {}\tstep: {}'.format(epoch, step))
+
+                    break
         except KeyboardInterrupt:
+            interrupted = True
+
             print('End training at epoch: {}'.format(epoch))
             print('Begin evaluating the model on the validation data')
 
+        if validator is not None:
+            stopped = early_stopping['stopped']
+
+            # the validations still running are waited for, they can still become the best checkpoint
+            for job in validator.close():
+                record_validation(job['results'], job['state'], job['snapshot'])
+
+            early_stopping['stopped'] = stopped
+
+            shutil.rmtree(validator.snapshot_dir, ignore_errors=True)
+
+        if checkpointer is not None:
+            if final_checkpoint:
+                checkpointer.save(trainer, checkpoint_state())
+
+            checkpointer.close()
+
+        best_dir = os.path.join(self.experiment_dir, 'checkpoints', 'best')
+
+        # a resumed run that never improved on the run it resumed from keeps the best model of that run
+        if resume_from is not None and not os.path.exists(best_dir):
+            best_dir = os.path.join(os.path.dirname(os.path.normpath(resume_from)), 'best')
+
+        if early_stopping['best_step'] is not None and os.path.exists(best_dir):
+            # the final evaluation and the saved model are the ones of the best validation
+            Checkpointer.restore(best_dir, trainer)
+
+            with codecs.open(self.info_file_path, 'a', encoding='utf-8') as writer:
+                writer.write('\t best {} at step: {} ({})\n'.format(early_stopping_metric, early_stopping['best_step'],
+                                                                    early_stopping['best']))
+
+                if early_stopping['stopped']:
+                    writer.write('\t early stopped at step: {}\n'.format(step))
+
+        metrics.flush()
+
+        epochs_average_losses = NpySink.read(self.metrics_dir, 'epoch_loss')[:, 1]
+
         plt.plot(range(len(epochs_average_losses)), epochs_average_losses)
         plt.xlabel('epochs')
         plt.ylabel('loss value')
         plt.title('learning curve during the training phase')
         plt.savefig(self.learning_curve_image)
 
+        valid_start = time.perf_counter()
+
         try:
             cnter = 0
+            valid_batches = batcher.iter_batches(target='valid', prefetch=prefetch, collate_fn=prepare,
+                                                 workers=workers, timer=timer)
 
-            while batcher.hasnext(target='valid'):
-                current_batch = batcher.nextbatch(target='valid')
-                X = [item[data_axis['X']] for item in current_batch]
-                Y = [item[data_axis['Y']] for item in current_batch]
+            for x_valid, y_valid in timer.iterate(valid_batches, 'wait_batch'):
+                with timer.stage('eval_batch'):
+                    trainer.eval_batch(x_valid, y_valid)
 
-                if transformations is not None:
-                    for transformation in transformations:
-                        X = transformation(X)
+                timer.count('valid_samples', len(y_valid))
+                timer.count('valid_tokens', _count_tokens(x_valid))
 
-                x_valid = encoder.encode(X)
-
-                if class2index is None:
-                    y_valid = Y
-                else:
-                    y_valid = [class2index[item] for item in Y]
-
-                trainer.eval_batch(x_valid, y_valid)
-
-                print("Batch: {}/{}".format(cnter, batcher.total_batches('valid')))
                 cnter += 1
         except KeyboardInterrupt:
+            interrupted = True
+
             print('End validating at batch: {}'.format(cnter))
             print('Begin writing results and evaluations')
 
+        timer.record('valid', time.perf_counter() - valid_start)
+
+        if workers is not None:
+            workers.close()
+
+        metrics.close()
+
+        timings = timer.save(self.timings_file_path)
+
+        for stage, stats in sorted(timings['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+            print('{}: p50 {:0.2f} ms\tp95 {:0.2f} ms\tshare {:0.1%}'.format(stage, stats['p50_ms'], stats['p95_ms'],
+                                                                           stats['share']))
+
         trainer.show_evaluation(precision_recall_fscore=True,
                                 conf_matrix=True,
                                 accuracy=True,
@@ -257,8 +607,19 @@ class SupervisedExperiment(object):
                                 class2index=class2index, 
                                 index2class=index2class)
 
+            self.save_bundle(trainer, encoder, transformations, index2class)
+
+        with open(self.pickle_file_path, 'rb') as reader:
+            results = pkl.load(reader)
+
+        # an interrupted run is not a finished one
+        if results_key is not None and not interrupted:
+            results_store.store(results_key, self.experiment_dir)
+
         print('\nexperiment location: {}\n'.format(self.experiment_dir))
 
+        return results
+
     def save_misc(self, fmt='json', **kwargs):
         for varname, value in kwargs.items():
             filepath = os.path.join(self.saved_data_dir, varname)
@@ -289,6 +650,18 @@ class SupervisedExperiment(object):
                 with open(filepath + '.pkl', 'wb') as writer:
                     pkl.dump(value, writer)
 
+    def save_bundle(self, trainer, encoder, transformations=None, index2class=None):
+        self.bundle_dir = os.path.join(self.experiment_dir, 'bundle')
+
+        try:
+            return save_bundle(self.bundle_dir, trainer, encoder, transformations=transformations,
+                               index2class=index2class)
+        except ValueError as error:
+            # the pickled pipeline is still saved, only the fast-loading bundle is skipped
+            print('inference bundle not saved: {}'.format(error))
+
+            return None
+
 
 class SupervisedExperimentSummarizer(object):
 
@@ -296,36 +669,31 @@ class SupervisedExperimentSummarizer(object):
         self.experiments_location = experiments_location
         self.output_location = os.path.dirname(self.experiments_location)
         self.project_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(self.experiments_location)))).upper()
+        self.research_name = os.path.basename(os.path.normpath(self.experiments_location))
+
+        # shared by all the researches of the project, in shared/experiments
+        self.index = ExperimentIndex(self.output_location)
+
+    def query(self, **kwargs):
+        return self.index.query(research=self.research_name, **kwargs)
 
-    def run(self):
+    def run(self, num_workers=None):
         summary_file = os.path.join(self.experiments_location, 'summary.txt')
         sheet_file = os.path.join(self.experiments_location, 'experiments.xlsx')
         experiments_md = os.path.join(self.experiments_location, 'experiments.md')
 
-        experiments_data = []
+        # only the new and changed experiments are read, everything below comes from the index
+        self.index.update(num_workers=num_workers)
+        experiments_data = self.query(columns=COLUMNS, order_by='name')
 
         with codecs.open(summary_file, 'w', encoding='utf-8') as writer:
-            for i, experiment_dir in enumerate(glob(self.experiments_location + '/*/')):
-                if os.path.basename(os.path.dirname(experiment_dir)) == '__pycache__':
-                    continue
-
-                experiment_name = os.path.basename(os.path.dirname(experiment_dir))
-                experiment_info_file = os.path.join(experiment_dir, 'info.txt')
-                experiment_eval_file = os.path.join(experiment_dir, 'eval.log')
-                experiment_results_file = os.path.join(experiment_dir, 'eval.pkl')
-                experiment_learning_curve_image = os.path.join(experiment_dir, 'learning_curve.png')
-
-                with codecs.open(experiment_info_file, 'r', encoding='utf-8') as reader:
-                    writer.write('########### Experiment #{} ###########\n\n'.format(i + 1))
-                    writer.write(reader.read())
-                    writer.write('\n\n')
-                
-                with codecs.open(experiment_eval_file, 'r', encoding='utf-8') as reader:
-                    writer.write(reader.read())
-                    writer.write('\n\n')
-                
-                experiments_data.append([experiment_name, experiment_info_file, experiment_eval_file, 
-                                        experiment_results_file, experiment_learning_curve_image])
+            for i, experiment in enumerate(experiments_data):
+                writer.write('########### Experiment #{} ###########\n\n'.format(i + 1))
+                writer.write(experiment['info'])
+                writer.write('\n\n')
+
+                writer.write(experiment['eval'] or '')
+                writer.write('\n\n')
         
         research_sheet = [('Project Name', self.project_name),
                           ('Export Date', datetime.datetime.now().strftime("%Y-%m-%d %H:%M")),
@@ -338,43 +706,28 @@ class SupervisedExperimentSummarizer(object):
         md_writer = ['| Experiment Setup | Average Precision | Average Recall | Average F-score | Total Accuracy']
         md_writer.append('| ------------- | ------------- | ------------- | ------------- | ------------- |')
 
-        for experiment_item in experiments_data:
-            name_tokens = experiment_item[0].replace('(', ' ').replace(')', ' ').strip().rstrip().split()
-            nclasses = name_tokens[1]
-            ninput = name_tokens[3]
-            model = name_tokens[5]
-            epochs = name_tokens[7]
-            batch_size = name_tokens[9]
-            device = name_tokens[11]
-
-            try:
-                suffix = name_tokens[12]
-            except IndexError:
-                suffix = None
+        for experiment in experiments_data:
+            setup = (experiment['number_classes'], experiment['input_length'], experiment['model'],
+                     experiment['epochs'], experiment['batch_size'], experiment['device'], experiment['suffix'])
 
             research_experiment_setup = "Number of Classes: {}\nInput Length: {}\nModel Name: {}\nEpochs: {}\nBatch Size: {" \
-                                "}\nDevice: {}\nNotes: {}".format(nclasses, ninput, model, epochs, batch_size, device, suffix)
-
-            results_pickle_file = experiment_item[3]
-
-            with open(results_pickle_file, 'rb') as reader:
-                results = pkl.load(reader)
+                                "}\nDevice: {}\nNotes: {}".format(*setup)
 
             research_sheet.append((research_experiment_setup,
-                                    results['average_precision'],
-                                    results['average_recall'],
-                                    results['average_fscore'],
-                                    results['accuracy']))
+                                    experiment['average_precision'],
+                                    experiment['average_recall'],
+                                    experiment['average_fscore'],
+                                    experiment['accuracy']))
             
             md_experiment_setup = "Number of Classes: {}<br>Input Length: {}<br>Model Name: {}<br>Epochs: {}<br>Batch Size: {" \
-                                "}<br>Device: {}<br>Notes: {}".format(nclasses, ninput, model, epochs, batch_size, device, suffix)
+                                "}<br>Device: {}<br>Notes: {}".format(*setup)
 
             md_format = "| {} | {:0.3f} | {:0.3f} | {:0.3f} | {} |".format(
                 md_experiment_setup,
-                results['average_precision'],
-                results['average_recall'],
-                results['average_fscore'],
-                results['accuracy']
+                experiment['average_precision'],
+                experiment['average_recall'],
+                experiment['average_fscore'],
+                experiment['accuracy']
             )
 
             md_writer.append(md_format)
@@ -394,59 +747,39 @@ class SupervisedExperimentSummarizer(object):
         format_.set_text_wrap()
         worksheet.set_column('A:Z', 30, format_)
 
-        for i, experiment_item in enumerate(experiments_data):
+        for i, experiment in enumerate(experiments_data):
             current_sheet = "Experiment {}".format(i + 1)
 
-            name_tokens = experiment_item[0].replace('(', ' ').replace(')', ' ').strip().rstrip().split()
-            nclasses = name_tokens[1]
-            ninput = name_tokens[3]
-            model = name_tokens[5]
-            epochs = name_tokens[7]
-            batch_size = name_tokens[9]
-            device = name_tokens[11]
-            suffix = name_tokens[12] if len(name_tokens) == 14 else None
-
-            experiment_info_file = experiment_item[1]
-            experiment_results_file = experiment_item[3]
-            experiment_learning_curve_image = experiment_item[4]
-
-            with codecs.open(experiment_info_file, 'r', encoding='utf-8') as reader:
-                experiment_info = list(map(lambda v: v.strip().rstrip(), reader.readlines()))
-
-                author = experiment_info[0]
-                project = experiment_info[1]
-                date_and_time = experiment_info[2]
-                total_training_samples = experiment_info[5].split()[-1]
-                total_valid_samples = experiment_info[6].split()[-1]
-                total_test_samples = experiment_info[7].split()[-1]
-
-                sheet = [('Project Name', project), ('Author', author), ('Date and Time', date_and_time),
-                        ('Number of Training Samples', total_training_samples),
-                        ('Number of Validation Samples', total_valid_samples), ('Number of Testing Samples', total_test_samples),
-                        ('--', '--'), ('Number of Classes', nclasses), ('Input Length', ninput), ('Model', model),
-                        ('Epochs', epochs), ('Batch Size', batch_size), ('Device', device), ('Notes', suffix), ('--', '--')]
-
-                with open(experiment_results_file, 'rb') as reader:
-                    results = pkl.load(reader)
-
-                sheet.append(('Average Precision', results['average_precision']))
-                sheet.append(('Average Recall', results['average_recall']))
-                sheet.append(('Average F-score', results['average_fscore']))
-                sheet.append(('--', '--'))
-
-                df = pd.DataFrame(sheet)
-                df.to_excel(writer, current_sheet, index=0, index_label=0, header=False)
-
-                workbook = writer.book
-                worksheet = writer.sheets[current_sheet]
-
-                worksheet.insert_image('C3', experiment_learning_curve_image)
-
-                format_ = workbook.add_format()
-                format_.set_align('center')
-                format_.set_align('vcenter')
-                format_.set_text_wrap()
-
-                worksheet.set_column('A:Z', 30, format_)
+            experiment_learning_curve_image = os.path.join(experiment['path'], 'learning_curve.png')
+
+            sheet = [('Project Name', experiment['project']), ('Author', experiment['author']),
+                    ('Date and Time', experiment['date']),
+                    ('Number of Training Samples', experiment['total_training_samples']),
+                    ('Number of Validation Samples', experiment['total_valid_samples']),
+                    ('Number of Testing Samples', experiment['total_test_samples']),
+                    ('--', '--'), ('Number of Classes', experiment['number_classes']),
+                    ('Input Length', experiment['input_length']), ('Model', experiment['model']),
+                    ('Epochs', experiment['epochs']), ('Batch Size', experiment['batch_size']),
+                    ('Device', experiment['device']), ('Notes', experiment['suffix']), ('--', '--')]
+
+            sheet.append(('Average Precision', experiment['average_precision']))
+            sheet.append(('Average Recall', experiment['average_recall']))
+            sheet.append(('Average F-score', experiment['average_fscore']))
+            sheet.append(('--', '--'))
+
+            df = pd.DataFrame(sheet)
+            df.to_excel(writer, current_sheet, index=0, index_label=0, header=False)
+
+            workbook = writer.book
+            worksheet = writer.sheets[current_sheet]
+
+            worksheet.insert_image('C3', experiment_learning_curve_image)
+
+            format_ = workbook.add_format()
+            format_.set_align('center')
+            format_.set_align('vcenter')
+            format_.set_text_wrap()
+
+            worksheet.set_column('A:Z', 30, format_)
 
         writer.save()
@@ -0,0 +1,206 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import re
+import codecs
+import sqlite3
+import contextlib
+import multiprocessing
+import pickle as pkl
+from glob import glob
+
+from mleus.common.utils import process_context
+
+
+_NAME_PATTERN = re.compile(r'^nclasses\((.*?)\)ninput\((.*?)\)model\((.*?)\)epochs\((.*?)\)'
+                           r'batchsize\((.*?)\)device\((.*?)\)(?:_(.*))?$')
+
+# info.txt line -> column
+_INFO_FIELDS = {'author': 'author',
+                'project': 'project',
+                'date and time': 'date',
+                'total training samples': 'total_training_samples',
+                'total validation samples': 'total_valid_samples',
+                'total testing samples': 'total_test_samples'}
+
+SETUP_COLUMNS = ['number_classes', 'input_length', 'model', 'epochs', 'batch_size', 'device', 'suffix']
+INFO_COLUMNS = list(_INFO_FIELDS.values())
+METRIC_COLUMNS = ['average_precision', 'average_recall', 'average_fscore', 'accuracy']
+COLUMNS = ['path', 'research', 'name', 'mtime'] + SETUP_COLUMNS + INFO_COLUMNS + METRIC_COLUMNS + ['info', 'eval']
+
+_OPERATORS = {'': '=', 'ne': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'in': 'IN', 'like': 'LIKE'}
+
+
+def _number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def experiment_mtime(experiment_dir):
+    # eval.pkl is (re)written last by SupervisedExperiment.run, the directory covers added and removed files
+    paths = [experiment_dir, os.path.join(experiment_dir, 'eval.pkl')]
+
+    return max(os.path.getmtime(path) for path in paths if os.path.exists(path))
+
+
+def parse_experiment(experiment_dir):
+    experiment_dir = os.path.normpath(experiment_dir)
+    name = os.path.basename(experiment_dir)
+    match = _NAME_PATTERN.match(name)
+
+    results_file = os.path.join(experiment_dir, 'eval.pkl')
+
+    # not an experiment, or one that has not finished yet
+    if match is None or not os.path.exists(results_file):
+        return None
+
+    record = {'path': experiment_dir,
+              'research': os.path.basename(os.path.dirname(experiment_dir)),
+              'name': name,
+              'mtime': experiment_mtime(experiment_dir)}
+
+    for column, value in zip(SETUP_COLUMNS, match.groups()):
+        record[column] = _number(value)
+
+    with codecs.open(os.path.join(experiment_dir, 'info.txt'), 'r', encoding='utf-8') as reader:
+        record['info'] = reader.read()
+
+    for line in record['info'].splitlines():
+        key, _, value = line.partition(':')
+
+        if key.strip() in _INFO_FIELDS:
+            record[_INFO_FIELDS[key.strip()]] = _number(value.strip())
+
+    eval_file = os.path.join(experiment_dir, 'eval.log')
+
+    if os.path.exists(eval_file):
+        with codecs.open(eval_file, 'r', encoding='utf-8') as reader:
+            record['eval'] = reader.read()
+
+    with open(results_file, 'rb') as reader:
+        results = pkl.load(reader)
+
+    for column in METRIC_COLUMNS:
+        record[column] = results.get(column)
+
+    return record
+
+
+class ExperimentIndex(object):
+    """
+    SQLite index of the finished experiments under shared/experiments, one row per experiment directory with
+    its setup (parsed from the directory name), info.txt fields, metrics and report texts.
+
+    update only parses the experiments that are new or changed since the last update (in parallel), query
+    filters and sorts on the indexed columns without touching the experiment directories.
+    """
+
+    def __init__(self, experiments_root, index_path=None):
+        self.experiments_root = experiments_root
+        self.index_path = index_path if index_path is not None else os.path.join(experiments_root, 'index.sqlite')
+
+        with self.__connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS experiments ({}, PRIMARY KEY (path))'.format(
+                ', '.join(COLUMNS)))
+
+    def update(self, num_workers=None):
+        experiment_dirs = [os.path.normpath(path) for path in glob(os.path.join(self.experiments_root, '*', '*/'))
+                           if os.path.basename(os.path.normpath(path)) != '__pycache__']
+
+        with self.__connect() as connection:
+            indexed = dict(connection.execute('SELECT path, mtime FROM experiments').fetchall())
+
+        changed = [path for path in experiment_dirs if indexed.get(path) != experiment_mtime(path)]
+        removed = set(indexed.keys()) - set(experiment_dirs)
+
+        records = [record for record in self.__parse(changed, num_workers) if record is not None]
+
+        with self.__connect() as connection:
+            connection.executemany('DELETE FROM experiments WHERE path = ?', [(path,) for path in removed])
+            connection.executemany('INSERT OR REPLACE INTO experiments ({}) VALUES ({})'.format(
+                ', '.join(COLUMNS), ', '.join(['?'] * len(COLUMNS))),
+                [[record.get(column) for column in COLUMNS] for record in records])
+
+        return {'parsed': len(records), 'removed': len(removed), 'indexed': len(experiment_dirs)}
+
+    def query(self, columns=None, order_by=None, descending=False, limit=None, **filters):
+        """
+        filters are column=value, or column__<op>=value with op one of ne, gt, gte, lt, lte, in, like,
+        e.g. query(model='lstm', average_fscore__gte=0.8, order_by='average_fscore', descending=True).
+        """
+        columns = columns if columns is not None else [column for column in COLUMNS if column not in ('info', 'eval')]
+        conditions, params = [], []
+
+        for key, value in sorted(filters.items()):
+            column, _, operator = key.partition('__')
+
+            if operator not in _OPERATORS:
+                raise ValueError('unknown filter operator: {}'.format(operator))
+
+            self.__check_columns([column])
+
+            if operator == 'in':
+                conditions.append('{} IN ({})'.format(column, ', '.join(['?'] * len(value))))
+                params.extend(value)
+            elif value is None and operator in ('', 'ne'):
+                conditions.append('{} IS {}NULL'.format(column, 'NOT ' if operator == 'ne' else ''))
+            else:
+                conditions.append('{} {} ?'.format(column, _OPERATORS[operator]))
+                params.append(value)
+
+        self.__check_columns(columns + ([order_by] if order_by is not None else []))
+
+        sql = 'SELECT {} FROM experiments'.format(', '.join(columns))
+
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        if order_by is not None:
+            sql += ' ORDER BY {} {}'.format(order_by, 'DESC' if descending else 'ASC')
+
+        if limit is not None:
+            sql += ' LIMIT {:d}'.format(limit)
+
+        with self.__connect() as connection:
+            return [dict(zip(columns, row)) for row in connection.execute(sql, params).fetchall()]
+
+    def __parse(self, experiment_dirs, num_workers):
+        num_workers = num_workers if num_workers is not None else multiprocessing.cpu_count()
+
+        if num_workers <= 1 or len(experiment_dirs) < 2:
+            return [parse_experiment(path) for path in experiment_dirs]
+
+        context = process_context()
+
+        with context.Pool(min(num_workers, len(experiment_dirs))) as pool:
+            return pool.map(parse_experiment, experiment_dirs, chunksize=16)
+
+    @contextlib.contextmanager
+    def __connect(self):
+        connection = sqlite3.connect(self.index_path, timeout=30.0)
+
+        try:
+            # commits on success, rolls back on error
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def __check_columns(columns):
+        for column in columns:
+            if column not in COLUMNS:
+                raise ValueError('unknown experiment column: {}'.format(column))
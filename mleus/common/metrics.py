@@ -0,0 +1,222 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import time
+import json
+import threading
+import collections
+import contextlib
+from glob import glob
+import numpy as np
+
+
+_CHUNK_PATTERN = '{}-' + '[0-9]' * 6 + '.npy'
+
+
+class MetricsSink(object):
+
+    def log(self, name, value, step):
+        raise NotImplementedError()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class ConsoleSink(MetricsSink):
+    """
+    Prints a metric at most once every interval seconds, the values in between are dropped.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.__last_printed = {}
+
+    def log(self, name, value, step):
+        now = time.monotonic()
+
+        if now - self.__last_printed.get(name, -self.interval) < self.interval:
+            return
+
+        self.__last_printed[name] = now
+
+        print('step: {}\t{}: {}'.format(step, name, value))
+
+
+class NpySink(MetricsSink):
+    """
+    Append-only time series store, every metric is a sequence of <name>-<chunk>.npy files of
+    (step, value, unix time) rows written every chunk_size values and on flush.
+    """
+
+    def __init__(self, directory, chunk_size=4096):
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+        self.__buffers = {}
+        self.__chunks = {}
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def log(self, name, value, step):
+        buffer = self.__buffers.setdefault(name, [])
+        buffer.append((step, value, time.time()))
+
+        if len(buffer) >= self.chunk_size:
+            self.__write(name)
+
+    def flush(self):
+        for name in list(self.__buffers.keys()):
+            self.__write(name)
+
+    def __write(self, name):
+        buffer = self.__buffers.pop(name, [])
+
+        if len(buffer) == 0:
+            return
+
+        if name not in self.__chunks:
+            self.__chunks[name] = len(glob(os.path.join(self.directory, _CHUNK_PATTERN.format(name))))
+
+        path = os.path.join(self.directory, '{}-{:06d}.npy'.format(name, self.__chunks[name]))
+        np.save(path, np.asarray(buffer, dtype=np.float64))
+
+        self.__chunks[name] += 1
+
+    @staticmethod
+    def read(directory, name):
+        chunks = sorted(glob(os.path.join(directory, _CHUNK_PATTERN.format(name))))
+
+        if len(chunks) == 0:
+            return np.zeros((0, 3))
+
+        return np.concatenate([np.load(chunk) for chunk in chunks])
+
+
+class MultiSink(MetricsSink):
+
+    def __init__(self, sinks):
+        self.sinks = [sink for sink in sinks if sink is not None]
+
+    def log(self, name, value, step):
+        for sink in self.sinks:
+            sink.log(name, value, step)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class StageTimer(object):
+    """
+    Records the duration of every call of the named stages of a run (nextbatch, encode, fit_batch, ...) and
+    counters such as the number of samples, and summarizes them as p50/p95/p99 latencies, throughput and share
+    of the wall time.
+
+    Stages that run on a prefetch thread overlap with the training thread, so the shares can add up to more
+    than 1. Stages that run in worker processes are not recorded.
+
+    With a window, only the durations of the last window calls of a stage are kept and summarized as
+    percentiles, the count and the total seconds still cover every call (for long running processes).
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.durations = {}
+        self.totals = {}
+        self.counters = {}
+
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+
+    def record(self, stage, seconds):
+        with self.__lock:
+            if stage not in self.durations:
+                self.durations[stage] = collections.deque(maxlen=self.window) if self.window else []
+                self.totals[stage] = [0, 0.0]
+
+            self.durations[stage].append(seconds)
+            self.totals[stage][0] += 1
+            self.totals[stage][1] += seconds
+
+    def count(self, name, value):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def iterate(self, iterable, stage):
+        iterator = iter(iterable)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+            self.record(stage, time.perf_counter() - start)
+
+            yield item
+
+    def summary(self):
+        wall_seconds = time.perf_counter() - self.__start
+        stages = {}
+
+        with self.__lock:
+            durations = {stage: np.asarray(values) for stage, values in self.durations.items()}
+            totals = {stage: tuple(total) for stage, total in self.totals.items()}
+            counters = dict(self.counters)
+
+        for stage, values in durations.items():
+            count, total_seconds = totals[stage]
+            stages[stage] = {'count': count,
+                             'total_seconds': total_seconds,
+                             'p50_ms': float(np.percentile(values, 50) * 1000.0),
+                             'p95_ms': float(np.percentile(values, 95) * 1000.0),
+                             'p99_ms': float(np.percentile(values, 99) * 1000.0),
+                             'share': total_seconds / wall_seconds if wall_seconds > 0 else 0.0}
+
+        throughput = {}
+
+        for name, value in counters.items():
+            phase = name.split('_')[0]
+
+            if phase in stages and stages[phase]['total_seconds'] > 0:
+                throughput['{}_per_sec'.format(name)] = value / stages[phase]['total_seconds']
+
+        return {'wall_seconds': wall_seconds, 'stages': stages, 'counters': counters, 'throughput': throughput}
+
+    def save(self, path):
+        summary = self.summary()
+
+        with open(path, 'w') as writer:
+            json.dump(summary, writer, indent=2)
+
+        return summary
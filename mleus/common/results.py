@@ -0,0 +1,185 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import codecs
+import shutil
+import hashlib
+import numpy as np
+import pickle as pkl
+
+from mleus.common.cache import code_hash, pipeline_fingerprint, value_bytes
+
+
+# the batcher settings that change which samples go where, looked up on any batcher type
+_BATCHER_SETTINGS = ['batch_size', 'seed', 'with_shuffle', 'zero_copy', 'block_size', 'rank', 'world_size',
+                     'drop_last', 'max_tokens', 'window_size', 'label_axis', 'buffer_size', 'temperature',
+                     'steps_per_epoch']
+
+
+def _array_digest(values):
+    return hashlib.md5(value_bytes(np.asarray(values))).hexdigest()
+
+
+def data_fingerprint(batcher, samples=1024):
+    """
+    Cheap fingerprint of the data behind a batcher: its size, split sizes and settings plus up to samples
+    evenly spaced rows. None when the batcher does not expose its data (e.g. a StreamingBatcher).
+    """
+    data = getattr(batcher, 'data', None)
+
+    if data is None:
+        return None
+
+    size = len(data)
+    fingerprint = hashlib.md5()
+
+    settings = {name: repr(getattr(batcher, name)) for name in _BATCHER_SETTINGS if hasattr(batcher, name)}
+    settings.update({'type': type(batcher).__name__, 'size': size,
+                     'splits': [batcher.total_train_samples, batcher.total_valid_samples, batcher.total_test_samples]})
+
+    # the settings that repr does not describe: index arrays, sampling weights and functions
+    if getattr(batcher, 'split_indexes', None) is not None:
+        settings['split_indexes'] = [_array_digest(np.asarray(indexes, dtype=np.int64))
+                                     for indexes in batcher.split_indexes]
+
+    if hasattr(batcher, 'sample_weights'):
+        settings['weights'] = [_array_digest(batcher.sample_weights), _array_digest(batcher.table.probability),
+                               _array_digest(batcher.table.alias)]
+
+    if hasattr(batcher, 'length_fn'):
+        length_fn = getattr(batcher.length_fn, 'func', batcher.length_fn)
+        settings['length_fn'] = [getattr(length_fn, '__module__', None),
+                                 getattr(length_fn, '__qualname__', type(length_fn).__qualname__),
+                                 code_hash(length_fn)]
+
+    fingerprint.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+
+    for index in np.unique(np.linspace(0, size - 1, min(samples, size)).astype(np.int64)):
+        fingerprint.update(value_bytes(data[int(index)]))
+
+    return fingerprint.hexdigest()
+
+
+# ioctl request of the copy-on-write file clone of linux (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def _clone_or_copy(source, destination):
+    """
+    Copy-on-write clone of source where the filesystem supports it and a plain copy otherwise, unlike a hard
+    link, writing to one of the files later leaves the other one as it was.
+    """
+    try:
+        import fcntl
+
+        with open(source, 'rb') as reader, open(destination, 'wb') as writer:
+            fcntl.ioctl(writer.fileno(), _FICLONE, reader.fileno())
+
+        shutil.copystat(source, destination)
+    except (ImportError, OSError):
+        shutil.copy2(source, destination)
+
+    return destination
+
+
+class ResultStore(object):
+    """
+    Content-addressed store of finished experiment runs under shared/results, keyed by everything that changes
+    the results (setup, model code and args, pipeline, run settings, data) and pointing to the run's directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @classmethod
+    def for_research(cls, research_interface):
+        project_dir = os.path.dirname(os.path.dirname(research_interface))
+
+        return cls(os.path.join(project_dir, 'shared', 'results'))
+
+    @staticmethod
+    def key(experiment, trainer, batcher, prepare, settings=None):
+        data = data_fingerprint(batcher)
+
+        if data is None:
+            return None
+
+        description = {'setup': [experiment.model_name, experiment.epochs, experiment.batch_size,
+                                 experiment.number_classes, experiment.input_length, experiment.device],
+                       'model': ['{}.{}'.format(trainer.model_class().__module__, trainer.model_class().__qualname__),
+                                 code_hash(trainer.model_class()), trainer.model_args()],
+                       'pipeline': pipeline_fingerprint(prepare),
+                       'class2index': prepare.class2index,
+                       'settings': settings,
+                       'data': data}
+
+        return hashlib.md5(json.dumps(description, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        entry_file = os.path.join(self.directory, key + '.json')
+
+        if not os.path.exists(entry_file):
+            return None
+
+        with open(entry_file, 'r') as reader:
+            entry = json.load(reader)
+
+        # the experiment directory may have been deleted since
+        if not os.path.exists(os.path.join(entry['experiment_dir'], 'eval.pkl')):
+            return None
+
+        return entry
+
+    def store(self, key, experiment_dir):
+        with open(os.path.join(experiment_dir, 'eval.pkl'), 'rb') as reader:
+            results = pkl.load(reader)
+
+        entry = {'key': key, 'experiment_dir': experiment_dir, 'results': results}
+        entry_file = os.path.join(self.directory, key + '.json')
+
+        temp_file = '{}.{}.tmp'.format(entry_file, os.getpid())
+
+        with open(temp_file, 'w') as writer:
+            json.dump(entry, writer, default=repr)
+
+        # concurrent runs of the same configuration each write their own temp file, the last one wins
+        os.replace(temp_file, entry_file)
+
+        return entry
+
+    @staticmethod
+    def reuse(entry, experiment):
+        """
+        Fills the experiment directory with copies of the artifacts of the stored run, except info.txt.
+        """
+        for name in os.listdir(entry['experiment_dir']):
+            source = os.path.join(entry['experiment_dir'], name)
+            destination = os.path.join(experiment.experiment_dir, name)
+
+            if name == 'info.txt':
+                continue
+
+            if os.path.isdir(source):
+                shutil.copytree(source, destination, copy_function=_clone_or_copy, dirs_exist_ok=True)
+            elif not os.path.exists(destination):
+                _clone_or_copy(source, destination)
+
+        with codecs.open(experiment.info_file_path, 'a', encoding='utf-8') as writer:
+            writer.write('\t results reused from: {}\n'.format(entry['experiment_dir']))
+
+        return entry['results']
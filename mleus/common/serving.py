@@ -0,0 +1,338 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import time
+import asyncio
+import traceback
+import pickle as pkl
+import numpy as np
+import concurrent.futures
+from http import HTTPStatus
+
+from mleus.common.bundle import Predictor, load_bundle
+from mleus.common.metrics import StageTimer
+
+
+def load_experiment(experiment_dir):
+    """
+    Predictor of a saved experiment, from its inference bundle when it has one and otherwise from the pickles
+    of saved_model and saved_pipeline (run with with_pipeline_save=True).
+    """
+    bundle_dir = os.path.join(experiment_dir, 'bundle')
+
+    if os.path.exists(os.path.join(bundle_dir, 'bundle.json')):
+        return load_bundle(bundle_dir)
+
+    model_dir = os.path.join(experiment_dir, 'saved_model')
+    pipeline_dir = os.path.join(experiment_dir, 'saved_pipeline')
+
+    if not os.path.exists(os.path.join(pipeline_dir, 'encoder.pkl')):
+        raise ValueError('{} has neither an inference bundle nor a saved pipeline'.format(experiment_dir))
+
+    with open(os.path.join(model_dir, 'model.pkl'), 'rb') as reader:
+        model_class = pkl.load(reader)
+
+    with open(os.path.join(model_dir, 'args.json'), 'r') as reader:
+        model = model_class(**json.load(reader))
+
+    model.load_weights(os.path.join(model_dir, 'weights.pt'))
+
+    with open(os.path.join(pipeline_dir, 'encoder.pkl'), 'rb') as reader:
+        encoder = pkl.load(reader)
+
+    transformations = []
+
+    if os.path.exists(os.path.join(pipeline_dir, 'transformations.pkl')):
+        with open(os.path.join(pipeline_dir, 'transformations.pkl'), 'rb') as reader:
+            transformations = pkl.load(reader)
+
+    index2class_file = os.path.join(pipeline_dir, 'index2class.json')
+
+    if not os.path.exists(index2class_file):
+        raise ValueError('{} has no index2class.json, run the experiment with index2class to serve it'.format(
+            pipeline_dir))
+
+    # json turned the integer keys into strings
+    with open(index2class_file, 'r') as reader:
+        index2class = {int(index): name for index, name in json.load(reader).items()}
+
+    return Predictor(model, encoder, transformations, [index2class[index] for index in sorted(index2class.keys())])
+
+
+class _HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super(_HTTPError, self).__init__(message)
+        self.status = status
+
+
+class InferenceServer(object):
+    """
+    Local asyncio HTTP server (TCP or Unix socket) over a Predictor.
+
+    POST /predict with {"texts": [...]} (or {"text": "..."}) answers {"classes": [...], "probs": [[...]]}.
+    Concurrent requests are coalesced into micro-batches of up to max_batch_size texts, a batch is sent to the
+    predictor at the latest max_wait_ms after its first request arrived. GET /stats answers the latency
+    percentiles of the last latency_window requests, of the time they waited for their batch and of the
+    predictor calls.
+    """
+
+    def __init__(self, predictor, host='127.0.0.1', port=8000, unix_socket=None, max_batch_size=32, max_wait_ms=5.0,
+                 latency_window=10000):
+        self.predictor = predictor
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.timer = StageTimer(window=latency_window)
+        self.server = None
+
+        self.__queue = None
+        self.__carry = None
+        self.__batching = None
+
+        # a single thread keeps the event loop accepting (and batching) requests while the model runs
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def address(self):
+        if self.unix_socket is not None:
+            return self.unix_socket
+
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def start(self):
+        self.__queue = asyncio.Queue()
+        self.__batching = asyncio.ensure_future(self.__batch_loop())
+
+        if self.unix_socket is not None:
+            self.server = await asyncio.start_unix_server(self.__handle, path=self.unix_socket)
+        else:
+            self.server = await asyncio.start_server(self.__handle, host=self.host, port=self.port)
+
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        if self.__batching is not None:
+            self.__batching.cancel()
+
+            try:
+                await self.__batching
+            except asyncio.CancelledError:
+                pass
+
+        self.__executor.shutdown(wait=True)
+
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+
+    def stats(self):
+        summary = self.timer.summary()
+        summary['max_batch_size'] = self.max_batch_size
+        summary['max_wait_ms'] = self.max_wait_ms
+
+        return summary
+
+    async def predict(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((texts, future, time.perf_counter()))
+
+        return await future
+
+    async def __batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if self.__carry is not None:
+                batch, self.__carry = [self.__carry], None
+            else:
+                batch = [await self.__queue.get()]
+
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait_ms / 1000.0
+
+            while size < self.max_batch_size:
+                remaining = deadline - loop.time()
+
+                if remaining <= 0:
+                    break
+
+                try:
+                    item = await asyncio.wait_for(self.__queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+                # a request is never split across batches, the one that does not fit opens the next batch
+                if size + len(item[0]) > self.max_batch_size:
+                    self.__carry = item
+                    break
+
+                batch.append(item)
+                size += len(item[0])
+
+            await self.__run_batch(loop, batch)
+
+    async def __run_batch(self, loop, batch):
+        start = time.perf_counter()
+
+        for _, _, enqueued in batch:
+            self.timer.record('queue', start - enqueued)
+
+        texts = [text for item_texts, _, _ in batch for text in item_texts]
+
+        try:
+            probs = await loop.run_in_executor(self.__executor, self.__predict_probs, texts)
+        except Exception as error:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+            return
+
+        self.timer.record('predict', time.perf_counter() - start)
+        self.timer.count('predict_texts', len(texts))
+        self.timer.count('batches', 1)
+
+        offset = 0
+
+        for item_texts, future, _ in batch:
+            item_probs = probs[offset:offset + len(item_texts)]
+            offset += len(item_texts)
+
+            if not future.done():
+                future.set_result({'classes': [self.predictor.classes[int(np.argmax(row))] for row in item_probs],
+                                   'probs': item_probs})
+
+    def __predict_probs(self, texts):
+        return np.asarray(self.predictor.predict_probs(texts), dtype=np.float64).tolist()
+
+    async def __handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+
+                if not request_line.strip():
+                    break
+
+                start = time.perf_counter()
+                method, path, headers, body = await InferenceServer.__read_request(request_line, reader)
+
+                try:
+                    status, response = HTTPStatus.OK, await self.__route(method, path, body)
+                except _HTTPError as error:
+                    status, response = error.status, {'error': str(error)}
+                except Exception:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': traceback.format_exc()}
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                InferenceServer.__write_response(writer, status, response, keep_alive)
+                await writer.drain()
+
+                if path == '/predict':
+                    self.timer.record('request', time.perf_counter() - start)
+                    self.timer.count('requests', 1)
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def __route(self, method, path, body):
+        if path == '/predict' and method == 'POST':
+            try:
+                request = json.loads(body.decode('utf-8'))
+            except ValueError:
+                raise _HTTPError(HTTPStatus.BAD_REQUEST, 'the body is not json')
+
+            if isinstance(request, dict) and isinstance(request.get('text'), str):
+                texts = [request['text']]
+            elif isinstance(request, dict) and isinstance(request.get('texts'), list):
+                texts = request['texts']
+            else:
+                raise _HTTPError(HTTPStatus.BAD_REQUEST, 'expected {"texts": [...]} or {"text": "..."}')
+
+            if not all(isinstance(text, str) for text in texts):
+                raise _HTTPError(HTTPStatus.BAD_REQUEST, 'texts must be strings')
+
+            if len(texts) == 0:
+                return {'classes': [], 'probs': []}
+
+            return await self.predict(texts)
+
+        if path == '/stats' and method == 'GET':
+            return self.stats()
+
+        if path == '/health' and method == 'GET':
+            return {'status': 'ok', 'classes': self.predictor.classes}
+
+        raise _HTTPError(HTTPStatus.NOT_FOUND, 'no route for {} {}'.format(method, path))
+
+    @staticmethod
+    async def __read_request(request_line, reader):
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+
+        while True:
+            line = await reader.readline()
+
+            if line.strip() == b'':
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        return method, path.split('?')[0], headers, body
+
+    @staticmethod
+    def __write_response(writer, status, response, keep_alive):
+        body = json.dumps(response).encode('utf-8')
+
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                     'Connection: {}\r\n\r\n'.format(status.value, status.phrase, len(body),
+                                                     'keep-alive' if keep_alive else 'close').encode('latin-1'))
+        writer.write(body)
+
+
+def serve(experiment_dir, **kwargs):
+    """
+    Serves a saved experiment until interrupted, kwargs are those of InferenceServer.
+    """
+    server = InferenceServer(load_experiment(experiment_dir), **kwargs)
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+    return server.stats()
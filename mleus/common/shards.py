@@ -0,0 +1,227 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import numpy as np
+
+
+class ShardWriter(object):
+    """
+    Writes records to on-disk shards that ShardedDataset reads back through memory maps.
+
+    fmt='array' stores fixed-width rows of the given dtype and shape in a raw binary file per shard,
+    fmt='tensor' stores numeric rows of the given dtype whose shape varies from row to row (e.g. one vector per
+    token), fmt='text' and fmt='json' store variable-length rows as one byte blob plus an int64 offsets file.
+    """
+
+    def __init__(self, directory, fmt='text', rows_per_shard=1000000, dtype='float32', shape=()):
+        if fmt not in ('array', 'tensor', 'text', 'json'):
+            raise ValueError('unknown shard format: {}'.format(fmt))
+
+        self.directory = directory
+        self.fmt = fmt
+        self.rows_per_shard = rows_per_shard
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+
+        self.shards = []
+        self.__blob = None
+        self.__offsets = None
+        self.__shapes = None
+        self.__shard_rows = 0
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def write(self, record):
+        if self.__blob is None or self.__shard_rows >= self.rows_per_shard:
+            self.__open_shard()
+
+        if self.fmt == 'array':
+            row = np.asarray(record, dtype=self.dtype)
+
+            if row.shape != self.shape:
+                raise ValueError('expected a row of shape {}, got {}'.format(self.shape, row.shape))
+
+            self.__blob.write(row.tobytes())
+        elif self.fmt == 'tensor':
+            row = np.asarray(record, dtype=self.dtype)
+
+            if len(self.__shapes) > 0 and row.ndim != len(self.__shapes[0]):
+                raise ValueError('expected a row with {} dimensions, got {}'.format(len(self.__shapes[0]), row.ndim))
+
+            self.__blob.write(row.tobytes())
+            self.__offsets.append(self.__blob.tell())
+            self.__shapes.append(row.shape)
+        else:
+            if self.fmt == 'json':
+                record = json.dumps(record)
+
+            self.__blob.write(record.encode('utf-8'))
+            self.__offsets.append(self.__blob.tell())
+
+        self.__shard_rows += 1
+        self.shards[-1]['rows'] = self.__shard_rows
+
+    def close(self):
+        self.__close_shard()
+
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as writer:
+            json.dump({'fmt': self.fmt,
+                       'dtype': self.dtype.str,
+                       'shape': list(self.shape),
+                       'shards': self.shards}, writer)
+
+    def __open_shard(self):
+        self.__close_shard()
+
+        name = 'shard-{:05d}'.format(len(self.shards))
+        self.shards.append({'name': name, 'rows': 0})
+
+        self.__blob = open(os.path.join(self.directory, name + '.bin'), 'wb')
+        self.__offsets = [0]
+        self.__shapes = []
+        self.__shard_rows = 0
+
+    def __close_shard(self):
+        if self.__blob is None:
+            return
+
+        self.__blob.close()
+        self.__blob = None
+
+        if self.fmt != 'array':
+            name = self.shards[-1]['name']
+            np.asarray(self.__offsets, dtype=np.int64).tofile(os.path.join(self.directory, name + '.idx'))
+
+        if self.fmt == 'tensor':
+            name = self.shards[-1]['name']
+            ndim = len(self.__shapes[0]) if len(self.__shapes) > 0 else 0
+            self.shards[-1]['ndim'] = ndim
+
+            shapes = np.asarray(self.__shapes, dtype=np.int64).reshape(len(self.__shapes), ndim)
+            shapes.tofile(os.path.join(self.directory, name + '.shp'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardedDataset(object):
+    """
+    Read-only, memory-mapped view over the shards written by ShardWriter.
+
+    Rows are only read when indexed, so the dataset can be much larger than the available memory.
+    Pass it to Batcher with zero_copy=True and a block_size to keep reads local, the Batcher then shuffles the
+    order of the shards, of the blocks inside each shard and of the rows inside each block.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+        with open(os.path.join(self.directory, 'meta.json'), 'r') as reader:
+            meta = json.load(reader)
+
+        self.fmt = meta['fmt']
+        self.dtype = np.dtype(meta['dtype'])
+        self.shape = tuple(meta['shape'])
+
+        self.shards = []
+
+        for shard in meta['shards']:
+            path = os.path.join(self.directory, shard['name'])
+
+            if shard['rows'] == 0:
+                continue
+
+            if self.fmt == 'array':
+                self.shards.append((np.memmap(path + '.bin', dtype=self.dtype, mode='r',
+                                              shape=(shard['rows'],) + self.shape), None))
+            elif self.fmt == 'tensor':
+                shapes = np.fromfile(path + '.shp', dtype=np.int64).reshape(shard['rows'], shard['ndim'])
+
+                offsets = np.fromfile(path + '.idx', dtype=np.int64) // self.dtype.itemsize
+
+                self.shards.append((ShardedDataset.__blob(path, self.dtype), (offsets, shapes)))
+            else:
+                self.shards.append((ShardedDataset.__blob(path, np.uint8),
+                                    np.memmap(path + '.idx', dtype=np.int64, mode='r')))
+
+        rows = [shard['rows'] for shard in meta['shards'] if shard['rows'] > 0]
+        self.shard_starts = np.concatenate([[0], np.cumsum(rows)]).astype(np.int64)
+        self.size = int(self.shard_starts[-1])
+
+    @staticmethod
+    def __blob(path, dtype):
+        # empty rows (e.g. a shard of empty strings) leave an empty blob, which cannot be memory-mapped
+        if os.path.getsize(path + '.bin') > 0:
+            return np.memmap(path + '.bin', dtype=dtype, mode='r')
+
+        return np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.take(np.arange(*item.indices(self.size)))
+
+        if isinstance(item, (list, np.ndarray)):
+            return self.take(item)
+
+        if item < 0:
+            item += self.size
+
+        if item < 0 or item >= self.size:
+            raise IndexError('index {} is out of range'.format(item))
+
+        shard_idx = int(np.searchsorted(self.shard_starts, item, side='right') - 1)
+
+        return self.__row(shard_idx, item - int(self.shard_starts[shard_idx]))
+
+    def take(self, indexes):
+        indexes = np.asarray(indexes, dtype=np.int64)
+        shard_ids = np.searchsorted(self.shard_starts, indexes, side='right') - 1
+
+        if self.fmt == 'array':
+            rows = np.empty((len(indexes),) + self.shape, dtype=self.dtype)
+
+            for shard_idx in np.unique(shard_ids):
+                mask = shard_ids == shard_idx
+                rows[mask] = self.shards[shard_idx][0][indexes[mask] - self.shard_starts[shard_idx]]
+
+            return rows
+
+        return [self.__row(int(shard_idx), int(index - self.shard_starts[shard_idx]))
+                for index, shard_idx in zip(indexes, shard_ids)]
+
+    def __row(self, shard_idx, local_idx):
+        blob, offsets = self.shards[shard_idx]
+
+        if self.fmt == 'array':
+            return np.array(blob[local_idx])
+
+        if self.fmt == 'tensor':
+            element_offsets, shapes = offsets
+
+            return blob[element_offsets[local_idx]:element_offsets[local_idx + 1]].reshape(shapes[local_idx])
+
+        text = blob[offsets[local_idx]:offsets[local_idx + 1]].tobytes().decode('utf-8')
+
+        if self.fmt == 'json':
+            return json.loads(text)
+
+        return text
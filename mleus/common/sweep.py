@@ -0,0 +1,504 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import json
+import time
+import queue
+import socket
+import uuid
+import hashlib
+import itertools
+import threading
+import traceback
+import multiprocessing
+import pickle as pkl
+from glob import glob
+
+from mleus.common.experiment import SupervisedExperiment
+from mleus.common.checkpoint import Checkpointer
+from mleus.common.utils import process_context
+
+
+# the configuration fields that name the experiment directory, any other field goes into its suffix
+SETUP_FIELDS = ['model', 'epochs', 'batch_size', 'number_classes', 'input_length', 'device', 'author_name']
+
+
+def grid_configurations(param_space, defaults=None):
+    names = sorted(param_space.keys())
+    configurations = []
+
+    for values in itertools.product(*[param_space[name] for name in names]):
+        configuration = dict(defaults or {})
+        configuration.update(zip(names, values))
+
+        configurations.append(configuration)
+
+    return configurations
+
+
+def configuration_suffix(configuration):
+    extras = sorted([name for name in configuration if name not in SETUP_FIELDS])
+
+    if len(extras) == 0:
+        return None
+
+    return '-'.join(['{}={}'.format(name, configuration[name]) for name in extras])
+
+
+def build_experiment(configuration, batcher=None):
+    return SupervisedExperiment(batcher.size if batcher is not None else None,
+                                batcher.total_train_samples if batcher is not None else None,
+                                batcher.total_valid_samples if batcher is not None else None,
+                                batcher.total_test_samples if batcher is not None else None,
+                                configuration['model'],
+                                configuration['epochs'],
+                                configuration['batch_size'],
+                                configuration['number_classes'],
+                                configuration['input_length'],
+                                configuration.get('device', 'cpu'),
+                                author_name=configuration.get('author_name'))
+
+
+class ExperimentGrid(object):
+    """
+    Runs every configuration of a parameter grid as a SupervisedExperiment, without any prompt,
+    at most max_workers at a time, each in a fresh process.
+
+    setup_fn(configuration) is called in the worker and returns a dict with the trainer, batcher, encoder and
+    data_axis, plus any other SupervisedExperiment.run keyword argument. setup_fn must be picklable (e.g. a
+    module level function) where processes are not forked. if_exists is the policy for
+    experiment directories that already exist: 'skip', 'overwrite' or 'suffix'.
+    """
+
+    def __init__(self, research_interface, param_space, setup_fn, defaults=None, if_exists='skip', max_workers=None):
+        self.research_interface = research_interface
+        self.setup_fn = setup_fn
+        self.if_exists = if_exists
+        self.max_workers = max_workers if max_workers is not None else multiprocessing.cpu_count()
+
+        self.configurations = grid_configurations(param_space, defaults=defaults)
+        self.results = []
+
+    def run(self):
+        jobs = [(self.research_interface, configuration, self.setup_fn, self.if_exists)
+                for configuration in self.configurations]
+
+        self.results = run_jobs(jobs, self.max_workers)
+
+        return self.results
+
+
+def run_jobs(jobs, max_workers):
+    """
+    Runs every job with run_configuration in its own fresh process, at most max_workers at a time.
+
+    The processes are not daemonic, so a run may start processes of its own (num_workers, background
+    validation, cache warming). Where fork is not available the jobs, setup_fn included, are pickled.
+    The results are in the order of the jobs.
+    """
+    if len(jobs) == 0:
+        return []
+
+    context = process_context()
+    finished = context.Queue()
+
+    pending = list(enumerate(jobs))
+    running = {}
+    results = {}
+
+    def collect(index, result):
+        # a job already marked crashed may still have its result in flight, it is counted once
+        if index not in running:
+            return
+
+        running.pop(index)[0].join()
+
+        print('{}: {}'.format(result['status'], result['experiment_dir']))
+
+        results[index] = result
+
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < max(1, max_workers):
+                index, job = pending.pop(0)
+
+                running[index] = (context.Process(target=_run_job, args=(index, job, finished)), job)
+                running[index][0].start()
+
+            try:
+                collect(*finished.get(timeout=1.0))
+            except queue.Empty:
+                # a process that exited right after reporting has its result waiting here
+                while True:
+                    try:
+                        collect(*finished.get_nowait())
+                    except queue.Empty:
+                        break
+
+                # a process that died without reporting (e.g. killed for running out of memory)
+                for index, (process, job) in list(running.items()):
+                    if not process.is_alive():
+                        results[index] = _crashed(job, process.exitcode)
+                        running.pop(index)
+    finally:
+        for process, _ in running.values():
+            process.terminate()
+            process.join()
+
+    return [results[index] for index in range(len(jobs))]
+
+
+def _run_job(index, job, finished):
+    finished.put((index, run_configuration(job)))
+
+
+def _crashed(job, exitcode):
+    research_interface, configuration, _, _ = job
+    experiment_dir = build_experiment(configuration).locate(research_interface,
+                                                            suffix=configuration_suffix(configuration))
+
+    return {'configuration': configuration, 'status': 'failed', 'experiment_dir': experiment_dir,
+            'error': 'the process exited with code {}'.format(exitcode)}
+
+
+def run_configuration(job):
+    research_interface, configuration, setup_fn, if_exists = job
+    suffix = configuration_suffix(configuration)
+
+    experiment_dir = build_experiment(configuration).locate(research_interface, suffix=suffix)
+
+    if if_exists == 'skip' and os.path.exists(experiment_dir):
+        if os.path.exists(os.path.join(experiment_dir, 'eval.pkl')):
+            return {'configuration': configuration, 'status': 'skipped', 'experiment_dir': experiment_dir}
+
+        # left behind by a run that crashed (or was killed) before it finished, it is run again from scratch
+        if_exists = 'overwrite'
+
+    # concurrent workers (and nodes) would otherwise race on creating the shared directories in create()
+    os.makedirs(os.path.dirname(experiment_dir), exist_ok=True)
+
+    try:
+        setup = dict(setup_fn(configuration))
+
+        trainer = setup.pop('trainer')
+        batcher = setup.pop('batcher')
+        encoder = setup.pop('encoder')
+        data_axis = setup.pop('data_axis')
+
+        experiment = build_experiment(configuration, batcher)
+        experiment_dir = experiment.create(research_interface, if_exists=if_exists, suffix=suffix)
+
+        if experiment.skipped:
+            return {'configuration': configuration, 'status': 'skipped', 'experiment_dir': experiment_dir}
+
+        experiment.run(trainer, batcher, encoder, data_axis, **setup)
+    except Exception:
+        return {'configuration': configuration, 'status': 'failed', 'experiment_dir': experiment_dir,
+                'error': traceback.format_exc()}
+
+    return {'configuration': configuration, 'status': 'done', 'experiment_dir': experiment.experiment_dir}
+
+
+class SuccessiveHalving(object):
+    """
+    Successive-halving scheduler over SupervisedExperiment runs.
+
+    Every rung trains the surviving configurations up to the rung's epoch budget (starting at min_epochs and
+    multiplied by eta, up to the largest configured epochs), resuming each one from its previous rung's final
+    checkpoint. The runs are scored on metric from their eval.pkl and only the best 1 / eta go to the next
+    rung. Every rung is a regular experiment directory, so SupervisedExperimentSummarizer lists all of them.
+    """
+
+    def __init__(self, research_interface, configurations, setup_fn,
+                 min_epochs=1,
+                 eta=3,
+                 metric='average_fscore',
+                 if_exists='skip',
+                 max_workers=None):
+        self.research_interface = research_interface
+        self.configurations = [dict(configuration) for configuration in configurations]
+        self.setup_fn = setup_fn
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.metric = metric
+        self.if_exists = if_exists
+        self.max_workers = max_workers if max_workers is not None else multiprocessing.cpu_count()
+
+        self.max_epochs = max(configuration['epochs'] for configuration in self.configurations)
+        self.rungs = []
+
+    def run(self):
+        survivors = list(range(len(self.configurations)))
+        experiment_dirs = {}
+        budget = min(self.min_epochs, self.max_epochs)
+
+        while True:
+            jobs = []
+
+            for index in survivors:
+                setup_fn = _RungSetup(self.setup_fn, self.__resume_from(experiment_dirs.get(index)))
+                configuration = dict(self.configurations[index], epochs=budget)
+
+                jobs.append((self.research_interface, configuration, setup_fn, self.if_exists))
+
+            scores = {}
+
+            # the results are in the order of the jobs, so equal configurations keep their own runs
+            for index, result in zip(survivors, run_jobs(jobs, self.max_workers)):
+                experiment_dirs[index] = result['experiment_dir']
+                scores[index] = self.__score(result)
+
+            rung = sorted(survivors, key=lambda index: scores[index], reverse=True)
+            self.rungs.append([{'configuration': self.configurations[index],
+                                'epochs': budget,
+                                'experiment_dir': experiment_dirs[index],
+                                self.metric: scores[index]} for index in rung])
+
+            if budget >= self.max_epochs or len(survivors) <= 1:
+                return self.rungs[-1][0]
+
+            survivors = rung[:max(1, len(rung) // self.eta)]
+            budget = min(budget * self.eta, self.max_epochs)
+
+    def __score(self, result):
+        results_file = os.path.join(result['experiment_dir'], 'eval.pkl')
+
+        if result['status'] == 'failed' or not os.path.exists(results_file):
+            return float('-inf')
+
+        with open(results_file, 'rb') as reader:
+            score = pkl.load(reader).get(self.metric, float('-inf'))
+
+        # nan (e.g. a class that is never predicted) never wins
+        return score if score == score else float('-inf')
+
+    @staticmethod
+    def __resume_from(experiment_dir):
+        if experiment_dir is None:
+            return None
+
+        return Checkpointer.latest(os.path.join(experiment_dir, 'checkpoints'))
+
+
+class _RungSetup(object):
+
+    def __init__(self, setup_fn, resume_from):
+        self.setup_fn = setup_fn
+        self.resume_from = resume_from
+
+    def __call__(self, configuration):
+        setup = dict(self.setup_fn(configuration))
+        setup['resume_from'] = self.resume_from
+        setup['final_checkpoint'] = True
+
+        return setup
+
+
+class ExperimentQueue(object):
+    """
+    Work queue kept on a shared filesystem, so that several nodes can drain the same sweep.
+
+    Every job is a JSON file that moves between pending/, claimed/, done/ and failed/ by atomic renames,
+    a rename being the claim. The claimer then writes its claim token into the file, so that it only ever
+    finishes its own claim. Workers touch their claimed file every heartbeat_seconds; claims that are not
+    touched for stale_seconds are moved back to pending/ by whichever worker notices first.
+    """
+
+    STATES = ['pending', 'claimed', 'done', 'failed']
+
+    def __init__(self, queue_dir, stale_seconds=300, heartbeat_seconds=30):
+        self.queue_dir = queue_dir
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+
+        # job id -> token of the claims held by this instance
+        self.claims = {}
+
+        for state in self.STATES:
+            os.makedirs(os.path.join(self.queue_dir, state), exist_ok=True)
+
+    @classmethod
+    def for_research(cls, research_interface, **kwargs):
+        # kept next to shared/experiments rather than inside it, the summarizer treats every sub-dir as a run
+        project_dir = os.path.dirname(os.path.dirname(research_interface))
+        research_name = os.path.splitext(os.path.basename(research_interface))[0]
+
+        return cls(os.path.join(project_dir, 'shared', 'queues', research_name), **kwargs)
+
+    def submit(self, configurations):
+        job_ids = []
+
+        for configuration in configurations:
+            content = json.dumps(configuration, sort_keys=True)
+            job_id = hashlib.md5(content.encode('utf-8')).hexdigest()
+
+            if self.state_of(job_id) is None:
+                self.__write(self.__path('pending', job_id), {'configuration': configuration})
+
+            job_ids.append(job_id)
+
+        return job_ids
+
+    def state_of(self, job_id):
+        for state in self.STATES:
+            if os.path.exists(self.__path(state, job_id)):
+                return state
+
+        return None
+
+    def status(self):
+        return {state: len(glob(os.path.join(self.queue_dir, state, '*.json'))) for state in self.STATES}
+
+    def claim(self):
+        for path in sorted(glob(os.path.join(self.queue_dir, 'pending', '*.json'))):
+            job_id = os.path.splitext(os.path.basename(path))[0]
+
+            try:
+                os.rename(path, self.__path('claimed', job_id))
+            except OSError:
+                # another worker claimed it first
+                continue
+
+            try:
+                # the rename keeps the submission mtime, which reclaim_stale would take for a stale claim
+                os.utime(self.__path('claimed', job_id), None)
+
+                with open(self.__path('claimed', job_id), 'r') as reader:
+                    job = json.load(reader)
+            except OSError:
+                # another worker took it back as stale between the rename and the utime
+                continue
+
+            job['claim'] = uuid.uuid4().hex
+            self.claims[job_id] = job['claim']
+
+            self.__write(self.__path('claimed', job_id), job)
+
+            return job_id, job['configuration']
+
+        return None
+
+    def heartbeat(self, job_id):
+        try:
+            os.utime(self.__path('claimed', job_id), None)
+        except OSError:
+            pass
+
+    def complete(self, job_id, result):
+        self.__finish(job_id, 'done', result)
+
+    def fail(self, job_id, result):
+        self.__finish(job_id, 'failed', result)
+
+    def reclaim_stale(self):
+        reclaimed = []
+
+        for path in glob(os.path.join(self.queue_dir, 'claimed', '*.json')):
+            try:
+                if time.time() - os.path.getmtime(path) < self.stale_seconds:
+                    continue
+
+                job_id = os.path.splitext(os.path.basename(path))[0]
+                os.rename(path, self.__path('pending', job_id))
+            except OSError:
+                continue
+
+            reclaimed.append(job_id)
+
+        return reclaimed
+
+    def work(self, research_interface, setup_fn, if_exists='skip', max_jobs=None):
+        finished = 0
+
+        while max_jobs is None or finished < max_jobs:
+            self.reclaim_stale()
+
+            claimed = self.claim()
+
+            if claimed is None:
+                break
+
+            job_id, configuration = claimed
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self.__beat, args=(job_id, stop), daemon=True)
+            heartbeat.start()
+
+            try:
+                result = run_configuration((research_interface, configuration, setup_fn, if_exists))
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            result['host'] = socket.gethostname()
+            result['pid'] = os.getpid()
+
+            # a skipped run only counts as done when it really finished
+            if result['status'] == 'skipped' and not os.path.exists(os.path.join(result['experiment_dir'],
+                                                                                 'eval.pkl')):
+                result['status'] = 'failed'
+                result['error'] = 'the experiment directory exists but has no eval.pkl'
+
+            if result['status'] == 'failed':
+                self.fail(job_id, result)
+            else:
+                self.complete(job_id, result)
+
+            finished += 1
+
+        return finished
+
+    def __beat(self, job_id, stop):
+        while not stop.wait(self.heartbeat_seconds):
+            self.heartbeat(job_id)
+
+    def __finish(self, job_id, state, result):
+        token = self.claims.pop(job_id, None)
+
+        self.__write(self.__path(state, job_id), result)
+
+        # the claim normally is still ours, but it may have gone stale and been moved back to pending/ (and even
+        # claimed again by another worker) meanwhile
+        for owned_state in ['claimed', 'pending']:
+            self.__release(self.__path(owned_state, job_id), token)
+
+    def __release(self, path, token):
+        # taken out of the way first, so that nobody can claim it between the check and the removal
+        private_path = '{}.{}.release'.format(path, uuid.uuid4().hex)
+
+        try:
+            os.rename(path, private_path)
+        except OSError:
+            return False
+
+        with open(private_path, 'r') as reader:
+            owned = token is not None and json.load(reader).get('claim') == token
+
+        if owned:
+            os.remove(private_path)
+        else:
+            os.rename(private_path, path)
+
+        return owned
+
+    def __write(self, path, content):
+        temp_path = os.path.join(self.queue_dir, '{}.{}.tmp'.format(os.path.basename(path), uuid.uuid4().hex))
+
+        with open(temp_path, 'w') as writer:
+            json.dump(content, writer)
+
+        os.replace(temp_path, path)
+
+    def __path(self, state, job_id):
+        return os.path.join(self.queue_dir, state, job_id + '.json')
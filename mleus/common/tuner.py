@@ -0,0 +1,212 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import time
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from mleus.common.batcher import Batcher
+from mleus.common.experiment import BatchPreparer
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as reader:
+            resident_pages = int(reader.read().split()[1])
+
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError):
+        if resource is None:
+            return 0.0
+
+        # ru_maxrss is the lifetime peak (kilobytes on linux, bytes on macos), the best available fallback
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return peak / (1024.0 * 1024.0) if peak > 1 << 32 else peak / 1024.0
+
+
+class PeakRSSMonitor(object):
+    """
+    Peak RSS of the process between start and stop. On linux the kernel's high-water mark (VmHWM) is reset
+    through /proc/self/clear_refs and read back, elsewhere a thread samples the RSS every interval seconds.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+
+        self.__sampler = None
+        self.__stopped = threading.Event()
+
+    def start(self):
+        self.peak_mb = current_rss_mb()
+        self.__stopped.clear()
+
+        try:
+            with open('/proc/self/clear_refs', 'w') as writer:
+                writer.write('5')
+
+            self.__sampler = None
+        except (IOError, OSError):
+            self.__sampler = threading.Thread(target=self.__sample, daemon=True)
+            self.__sampler.start()
+
+        return self
+
+    def stop(self):
+        if self.__sampler is not None:
+            self.__stopped.set()
+            self.__sampler.join()
+            self.__sampler = None
+        else:
+            self.peak_mb = max(self.peak_mb, PeakRSSMonitor.__high_water_mark_mb())
+
+        return self.peak_mb
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __sample(self):
+        while not self.__stopped.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    @staticmethod
+    def __high_water_mark_mb():
+        try:
+            with open('/proc/self/status', 'r') as reader:
+                for line in reader:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024.0
+        except (IOError, OSError, ValueError):
+            pass
+
+        return current_rss_mb()
+
+
+class BatchSizeTuner(object):
+    """
+    Probes growing batch sizes with short Batcher + encode + fit_batch trials and picks the fastest one
+    whose peak RSS stays within memory_budget_mb.
+
+    The trials really call trainer.fit_batch, so pass a throwaway trainer or treat them as warm-up steps.
+    """
+
+    def __init__(self, trainer, encoder, data, data_axis,
+                 transformations=None,
+                 class2index=None,
+                 memory_budget_mb=None,
+                 start_batch_size=8,
+                 max_batch_size=4096,
+                 trial_steps=5):
+        self.trainer = trainer
+        self.data = data
+        self.memory_budget_mb = memory_budget_mb
+        self.start_batch_size = start_batch_size
+        self.max_batch_size = max_batch_size
+        self.trial_steps = trial_steps
+
+        self.prepare = BatchPreparer(encoder, data_axis, transformations=transformations, class2index=class2index)
+        self.trials = []
+        self.best_batch_size = None
+
+    def run(self):
+        batch_size = self.start_batch_size
+
+        while batch_size <= self.max_batch_size:
+            trial = self.__trial(batch_size)
+
+            if trial is None:
+                break
+
+            self.trials.append(trial)
+
+            print('batch size: {}\tsamples/sec: {:0.1f}\tpeak rss: {:0.1f} MB'.format(batch_size,
+                                                                                    trial['samples_per_sec'],
+                                                                                    trial['peak_rss_mb']))
+
+            if self.memory_budget_mb is not None and trial['peak_rss_mb'] > self.memory_budget_mb:
+                break
+
+            batch_size *= 2
+
+        fitting = [trial for trial in self.trials
+                   if self.memory_budget_mb is None or trial['peak_rss_mb'] <= self.memory_budget_mb]
+
+        if len(fitting) == 0:
+            raise ValueError('no batch size starting from {} fits in {} MB'.format(self.start_batch_size,
+                                                                                    self.memory_budget_mb))
+
+        self.best_batch_size = max(fitting, key=lambda trial: trial['samples_per_sec'])['batch_size']
+
+        return self.best_batch_size
+
+    def apply_to(self, experiment):
+        """
+        Sets the tuned batch size of an experiment before its create(), which names its directory and index
+        entry after the batch size.
+        """
+        if experiment.info_file_path is not None:
+            raise ValueError('apply the tuned batch size before creating the experiment, {} is named after '
+                             'batch size {}'.format(experiment.experiment_dir, experiment.batch_size))
+
+        experiment.batch_size = self.best_batch_size
+
+    def __trial(self, batch_size):
+        batcher = Batcher(self.data, batch_size=batch_size, zero_copy=True)
+
+        if batcher.total_train_samples < batch_size:
+            return None
+
+        samples, elapsed = 0, 0.0
+        batches = batcher.iter_batches(target='train')
+        monitor = PeakRSSMonitor().start()
+
+        try:
+            # the first step is a warm-up and is not timed
+            for step in range(self.trial_steps + 1):
+                start = time.perf_counter()
+
+                current_batch = next(batches, None)
+
+                if current_batch is None:
+                    break
+
+                x_train, y_train = self.prepare(current_batch)
+                self.trainer.fit_batch(x_train, y_train)
+
+                if step > 0:
+                    elapsed += time.perf_counter() - start
+                    samples += len(current_batch)
+        except (MemoryError, RuntimeError) as error:
+            if isinstance(error, RuntimeError) and 'out of memory' not in str(error):
+                raise
+
+            return None
+        finally:
+            peak_rss = monitor.stop()
+            batches.close()
+
+        if samples == 0:
+            return None
+
+        return {'batch_size': batch_size,
+                'samples_per_sec': samples / max(elapsed, 1e-9),
+                'peak_rss_mb': peak_rss}
@@ -0,0 +1,53 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import shutil
+import contextlib
+import multiprocessing
+
+
+def process_context():
+    """
+    Fork where available, so that worker processes share the parent's memory (data, models) copy-on-write
+    instead of receiving a pickled copy of it.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+
+    return multiprocessing.get_context()
+
+
+@contextlib.contextmanager
+def atomic_directory(directory, temp_dir=None):
+    """
+    Yields a temporary directory to fill, which replaces directory when the block exits without error, so
+    directory only ever appears complete. The temporary directory is removed otherwise.
+    """
+    temp_dir = temp_dir if temp_dir is not None else directory + '.tmp'
+
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+
+    os.makedirs(temp_dir)
+
+    try:
+        yield temp_dir
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+        os.rename(temp_dir, directory)
+    finally:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
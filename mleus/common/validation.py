@@ -0,0 +1,117 @@
+# Copyright (c) 2018-present, Ahmed H. Al-Ghidani.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+__author__ = "Ahmed H. Al-Ghidani"
+__copyright__ = "Copyright 2018, The mleus Project, https://github.com/AhmedHani/mleus"
+__license__ = "BSD 3-Clause License"
+__maintainer__ = "Ahmed H. Al-Ghidani"
+__email__ = "ahmed.hani.ibrahim@gmail.com"
+
+import os
+import queue
+import traceback
+
+from mleus.common.evaluator import SupervisedEvaluator
+from mleus.common.utils import process_context
+
+
+def _validate_snapshots(trainer, batcher, prepare, jobs, results):
+    while True:
+        job = jobs.get()
+
+        if job is None:
+            return
+
+        try:
+            trainer.load(job['snapshot'])
+            trainer.complete_conf_matrix = None
+
+            for current_batch in batcher.iter_batches(target='valid'):
+                x_valid, y_valid = prepare(current_batch)
+                trainer.eval_batch(x_valid, y_valid)
+
+            if trainer.complete_conf_matrix is None:
+                job['results'] = {}
+            else:
+                job['results'] = SupervisedEvaluator.compute_metrics(trainer.complete_conf_matrix)
+        except Exception:
+            job['error'] = traceback.format_exc()
+
+        results.put(job)
+
+
+class BackgroundValidator(object):
+    """
+    Evaluates weight snapshots on the valid split in a separate process while the training continues.
+
+    The evaluator process is started with its own copy of the trainer, batcher and batch preparer (forked where
+    available), submit saves the current weights with trainer.save and poll returns the finished validations.
+    At most max_pending snapshots wait for evaluation, newer ones are dropped until the evaluator catches up.
+    """
+
+    def __init__(self, trainer, batcher, prepare, snapshot_dir, max_pending=2):
+        self.snapshot_dir = snapshot_dir
+        self.max_pending = max_pending
+        self.pending = 0
+
+        if not os.path.exists(self.snapshot_dir):
+            os.makedirs(self.snapshot_dir)
+
+        context = process_context()
+
+        self.jobs = context.Queue()
+        self.results = context.Queue()
+
+        self.process = context.Process(target=_validate_snapshots,
+                                       args=(trainer, batcher, prepare, self.jobs, self.results),
+                                       daemon=True)
+        self.process.start()
+
+    def submit(self, trainer, state):
+        if self.pending >= self.max_pending:
+            return False
+
+        snapshot = os.path.join(self.snapshot_dir, 'step-{:09d}.pt'.format(state['step']))
+        trainer.save(snapshot)
+
+        self.jobs.put({'snapshot': snapshot, 'state': state})
+        self.pending += 1
+
+        return True
+
+    def poll(self, block=False):
+        finished = []
+
+        while self.pending > 0:
+            try:
+                job = self.results.get(timeout=1.0) if block else self.results.get_nowait()
+            except queue.Empty:
+                if not block:
+                    break
+
+                if not self.process.is_alive():
+                    raise RuntimeError('the background validation process exited unexpectedly')
+
+                continue
+
+            self.pending -= 1
+
+            if 'error' in job:
+                raise RuntimeError('background validation of {} failed:\n{}'.format(job['snapshot'], job['error']))
+
+            finished.append(job)
+
+        return finished
+
+    def close(self):
+        try:
+            finished = self.poll(block=True)
+        finally:
+            self.jobs.put(None)
+            self.process.join()
+
+        return finished
@@ -51,6 +51,7 @@ class TextEncoder(object):
 class _WordEmbeddingLoader(object):
 
     def __init__(self, model_name):
+        self.model_name = model_name
         self.__load_embeddings(model_name)
 
     def encode(self, text):
@@ -278,6 +279,7 @@ class _CharEmbeddingLoader(object):
 class _BERTEmbedding(object):
 
     def __init__(self, model_name):
+        self.model_name = model_name
         self.__load_embeddings(model_name)
 
     def encode(self, text):
@@ -326,6 +328,7 @@ class _BERTEmbedding(object):
 class _ELMoEmbedding(object):
 
     def __init__(self, model_name):
+        self.model_name = model_name
         self.__load_embeddings(model_name)
 
     def encode(self, text):
@@ -0,0 +1,110 @@
+import json
+import numpy as np
+from mleus.common.batcher import Batcher
+from mleus.common.trainer import SupervisedTrainer
+
+
+CLASSES = ({'low': 0, 'high': 1}, {0: 'low', 1: 'high'})
+
+
+def threshold_data(size=100):
+    return [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(size)]
+
+
+class ThresholdModel(object):
+
+    def __call__(self, x):
+        return x
+
+    def calculate_gradient(self, prediction, y):
+        return 0.5
+
+    def optimize(self):
+        pass
+
+    def predict_classes(self, x):
+        return [int(value >= 50) for value in x]
+
+    def save_weights(self, path):
+        with open(path, 'w') as writer:
+            json.dump({'threshold': 50}, writer)
+
+    def load_weights(self, path):
+        pass
+
+    def args(self):
+        return {'threshold': 50}
+
+
+class RecordingModel(ThresholdModel):
+
+    def __init__(self, interrupt_at=None):
+        self.seen = []
+        self.interrupt_at = interrupt_at
+
+    def __call__(self, x):
+        self.seen.append(list(x))
+
+        return x
+
+    def calculate_gradient(self, prediction, y):
+        if len(self.seen) == self.interrupt_at:
+            raise KeyboardInterrupt()
+
+        return 0.5
+
+    def save_weights(self, path):
+        with open(path, 'w') as writer:
+            json.dump(self.seen, writer)
+
+    def load_weights(self, path):
+        with open(path, 'r') as reader:
+            self.seen = json.load(reader)
+
+
+class LengthModel(object):
+    """
+    Predicts 'long' (1) for the encoded texts of at least threshold tokens, the threshold is its only weight.
+    """
+
+    def __init__(self, threshold=3):
+        self.threshold = threshold
+        self.batch_sizes = []
+
+    def predict_probs(self, x):
+        self.batch_sizes.append(len(x))
+
+        return [[float(len(row) < self.threshold), float(len(row) >= self.threshold)] for row in x]
+
+    def predict_classes(self, x):
+        return [int(np.argmax(probs)) for probs in self.predict_probs(x)]
+
+    def save_weights(self, path):
+        with open(path, 'w') as writer:
+            json.dump({'threshold': self.threshold}, writer)
+
+    def load_weights(self, path):
+        with open(path, 'r') as reader:
+            self.threshold = json.load(reader)['threshold']
+
+    def args(self):
+        return {'threshold': 0}
+
+
+class IdentityEncoder(object):
+
+    def encode(self, X):
+        return X
+
+
+def lower(X, suffix=''):
+    return [sentence.lower() + suffix for sentence in X]
+
+
+def grid_setup(configuration):
+    return {'trainer': SupervisedTrainer(ThresholdModel(), CLASSES),
+            'batcher': Batcher(threshold_data(), batch_size=configuration['batch_size'], zero_copy=True),
+            'encoder': IdentityEncoder(),
+            'data_axis': {'X': 'x', 'Y': 'y'},
+            'class2index': CLASSES[0],
+            'index2class': CLASSES[1]}
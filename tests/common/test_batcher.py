@@ -1,5 +1,14 @@
 import unittest
-from mleus.common.batcher import Batcher
+import multiprocessing
+import numpy as np
+from mleus.common.batcher import Batcher, CollateWorkers, BucketBatcher, MixingBatcher, StreamingBatcher, WeightedBatcher
+
+
+def _rank_batches(rank):
+    batcher = Batcher(list(range(103)), batch_size=4, zero_copy=True, rank=rank, world_size=3)
+    batcher.shuffle_me('train')
+
+    return batcher.permutation[batcher.train_start_idx:batcher.train_end_idx + 1].tolist()
 
 
 class TestBatcher(unittest.TestCase):
@@ -27,3 +36,220 @@ class TestBatcher(unittest.TestCase):
         self.assertEqual(batcher.total_valid_batches, 1)
         self.assertEqual(batcher.total_test_batches, 1)
 
+    def test_zero_copy_batcher(self):
+        data = list(range(100))
+        batcher = Batcher(data, batch_size=8, zero_copy=True)
+
+        self.assertIs(batcher.data, data)
+        self.assertEqual(data, list(range(100)))
+        self.assertEqual(sorted(batcher.train_data + batcher.valid_data + batcher.test_data), data)
+
+        batch = batcher.nextbatch(target='train')
+        self.assertEqual(batch, batcher.permutation[:8].tolist())
+
+        before = sorted(batcher.permutation[:80].tolist())
+        batcher.shuffle_me('train')
+        self.assertEqual(sorted(batcher.permutation[:80].tolist()), before)
+
+        # the last train sample takes part in the shuffle too
+        last = batcher.permutation[79]
+        moved = False
+
+        for _ in range(20):
+            batcher.shuffle_me('train')
+            moved = moved or batcher.permutation[79] != last
+
+        self.assertTrue(moved)
+
+        array_data = np.arange(200).reshape(100, 2)
+        batcher = Batcher(array_data, batch_size=8, zero_copy=True)
+        batch = batcher.nextbatch(target='valid')
+
+        self.assertEqual(batch.shape, (8, 2))
+        self.assertTrue(np.array_equal(batch[:, 0], batcher.permutation[80:88] * 2))
+
+    def test_iter_batches_prefetch(self):
+        data = list(range(100))
+
+        batcher = Batcher(data, batch_size=8, zero_copy=True)
+        expected = list(batcher.iter_batches(target='train'))
+
+        batcher = Batcher(data, batch_size=8, zero_copy=True)
+        prefetched = list(batcher.iter_batches(target='train', prefetch=2, collate_fn=sorted))
+
+        self.assertEqual(prefetched, [sorted(batch) for batch in expected])
+
+        batches = batcher.iter_batches(target='train', prefetch=2)
+        next(batches)
+        batches.close()
+
+    def test_streaming_batcher(self):
+        def source():
+            for i in range(1000):
+                yield ('sample {}'.format(i), i % 2)
+
+        batcher = StreamingBatcher(source, batch_size=16, buffer_size=50, key=lambda record: record[0])
+
+        train = [record for current_batch in batcher.iter_batches(target='train') for record in current_batch]
+        valid = [record for current_batch in batcher.iter_batches(target='valid') for record in current_batch]
+        test = [record for current_batch in batcher.iter_batches(target='test') for record in current_batch]
+
+        self.assertEqual(len(train) + len(valid) + len(test), 1000)
+        self.assertEqual(len(set(train) & set(valid)), 0)
+        self.assertTrue(700 < len(train) < 900)
+        self.assertNotEqual(train, sorted(train, key=lambda record: int(record[0].split()[1])))
+
+        other = StreamingBatcher(source, batch_size=16, key=lambda record: record[0])
+        self.assertEqual([other.split_of(record) for record in valid], ['valid'] * len(valid))
+
+        batcher.initialize()
+        reshuffled = [record for current_batch in batcher.iter_batches(target='train') for record in current_batch]
+        self.assertEqual(sorted(reshuffled), sorted(train))
+        self.assertNotEqual(reshuffled, train)
+
+        # a generator would be exhausted by the first split
+        with self.assertRaises(TypeError):
+            StreamingBatcher(source())
+
+        self.assertEqual(sum(len(current_batch) for target in ['train', 'valid', 'test']
+                             for current_batch in StreamingBatcher(list(source())).iter_batches(target=target)), 1000)
+
+    def test_bucket_batcher(self):
+        random_state = np.random.RandomState(0)
+        data = [' '.join(['w'] * length) for length in random_state.randint(1, 60, size=500)]
+
+        def words(sentence):
+            return len(sentence.split())
+
+        batcher = BucketBatcher(data, length_fn=words, batch_size=16, max_tokens=200, window_size=100)
+
+        seen = 0
+
+        for current_batch in batcher.iter_batches(target='train'):
+            lengths = [words(sentence) for sentence in current_batch]
+
+            self.assertLessEqual(len(current_batch), 16)
+            self.assertTrue(len(current_batch) == 1 or len(current_batch) * max(lengths) <= 200)
+            seen += len(current_batch)
+
+        self.assertEqual(seen, batcher.total_train_samples)
+        self.assertGreater(batcher.total_batches('valid'), 0)
+
+    def test_rank_sharding(self):
+        pool = multiprocessing.Pool(3)
+        shards = pool.map(_rank_batches, range(3))
+        pool.close()
+        pool.join()
+
+        self.assertEqual([len(shard) for shard in shards], [28, 28, 28])
+        self.assertEqual(len(set(shards[0]) | set(shards[1]) | set(shards[2])), 82)
+
+        dropped = Batcher(list(range(103)), batch_size=4, zero_copy=True, rank=1, world_size=3, drop_last=True)
+        self.assertEqual(dropped.total_train_samples, 27)
+        self.assertEqual(dropped.total_valid_samples, 3)
+
+    def test_resume_from_state(self):
+        data = list(range(200))
+
+        batcher = Batcher(data, batch_size=8, zero_copy=True)
+        batcher.set_epoch(3)
+        batcher.nextbatch(target='train')
+        batcher.nextbatch(target='train')
+        state = batcher.state_dict()
+        expected = list(batcher.iter_batches(target='train'))
+
+        resumed = Batcher(data, batch_size=8, zero_copy=True)
+        resumed.load_state_dict(state)
+
+        self.assertEqual(list(resumed.iter_batches(target='train')), expected)
+
+        resumed.seek_global(3 * resumed.steps_per_epoch + 2)
+        self.assertEqual(resumed.state_dict(), state)
+
+        bucketed = BucketBatcher(data, length_fn=lambda item: item % 7, batch_size=8)
+        bucketed.set_epoch(2)
+        bucketed.nextbatch(target='train')
+        state = bucketed.state_dict()
+        expected = list(bucketed.iter_batches(target='train'))
+
+        resumed = BucketBatcher(data, length_fn=lambda item: item % 7, batch_size=8)
+        resumed.load_state_dict(state)
+
+        self.assertEqual([batch for batch in resumed.iter_batches(target='train')], expected)
+
+        state = Batcher(data, batch_size=8, zero_copy=True, rank=1, world_size=2).state_dict()
+
+        with self.assertRaises(ValueError):
+            Batcher(data, batch_size=8, zero_copy=True, rank=0, world_size=2).load_state_dict(state)
+
+        with self.assertRaises(ValueError):
+            Batcher(data, batch_size=8, zero_copy=True).load_state_dict(state)
+
+    def test_weighted_batcher(self):
+        data = [('sample {}'.format(i), 'rare' if i % 10 == 0 else 'common') for i in range(1000)]
+
+        batcher = WeightedBatcher(data, label_axis=1, batch_size=50, steps_per_epoch=40)
+        labels = [item[1] for current_batch in batcher.iter_batches(target='train') for item in current_batch]
+
+        self.assertEqual(len(labels), 2000)
+        self.assertTrue(0.4 < labels.count('rare') / 2000.0 < 0.6)
+
+        batcher.seek(5)
+        batch = batcher.nextbatch(target='train')
+        batcher.seek(5)
+        self.assertEqual(batcher.nextbatch(target='train'), batch)
+
+        weights = [0.0 if item[1] == 'rare' else 1.0 for item in data]
+        batcher = WeightedBatcher(data, weights=weights, batch_size=50)
+        labels = [item[1] for current_batch in batcher.iter_batches(target='train') for item in current_batch]
+
+        self.assertEqual(set(labels), {'common'})
+        self.assertEqual(batcher.total_batches('valid'), 2)
+
+    def test_mixing_batcher(self):
+        small = ['small {}'.format(i) for i in range(100)]
+
+        def large():
+            for i in range(5000):
+                yield 'large {}'.format(i)
+
+        batcher = MixingBatcher([small, large], weights=[100, 5000], temperature=5.0, batch_size=20,
+                                steps_per_epoch=50)
+        samples = [item for current_batch in batcher.iter_batches(target='train') for item in current_batch]
+
+        self.assertEqual(len(samples), 1000)
+        ratio = len([item for item in samples if item.startswith('small')]) / 1000.0
+        expected = 100 ** 0.2 / (100 ** 0.2 + 5000 ** 0.2)
+        self.assertTrue(abs(ratio - expected) < 0.06)
+
+        valid = [item for current_batch in batcher.iter_batches(target='valid') for item in current_batch]
+        self.assertTrue(any(item.startswith('small') for item in valid))
+        self.assertTrue(any(item.startswith('large') for item in valid))
+
+        # the size of the stream is unknown, so is its default weight
+        with self.assertRaises(ValueError):
+            MixingBatcher([small, large], batch_size=20, steps_per_epoch=50)
+
+        batcher = MixingBatcher([small, ['other {}'.format(i) for i in range(300)]], batch_size=20)
+        epochs = []
+
+        for epoch in range(2):
+            batcher.set_epoch(epoch)
+            epochs.append([item for current_batch in batcher.iter_batches(target='train') for item in current_batch])
+
+        # every source is reshuffled for the epoch, not only the choice of the source
+        small_orders = [[item for item in samples if item.startswith('small')][:10] for samples in epochs]
+        self.assertNotEqual(small_orders[0], small_orders[1])
+        self.assertEqual(batcher.sources[0].epoch, 1)
+
+    def test_collate_workers(self):
+        data = list(range(100))
+
+        batcher = Batcher(data, batch_size=8, zero_copy=True)
+        expected = [sorted(batch) for batch in batcher.iter_batches(target='train')]
+
+        with CollateWorkers(sorted, 3, max_in_flight=4) as workers:
+            batcher = Batcher(data, batch_size=8, zero_copy=True)
+
+            self.assertEqual(list(batcher.iter_batches(target='train', prefetch=2, workers=workers)), expected)
+            self.assertEqual(list(batcher.iter_batches(target='train', workers=workers)), expected)
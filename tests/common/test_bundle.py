@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+import functools
+import unittest
+import numpy as np
+from mleus.common.trainer import SupervisedTrainer
+from mleus.common.bundle import load_bundle, save_bundle, BundleEncoder
+from tests.common.fixtures import LengthModel, lower
+
+
+class _WordIndexLoader(object):
+
+    def __init__(self, word2indexes):
+        self.word2indexes = word2indexes
+
+    def encode(self, text):
+        return [[self.word2indexes.get(word, 3) for word in sentence.split()] for sentence in text]
+
+
+class _TextEncoder(object):
+
+    def __init__(self, word2indexes):
+        self.model = _WordIndexLoader(word2indexes)
+
+    def encode(self, text):
+        return self.model.encode(text)
+
+
+class _KeyedVectors(object):
+
+    def __init__(self, vectors):
+        self.index_to_key = list(vectors.keys())
+        self.vectors = np.asarray(list(vectors.values()), dtype=np.float32)
+
+
+class _FlairWordEmbeddings(object):
+
+    def __init__(self, vectors):
+        self.precomputed_word_embeddings = _KeyedVectors(vectors)
+
+
+class _WordEmbeddingLoader(object):
+    """
+    Stands for TextEncoder's flair loader, encode follows the lookup of flair's WordEmbeddings.
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.__model = _FlairWordEmbeddings(vectors)
+
+    def encode(self, text):
+        return [[self.__vector(word) for word in sentence.split()] for sentence in text]
+
+    def __vector(self, word):
+        for candidate in (word, word.lower(), re.sub(r'\d', '#', word.lower()), re.sub(r'\d', '0', word.lower())):
+            if candidate in self.vectors:
+                return [float(value) for value in self.vectors[candidate]]
+
+        return [0.0, 0.0]
+
+
+class _UpperEncoder(object):
+
+    def encode(self, text):
+        return [sentence.upper().split() for sentence in text]
+
+
+class _Preprocessor(object):
+
+    @staticmethod
+    def strip_punctuation(X):
+        return [sentence.replace('.', '').replace('!', '') for sentence in X]
+
+    @staticmethod
+    def pad(X, size=2, token='<pad>'):
+        return [' '.join((sentence.split() + [token] * size)[:max(size, len(sentence.split()))]) for sentence in X]
+
+
+def _truncate(X, size=3):
+    return [' '.join(sentence.split()[:size]) for sentence in X]
+
+
+class TestBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.bundle_dir = os.path.join(tempfile.mkdtemp(), 'bundle')
+        self.trainer = SupervisedTrainer(LengthModel(threshold=3), ({'short': 0, 'long': 1}, {0: 'short', 1: 'long'}))
+        self.transformations = [lower, functools.partial(_truncate, size=4)]
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.bundle_dir))
+
+    def test_vocabulary_bundle(self):
+        encoder = _TextEncoder({'the': 4, 'cat': 5, 'sat': 6, 'on': 7, 'mat': 8, 'caterpillar': 9})
+        save_bundle(self.bundle_dir, self.trainer, encoder, self.transformations)
+
+        with open(os.path.join(self.bundle_dir, 'bundle.json'), 'r') as reader:
+            manifest = json.load(reader)
+
+        self.assertEqual(manifest['encoder']['type'], 'word_index')
+        self.assertEqual(manifest['transformations'][1]['kwargs'], {'size': 4})
+        self.assertFalse(os.path.exists(os.path.join(self.bundle_dir, 'encoder.pkl')))
+
+        predictor = load_bundle(self.bundle_dir)
+
+        self.assertIsInstance(predictor.encoder, BundleEncoder)
+        self.assertIsInstance(predictor.encoder.vocabulary, np.memmap)
+
+        texts = ['The CAT sat on the mat', 'the dog', 'Caterpillars <pad> cat']
+        expected = encoder.encode(self.transformations[1](lower(texts)))
+        expected[2][1] = 2
+
+        self.assertEqual(predictor.encode(texts), expected)
+        self.assertEqual(predictor.predict(texts), ['long', 'short', 'long'])
+        self.assertEqual(predictor.predict_probs(['the dog']), [[1.0, 0.0]])
+
+        # the weights are loaded over the constructor arguments
+        self.assertEqual(predictor.model.threshold, 3)
+        self.assertEqual(predictor.classes, ['short', 'long'])
+
+    def test_embedding_bundle(self):
+        encoder = _WordEmbeddingLoader({'the': [1.0, 0.0], 'Cat': [0.0, 1.0], 'cat': [0.5, 0.5], '####': [2.0, 2.0],
+                                        'room00': [3.0, 3.0]})
+        save_bundle(self.bundle_dir, self.trainer, encoder)
+
+        predictor = load_bundle(self.bundle_dir)
+        texts = ['The Cat cat CAT', 'in 1999 Room42 zzz']
+
+        self.assertEqual(predictor.encoder.spec['type'], 'embedding')
+        self.assertEqual(predictor.encode(texts), encoder.encode(texts))
+
+    def test_pickle_fallback(self):
+        save_bundle(self.bundle_dir, self.trainer, _UpperEncoder(), [lower])
+
+        predictor = load_bundle(self.bundle_dir)
+
+        self.assertEqual(predictor.encode(['A b']), [['A', 'B']])
+        self.assertEqual(predictor.predict(['a b c d']), ['long'])
+
+    def test_nested_transformations(self):
+        transformations = [_Preprocessor.strip_punctuation, functools.partial(_Preprocessor.pad, size=3)]
+        save_bundle(self.bundle_dir, self.trainer, _UpperEncoder(), transformations)
+
+        with open(os.path.join(self.bundle_dir, 'bundle.json'), 'r') as reader:
+            manifest = json.load(reader)
+
+        self.assertEqual(manifest['transformations'][1]['qualname'], '_Preprocessor.pad')
+
+        predictor = load_bundle(self.bundle_dir)
+
+        self.assertIs(predictor.transformations[0], _Preprocessor.strip_punctuation)
+        self.assertEqual(predictor.encode(['hi there!']), [['HI', 'THERE', '<PAD>']])
+        self.assertEqual(predictor.predict(['a.']), ['long'])
+
+    def test_unsupported_transformation(self):
+        with self.assertRaises(ValueError):
+            save_bundle(self.bundle_dir, self.trainer, _UpperEncoder(), [lambda X: X])
+
+        # a set argument cannot be written to bundle.json
+        with self.assertRaises(ValueError):
+            save_bundle(self.bundle_dir, self.trainer, _UpperEncoder(), [functools.partial(lower, suffix={'!'})])
+
+        self.assertFalse(os.path.exists(self.bundle_dir))
+
+    def test_version(self):
+        save_bundle(self.bundle_dir, self.trainer, _UpperEncoder())
+
+        manifest_file = os.path.join(self.bundle_dir, 'bundle.json')
+
+        with open(manifest_file, 'r') as reader:
+            manifest = json.load(reader)
+
+        manifest['version'] += 1
+
+        with open(manifest_file, 'w') as writer:
+            json.dump(manifest, writer)
+
+        with self.assertRaises(ValueError):
+            load_bundle(self.bundle_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import threading
+import functools
+import unittest
+import numpy as np
+from mleus.common.batcher import Batcher
+from mleus.common.cache import EncodedCache, pipeline_fingerprint
+from mleus.common.experiment import BatchPreparer
+from tests.common.fixtures import lower
+
+
+class _CountingEncoder(object):
+
+    def __init__(self, dims=3):
+        self.dims = dims
+        self.encoded = 0
+
+    def encode(self, X):
+        self.encoded += len(X)
+
+        return [[[float(len(word))] * self.dims for word in sentence.split()] for sentence in X]
+
+
+class _VocabularyEncoder(object):
+
+    def __init__(self, word2indexes):
+        self.word2indexes = word2indexes
+        self.unknown = np.int64(3)
+
+    def encode(self, X):
+        return [[self.word2indexes.get(word, int(self.unknown)) for word in sentence.split()] for sentence in X]
+
+
+class _LockedEncoder(_VocabularyEncoder):
+
+    def __init__(self, word2indexes):
+        super(_LockedEncoder, self).__init__(word2indexes)
+        self.lock = threading.Lock()
+
+
+class _EmbeddingEncoder(object):
+
+    def encode(self, X):
+        return [[[float(len(word)), 1.0] for word in sentence.split()] for sentence in X]
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.data = [{'x': 'Sentence Number ' + 'w' * (i % 7 + 1), 'y': i % 2} for i in range(60)]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def __preparer(self, cache, encoder, transformations=(lower,)):
+        prepare = BatchPreparer(encoder, {'X': 'x', 'Y': 'y'}, transformations=list(transformations))
+
+        return prepare, cache.preparer(prepare, batcher=Batcher(self.data, batch_size=8, zero_copy=True))
+
+    def test_rows_are_encoded_once(self):
+        cache = EncodedCache(self.cache_dir)
+        encoder = _CountingEncoder()
+        prepare, cached_prepare = self.__preparer(cache, encoder)
+
+        # only the 7 distinct sentences are encoded
+        self.assertEqual(encoder.encoded, 7)
+
+        current_batch = self.data[:8]
+        x, y = cached_prepare(current_batch)
+
+        self.assertEqual((x, y), prepare(current_batch))
+        self.assertEqual(encoder.encoded, 7 + 8)
+
+        other_encoder = _CountingEncoder()
+        _, cached_prepare = self.__preparer(cache, other_encoder)
+        self.assertEqual(other_encoder.encoded, 0)
+
+        x, _ = cached_prepare(self.data[:3] + [{'x': 'unseen sentence', 'y': 0}])
+        self.assertEqual(x[-1], [[6.0] * 3, [8.0] * 3])
+        self.assertEqual(other_encoder.encoded, 1)
+
+    def test_pipeline_fingerprint(self):
+        cache = EncodedCache(self.cache_dir)
+
+        self.__preparer(cache, _CountingEncoder())
+        self.__preparer(cache, _CountingEncoder(dims=4))
+        self.__preparer(cache, _CountingEncoder(), transformations=[functools.partial(lower, suffix=' end')])
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+    def test_encoder_fingerprint(self):
+        def fingerprint(encoder):
+            return pipeline_fingerprint(BatchPreparer(encoder, {'X': 'x', 'Y': 'y'}))
+
+        # built from the vocabulary, not from the identity of the encoder
+        self.assertEqual(fingerprint(_VocabularyEncoder({'the': 4, 'cat': 5})),
+                         fingerprint(_VocabularyEncoder({'cat': 5, 'the': 4})))
+        self.assertNotEqual(fingerprint(_VocabularyEncoder({'the': 4, 'cat': 5})),
+                            fingerprint(_VocabularyEncoder({'the': 4, 'cat': 6})))
+
+        # an edited transformation of the same name is a different pipeline
+        def transformation(X):
+            return [sentence.lower() for sentence in X]
+
+        prepare = BatchPreparer(_CountingEncoder(), {'X': 'x', 'Y': 'y'}, [transformation])
+        before = pipeline_fingerprint(prepare)
+        transformation.__code__ = (lambda X: [sentence.upper() for sentence in X]).__code__
+
+        self.assertNotEqual(pipeline_fingerprint(prepare), before)
+
+        # a lock has no address free description, the cache refuses it instead of never hitting
+        with self.assertRaises(ValueError):
+            fingerprint(_LockedEncoder({'the': 4}))
+
+    def test_empty_rows(self):
+        sentences = ['the cat sat', 'a', 'on the mat', 'dog', 'hello world', 'x y']
+
+        for position in [0, 3, len(sentences)]:
+            data = [{'x': sentence, 'y': 0} for sentence in sentences[:position] + [''] + sentences[position:]]
+
+            for encoder in [_VocabularyEncoder({'the': 4, 'cat': 5}), _EmbeddingEncoder()]:
+                cache_dir = tempfile.mkdtemp(dir=self.cache_dir)
+                prepare = BatchPreparer(encoder, {'X': 'x', 'Y': 'y'})
+                cached_prepare = EncodedCache(cache_dir).preparer(prepare, batcher=Batcher(data, batch_size=2,
+                                                                                           zero_copy=True))
+
+                x, _ = cached_prepare(data)
+
+                # repr tells the integer word indexes from floats, and the empty sentence stays empty
+                self.assertEqual(repr(x), repr(prepare(data)[0]))
+
+    def test_disagreeing_rows(self):
+        class MixedEncoder(object):
+
+            def encode(self, X):
+                return [[len(sentence)] if len(sentence) % 2 else [[len(sentence)], [0]] for sentence in X]
+
+        prepare = BatchPreparer(MixedEncoder(), {'X': 'x', 'Y': 'y'})
+        cached_prepare = EncodedCache(self.cache_dir).preparer(prepare, batcher=Batcher(self.data, batch_size=8,
+                                                                                        zero_copy=True))
+
+        self.assertEqual(cached_prepare(self.data[:10])[0], prepare(self.data[:10])[0])
+
+    def test_eviction(self):
+        cache = EncodedCache(self.cache_dir, max_size_mb=1e-6)
+
+        self.__preparer(cache, _CountingEncoder())
+        self.__preparer(cache, _CountingEncoder(dims=4))
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_ndarray_batches(self):
+        class ArrayEncoder(object):
+
+            def encode(self, X):
+                return np.asarray([[len(sentence), sentence.count(' ')] for sentence in X], dtype=np.int32)
+
+        prepare, cached_prepare = self.__preparer(EncodedCache(self.cache_dir), ArrayEncoder())
+        x, _ = cached_prepare(self.data[:5])
+
+        self.assertTrue(np.array_equal(x, prepare(self.data[:5])[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
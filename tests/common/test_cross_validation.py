@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from mleus.common.trainer import SupervisedTrainer
+from mleus.common.cross_validation import KFoldCrossValidation, kfold_indexes
+from tests.common.fixtures import CLASSES, IdentityEncoder, ThresholdModel
+
+
+def _setup(fold):
+    return SupervisedTrainer(ThresholdModel(), CLASSES), IdentityEncoder(), None, CLASSES[0]
+
+
+class TestCrossValidation(unittest.TestCase):
+
+    def test_kfold_indexes(self):
+        folds = kfold_indexes(103, k=4)
+        valid = np.concatenate([fold[1] for fold in folds])
+
+        self.assertEqual(sorted(valid.tolist()), list(range(103)))
+
+        for train_indexes, valid_indexes in folds:
+            self.assertEqual(len(set(train_indexes) & set(valid_indexes)), 0)
+            self.assertEqual(len(train_indexes) + len(valid_indexes), 103)
+
+    def test_parallel_folds(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+
+        cross_validation = KFoldCrossValidation(data, {'X': 'x', 'Y': 'y'}, k=4, batch_size=5, workers=2)
+        complete_conf_matrix = cross_validation.run(_setup)
+
+        self.assertEqual(len(cross_validation.folds_conf_matrices), 4)
+        self.assertEqual(complete_conf_matrix.sum(), 100)
+        self.assertEqual(np.trace(complete_conf_matrix), 100)
+
+    def test_uneven_folds(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(104)]
+
+        # folds of 26 samples, the last batch of every fold holds a single sample
+        cross_validation = KFoldCrossValidation(data, {'X': 'x', 'Y': 'y'}, k=4, batch_size=5, workers=1)
+
+        self.assertEqual(cross_validation.run(_setup).sum(), 104)
+
+        cross_validation = KFoldCrossValidation(data[:3], {'X': 'x', 'Y': 'y'}, k=4, batch_size=5, workers=1)
+
+        # with k > samples, one fold is empty and is left out
+        self.assertEqual(cross_validation.run(_setup).sum(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
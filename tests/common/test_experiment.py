@@ -0,0 +1,288 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import functools
+import unittest
+from mleus.common.batcher import Batcher, BucketBatcher, WeightedBatcher
+from mleus.common.trainer import SupervisedTrainer
+from mleus.common.cache import EncodedCache
+from mleus.common.experiment import SupervisedExperiment
+from mleus.common.metrics import NpySink
+from mleus.common.checkpoint import Checkpointer
+from mleus.common.results import data_fingerprint
+from tests.common.fixtures import IdentityEncoder, RecordingModel, ThresholdModel, lower
+
+
+class TestExperiment(unittest.TestCase):
+
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.research_interface = os.path.join(self.project_dir, 'research', 'threshold.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def __run(self, model=None, **kwargs):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        class2index, index2class = {'low': 0, 'high': 1}, {0: 'low', 1: 'high'}
+
+        batcher = Batcher(data, batch_size=4, zero_copy=True)
+        trainer = SupervisedTrainer(model if model is not None else ThresholdModel(), (class2index, index2class))
+
+        experiment = SupervisedExperiment(100, batcher.total_train_samples, batcher.total_valid_samples,
+                                          batcher.total_test_samples, 'threshold', 2, 4, 2, 1, 'cpu')
+        experiment.create(self.research_interface)
+        experiment.run(trainer, batcher, IdentityEncoder(), {'X': 'x', 'Y': 'y'},
+                       class2index=class2index, index2class=index2class, **kwargs)
+
+        return experiment, trainer
+
+    def test_run(self):
+        experiment, trainer = self.__run(num_workers=2, prefetch=2)
+
+        self.assertTrue(os.path.exists(experiment.pickle_file_path))
+        self.assertTrue(os.path.exists(os.path.join(experiment.saved_model_dir, 'weights.pt')))
+        self.assertEqual(trainer.complete_conf_matrix.sum(), 10)
+
+    def test_skipped_run(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        classes = ({'low': 0, 'high': 1}, {0: 'low', 1: 'high'})
+
+        def run():
+            batcher = Batcher(data, batch_size=4, zero_copy=True)
+            experiment = SupervisedExperiment(100, 80, 10, 10, 'threshold', 2, 4, 2, 1, 'cpu')
+            experiment.create(self.research_interface, if_exists='skip')
+
+            return experiment, experiment.run(SupervisedTrainer(ThresholdModel(), classes), batcher, IdentityEncoder(),
+                                              {'X': 'x', 'Y': 'y'}, class2index=classes[0], index2class=classes[1])
+
+        experiment, results = run()
+        skipped, skipped_results = run()
+
+        self.assertTrue(skipped.skipped)
+        self.assertEqual(skipped.experiment_dir, experiment.experiment_dir)
+        self.assertEqual(pickle.dumps(skipped_results), pickle.dumps(results))
+
+        # left behind by a run that never finished
+        os.remove(experiment.pickle_file_path)
+
+        with self.assertRaises(ValueError):
+            run()
+
+    def test_metrics_store(self):
+        experiment, trainer = self.__run()
+
+        train_loss = NpySink.read(experiment.metrics_dir, 'train_loss')
+        epoch_loss = NpySink.read(experiment.metrics_dir, 'epoch_loss')
+
+        self.assertEqual(train_loss.shape[1], 3)
+        self.assertEqual(train_loss[:, 0].tolist(), list(range(len(train_loss))))
+        self.assertEqual(epoch_loss[:, :2].tolist(), [[1, 0.5], [2, 0.5]])
+        self.assertTrue(os.path.exists(experiment.learning_curve_image))
+
+    def test_checkpoint_resume(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        classes = ({'low': 0, 'high': 1}, {0: 'low', 1: 'high'})
+
+        def run(name, model, **kwargs):
+            batcher = Batcher(data, batch_size=4, zero_copy=True)
+            experiment = SupervisedExperiment(100, 80, 10, 10, 'recording', 2, 4, 2, 1, 'cpu')
+            experiment.create(os.path.join(self.project_dir, 'research', name + '.py'))
+            experiment.run(SupervisedTrainer(model, classes), batcher, IdentityEncoder(), {'X': 'x', 'Y': 'y'},
+                           class2index=classes[0], index2class=classes[1], prefetch=2, **kwargs)
+
+            return experiment
+
+        full = RecordingModel()
+        run('full', full)
+
+        # the same run as 'full', which would otherwise be reused from the result store
+        interrupted = run('interrupted', RecordingModel(interrupt_at=13), checkpoint_every_steps=5, keep_checkpoints=2,
+                          force=True)
+        checkpoints_dir = os.path.join(interrupted.experiment_dir, 'checkpoints')
+
+        self.assertEqual([os.path.basename(path) for path in Checkpointer.list(checkpoints_dir)],
+                         ['step-000000005', 'step-000000010'])
+
+        resumed = RecordingModel()
+        run('resumed', resumed, resume_from=checkpoints_dir)
+
+        self.assertEqual(resumed.seen, full.seen)
+
+    def test_early_stopping_resume(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        classes = ({'low': 0, 'high': 1}, {0: 'low', 1: 'high'})
+
+        def run(name, model, **kwargs):
+            experiment = SupervisedExperiment(100, 80, 10, 10, 'recording', 2, 4, 2, 1, 'cpu')
+            experiment.create(os.path.join(self.project_dir, 'research', name + '.py'))
+            experiment.run(SupervisedTrainer(model, classes), Batcher(data, batch_size=4, zero_copy=True),
+                           IdentityEncoder(), {'X': 'x', 'Y': 'y'}, class2index=classes[0], index2class=classes[1],
+                           validate_every_steps=5, patience=2, force=True, **kwargs)
+
+            return experiment
+
+        full = RecordingModel()
+        run('full', full)
+
+        interrupted = run('interrupted', RecordingModel(interrupt_at=13), checkpoint_every_steps=5)
+        checkpoints_dir = os.path.join(interrupted.experiment_dir, 'checkpoints')
+
+        with open(os.path.join(checkpoints_dir, 'step-000000010', 'state.json'), 'r') as reader:
+            self.assertEqual(json.load(reader)['early_stopping'], {'best': 1.0, 'best_step': 5, 'stale': 1})
+
+        resumed = RecordingModel()
+        resumed_experiment = run('resumed', resumed, resume_from=checkpoints_dir)
+
+        # the patience carries over, so the resumed run stops at step 15 like the full one and keeps its best model
+        self.assertEqual(len(NpySink.read(resumed_experiment.metrics_dir, 'train_loss')), 5)
+        self.assertFalse(os.path.exists(os.path.join(resumed_experiment.experiment_dir, 'checkpoints', 'best')))
+        self.assertEqual(resumed.seen, full.seen)
+
+    def test_run_with_cache(self):
+        cache = EncodedCache.for_research(self.research_interface)
+        experiment, trainer = self.__run(cache=cache, num_workers=2)
+
+        self.assertEqual(len(os.listdir(cache.cache_dir)), 1)
+        self.assertEqual(trainer.complete_conf_matrix.sum(), 10)
+
+    def test_timings(self):
+        experiment, _ = self.__run()
+
+        with open(experiment.timings_file_path, 'r') as reader:
+            timings = json.load(reader)
+
+        for stage in ['nextbatch', 'transformations', 'encode', 'fit_batch', 'eval_batch', 'wait_batch']:
+            self.assertIn(stage, timings['stages'])
+            self.assertLessEqual(timings['stages'][stage]['p50_ms'], timings['stages'][stage]['p95_ms'])
+
+        self.assertEqual(timings['stages']['fit_batch']['count'], 2 * 20)
+        self.assertEqual(timings['counters']['train_samples'], 2 * 80)
+        self.assertGreater(timings['throughput']['train_samples_per_sec'], 0)
+
+    def test_early_stopping(self):
+        model = RecordingModel()
+        experiment, trainer = self.__run(model=model, validate_every_steps=5, patience=2)
+
+        # the accuracy never improves after the first validation, so training stops at its third one
+        self.assertEqual(len(NpySink.read(experiment.metrics_dir, 'train_loss')), 15)
+        self.assertEqual(len(NpySink.read(experiment.metrics_dir, 'valid_accuracy')), 3)
+
+        # and the model is rolled back to the best validation
+        self.assertEqual(len(model.seen), 5)
+        self.assertTrue(os.path.exists(os.path.join(experiment.experiment_dir, 'checkpoints', 'best', 'state.json')))
+        self.assertEqual(trainer.complete_conf_matrix.sum(), 10)
+
+    def test_unknown_early_stopping_metric(self):
+        model = RecordingModel()
+
+        # a typo would otherwise compare nan scores and never stop early
+        with self.assertRaises(ValueError):
+            self.__run(model=model, validate_every_steps=5, patience=2, early_stopping_metric='fscore')
+
+        self.assertEqual(len(model.seen), 0)
+
+    def test_background_validation(self):
+        model = RecordingModel()
+        experiment, trainer = self.__run(model=model, validate_every_steps=5, background_validation=True)
+
+        # every snapshot is as good as the first one, which stays the best
+        self.assertGreaterEqual(len(NpySink.read(experiment.metrics_dir, 'valid_accuracy')), 2)
+        self.assertEqual(len(model.seen), 5)
+        self.assertEqual(trainer.complete_conf_matrix.sum(), 10)
+        self.assertFalse(os.path.exists(os.path.join(experiment.experiment_dir, 'snapshots')))
+
+    def test_result_reuse(self):
+        original, _ = self.__run(model=RecordingModel())
+
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        classes = ({'low': 0, 'high': 1}, {0: 'low', 1: 'high'})
+
+        def rerun(suffix, model, **kwargs):
+            experiment = SupervisedExperiment(100, 80, 10, 10, 'threshold', 2, 4, 2, 1, 'cpu')
+            experiment.create(self.research_interface, suffix=suffix)
+
+            return experiment, experiment.run(SupervisedTrainer(model, classes), Batcher(data, batch_size=4, zero_copy=True),
+                                              IdentityEncoder(), {'X': 'x', 'Y': 'y'}, class2index=classes[0],
+                                              index2class=classes[1], **kwargs)
+
+        model = RecordingModel()
+        repeated, results = rerun('repeat', model)
+
+        self.assertEqual(model.seen, [])
+        self.assertEqual(results['accuracy'], 1.0)
+        self.assertTrue(os.path.exists(os.path.join(repeated.saved_model_dir, 'weights.pt')))
+        self.assertTrue(os.path.exists(repeated.pickle_file_path))
+
+        # the artifacts are copies, writing to them leaves the stored run as it was
+        with open(os.path.join(repeated.saved_model_dir, 'weights.pt'), 'w') as writer:
+            writer.write('[]')
+
+        with open(os.path.join(original.saved_model_dir, 'weights.pt'), 'r') as reader:
+            self.assertNotEqual(json.load(reader), [])
+
+        rerun('forced', model, force=True)
+        self.assertEqual(len(model.seen), 40)
+
+        # a different run setting is a different run
+        model = RecordingModel()
+        rerun('validated', model, validate_every_epochs=1)
+        self.assertGreater(len(model.seen), 0)
+
+        # and a stored run without its final checkpoint cannot stand in for one with it
+        model = RecordingModel()
+        checkpointed, _ = rerun('checkpointed', model, final_checkpoint=True)
+        self.assertGreater(len(model.seen), 0)
+        self.assertTrue(os.path.exists(os.path.join(checkpointed.experiment_dir, 'checkpoints')))
+
+        # so is a run of the same model class after an edit of its code
+        RecordingModel.optimize = lambda self: None
+
+        try:
+            model = RecordingModel()
+            rerun('edited', model)
+            self.assertGreater(len(model.seen), 0)
+        finally:
+            del RecordingModel.optimize
+
+    def test_unsupported_bundle_transformation(self):
+        transformation = functools.partial(lower, suffix={'!'})
+
+        # refused before the training starts, not after it
+        with self.assertRaises(ValueError):
+            self.__run(model=RecordingModel(interrupt_at=1), with_pipeline_save=True, transformations=[transformation])
+
+    def test_data_fingerprint(self):
+        data = [{'x': i, 'y': 'high' if i >= 50 else 'low'} for i in range(100)]
+        texts = [' '.join(['w'] * (i % 9 + 1)) for i in range(100)]
+
+        def fingerprints(*batchers):
+            return len(set(data_fingerprint(batcher) for batcher in batchers))
+
+        self.assertEqual(fingerprints(WeightedBatcher(data, weights={'low': 1.0, 'high': 1.0}, label_axis='y'),
+                                      WeightedBatcher(data, weights={'low': 1.0, 'high': 3.0}, label_axis='y')), 2)
+        self.assertEqual(fingerprints(WeightedBatcher(data, label_axis='y', steps_per_epoch=5),
+                                      WeightedBatcher(data, label_axis='y', steps_per_epoch=6)), 2)
+        self.assertEqual(fingerprints(BucketBatcher(texts, length_fn=len),
+                                      BucketBatcher(texts, length_fn=lambda text: len(text.split()))), 2)
+        self.assertEqual(fingerprints(Batcher(data, zero_copy=True, split_indexes=(range(0, 80), range(80, 90),
+                                                                                    range(90, 100))),
+                                      Batcher(data, zero_copy=True, split_indexes=(range(20, 100), range(0, 10),
+                                                                                    range(10, 20)))), 2)
+
+    def test_pipeline_bundle(self):
+        experiment, _ = self.__run(with_pipeline_save=True)
+
+        with open(os.path.join(experiment.bundle_dir, 'bundle.json'), 'r') as reader:
+            manifest = json.load(reader)
+
+        self.assertEqual(manifest['classes'], ['low', 'high'])
+        self.assertEqual(manifest['encoder']['type'], 'pickle')
+        self.assertTrue(os.path.exists(os.path.join(experiment.bundle_dir, 'weights.pt')))
+        self.assertTrue(os.path.exists(os.path.join(experiment.saved_pipeline_dir, 'class2index.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
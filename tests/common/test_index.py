@@ -0,0 +1,59 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from mleus.common.index import ExperimentIndex
+from mleus.common.sweep import ExperimentGrid
+from mleus.common.experiment import SupervisedExperimentSummarizer
+from tests.common.fixtures import grid_setup
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.research_interface = os.path.join(self.project_dir, 'research', 'threshold.py')
+        self.experiments_root = os.path.join(self.project_dir, 'shared', 'experiments')
+
+        defaults = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1}
+        ExperimentGrid(self.research_interface, {'batch_size': [4, 8], 'lr': [0.1, 0.01]}, grid_setup,
+                       defaults=defaults, max_workers=2).run()
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def test_incremental_update(self):
+        index = ExperimentIndex(self.experiments_root)
+
+        self.assertEqual(index.update(num_workers=2), {'parsed': 4, 'removed': 0, 'indexed': 4})
+        self.assertEqual(index.update(num_workers=2)['parsed'], 0)
+
+        experiments = index.query(order_by='name')
+        self.assertEqual(experiments[0]['batch_size'], 4)
+        self.assertEqual(experiments[0]['suffix'], 'lr=0.01')
+        self.assertEqual(experiments[0]['total_training_samples'], 80)
+
+        changed = os.path.join(experiments[0]['path'], 'eval.pkl')
+        os.utime(changed, (time.time() + 10, time.time() + 10))
+        shutil.rmtree(experiments[1]['path'])
+
+        self.assertEqual(index.update(num_workers=2), {'parsed': 1, 'removed': 1, 'indexed': 3})
+
+    def test_query(self):
+        summarizer = SupervisedExperimentSummarizer(os.path.join(self.experiments_root, 'threshold'))
+        summarizer.index.update()
+
+        self.assertEqual(len(summarizer.query(batch_size=8)), 2)
+        self.assertEqual(len(summarizer.query(batch_size__in=[4, 8], suffix__like='%0.1')), 2)
+        self.assertEqual(len(summarizer.query(accuracy__gte=0.0, limit=3)), 3)
+
+        best = summarizer.query(columns=['name', 'average_fscore'], order_by='average_fscore', descending=True)[0]
+        self.assertEqual(sorted(best.keys()), ['average_fscore', 'name'])
+
+        with self.assertRaises(ValueError):
+            summarizer.query(unknown=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+import pickle as pkl
+from mleus.common.trainer import SupervisedTrainer
+from mleus.common.bundle import save_bundle
+from mleus.common.serving import InferenceServer, load_experiment
+from tests.common.fixtures import LengthModel, lower
+
+
+class _SplitEncoder(object):
+
+    def encode(self, text):
+        return [sentence.split() for sentence in text]
+
+
+async def _request(server, method, path, body=None):
+    if server.unix_socket is not None:
+        reader, writer = await asyncio.open_unix_connection(server.unix_socket)
+    else:
+        reader, writer = await asyncio.open_connection(*server.address)
+
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+        method, path, len(payload)).encode('latin-1') + payload)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b'\r\n\r\n')
+
+    return int(head.split(b' ')[1]), json.loads(content.decode('utf-8'))
+
+
+class TestServing(unittest.TestCase):
+
+    def setUp(self):
+        self.experiment_dir = tempfile.mkdtemp()
+        self.classes = ({'short': 0, 'long': 1}, {0: 'short', 1: 'long'})
+
+    def tearDown(self):
+        shutil.rmtree(self.experiment_dir)
+
+    def __serve(self, scenario, **kwargs):
+        model = LengthModel()
+        save_bundle(os.path.join(self.experiment_dir, 'bundle'), SupervisedTrainer(model, self.classes),
+                    _SplitEncoder(), [lower])
+
+        server = InferenceServer(load_experiment(self.experiment_dir), port=0, **kwargs)
+
+        async def run():
+            await server.start()
+
+            try:
+                return await scenario(server)
+            finally:
+                await server.stop()
+
+        return server, asyncio.run(run())
+
+    def test_micro_batching(self):
+        async def scenario(server):
+            texts = ['a b c', 'a', 'A B C D', 'b', 'c c c', 'd d', 'e e e e e', 'f']
+
+            return await asyncio.gather(*[_request(server, 'POST', '/predict', {'text': text}) for text in texts])
+
+        server, responses = self.__serve(scenario, max_batch_size=4, max_wait_ms=200.0)
+
+        self.assertEqual([status for status, _ in responses], [200] * 8)
+        self.assertEqual([response['classes'][0] for _, response in responses],
+                         ['long', 'short', 'long', 'short', 'long', 'short', 'long', 'short'])
+        self.assertEqual(responses[1][1]['probs'], [[1.0, 0.0]])
+
+        # the concurrent requests are coalesced, no batch goes over max_batch_size
+        batch_sizes = server.predictor.model.batch_sizes
+        self.assertEqual(sum(batch_sizes), 8)
+        self.assertLess(len(batch_sizes), 8)
+        self.assertLessEqual(max(batch_sizes), 4)
+
+        stats = server.stats()
+        self.assertEqual(stats['counters']['requests'], 8)
+        self.assertEqual(stats['stages']['request']['count'], 8)
+        self.assertIn('p99_ms', stats['stages']['request'])
+
+    def test_routes(self):
+        async def scenario(server):
+            return [await _request(server, 'POST', '/predict', {'texts': ['x y z', 'x']}),
+                    await _request(server, 'POST', '/predict', {'texts': 'x'}),
+                    await _request(server, 'GET', '/stats'),
+                    await _request(server, 'GET', '/missing')]
+
+        _, (predicted, invalid, stats, missing) = self.__serve(scenario, max_wait_ms=1.0)
+
+        self.assertEqual(predicted, (200, {'classes': ['long', 'short'], 'probs': [[0.0, 1.0], [1.0, 0.0]]}))
+        self.assertEqual(invalid[0], 400)
+        self.assertEqual(stats[1]['counters']['predict_texts'], 2)
+        self.assertEqual(missing[0], 404)
+
+    def test_unix_socket(self):
+        socket_path = os.path.join(self.experiment_dir, 'server.sock')
+
+        async def scenario(server):
+            return await _request(server, 'POST', '/predict', {'text': 'one two three'})
+
+        _, (status, response) = self.__serve(scenario, unix_socket=socket_path)
+
+        self.assertEqual((status, response['classes']), (200, ['long']))
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_load_saved_pipeline(self):
+        model_dir = os.path.join(self.experiment_dir, 'saved_model')
+        pipeline_dir = os.path.join(self.experiment_dir, 'saved_pipeline')
+        os.makedirs(model_dir)
+        os.makedirs(pipeline_dir)
+
+        LengthModel(threshold=2).save_weights(os.path.join(model_dir, 'weights.pt'))
+
+        with open(os.path.join(model_dir, 'model.pkl'), 'wb') as writer:
+            pkl.dump(LengthModel, writer)
+
+        with open(os.path.join(model_dir, 'args.json'), 'w') as writer:
+            json.dump({'threshold': 0}, writer)
+
+        with open(os.path.join(pipeline_dir, 'encoder.pkl'), 'wb') as writer:
+            pkl.dump(_SplitEncoder(), writer)
+
+        with open(os.path.join(pipeline_dir, 'index2class.json'), 'w') as writer:
+            json.dump(self.classes[1], writer)
+
+        predictor = load_experiment(self.experiment_dir)
+
+        self.assertEqual(predictor.classes, ['short', 'long'])
+        self.assertEqual(predictor.predict_probs(['A b', 'a']), [[0.0, 1.0], [1.0, 0.0]])
+
+        os.remove(os.path.join(pipeline_dir, 'index2class.json'))
+
+        with self.assertRaises(ValueError):
+            load_experiment(self.experiment_dir)
+
+    def test_latency_window(self):
+        async def scenario(server):
+            for text in ['a', 'b c', 'd e f', 'g']:
+                await _request(server, 'POST', '/predict', {'text': text})
+
+        server, _ = self.__serve(scenario, max_wait_ms=1.0, latency_window=2)
+
+        # every request is counted, only the last two are kept for the percentiles
+        self.assertEqual(len(server.timer.durations['request']), 2)
+        self.assertEqual(server.stats()['stages']['request']['count'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from mleus.common.batcher import Batcher
+from mleus.common.shards import ShardWriter, ShardedDataset
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_json_shards(self):
+        with ShardWriter(self.directory, fmt='json', rows_per_shard=7) as writer:
+            for i in range(30):
+                writer.write(['sentence number {}'.format(i), i % 3])
+
+        dataset = ShardedDataset(self.directory)
+
+        self.assertEqual(len(dataset), 30)
+        self.assertEqual(len(dataset.shards), 5)
+        self.assertEqual(dataset[15], ['sentence number 15', 0])
+        self.assertEqual(dataset[-1], ['sentence number 29', 2])
+        self.assertEqual([row[1] for row in dataset.take([0, 8, 29])], [0, 2, 2])
+
+    def test_array_shards_with_batcher(self):
+        with ShardWriter(self.directory, fmt='array', rows_per_shard=16, dtype='int32', shape=(2,)) as writer:
+            for i in range(100):
+                writer.write([i, -i])
+
+        dataset = ShardedDataset(self.directory)
+        batcher = Batcher(dataset, batch_size=8, zero_copy=True, block_size=8)
+
+        seen = []
+
+        for current_batch in batcher.iter_batches(target='train'):
+            self.assertEqual(current_batch.shape, (8, 2))
+            self.assertTrue(np.array_equal(current_batch[:, 0], -current_batch[:, 1]))
+            seen.extend(current_batch[:, 0].tolist())
+
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(sorted(batcher.permutation.tolist()), list(range(100)))
+
+        # the shards are read one after the other, in an order that changes from one shuffle to the next
+        orders = set()
+
+        for _ in range(5):
+            shard_ids = np.searchsorted(dataset.shard_starts, batcher.permutation[:80], side='right') - 1
+            runs = [shard_ids[0]] + [shard_id for previous, shard_id in zip(shard_ids, shard_ids[1:])
+                                     if shard_id != previous]
+
+            self.assertEqual(len(runs), len(set(runs)))
+            orders.add(tuple(runs))
+
+            batcher.shuffle_me('train')
+
+        self.assertGreater(len(orders), 1)
+
+    def test_empty_text_shard(self):
+        with ShardWriter(self.directory, fmt='text', rows_per_shard=2) as writer:
+            for text in ['a', 'b', '', '', 'c']:
+                writer.write(text)
+
+        dataset = ShardedDataset(self.directory)
+
+        self.assertEqual(len(dataset), 5)
+        self.assertEqual(dataset.take([1, 2, 3, 4]), ['b', '', '', 'c'])
+
+    def test_tensor_shards(self):
+        with ShardWriter(self.directory, fmt='tensor', rows_per_shard=4, dtype='float32') as writer:
+            for i in range(10):
+                writer.write(np.full((i % 3 + 1, 2), i))
+
+        dataset = ShardedDataset(self.directory)
+
+        self.assertEqual(len(dataset), 10)
+        self.assertEqual(dataset[5].shape, (3, 2))
+        self.assertTrue(np.array_equal(dataset[7], np.full((2, 2), 7)))
+        self.assertEqual([row.shape[0] for row in dataset.take([0, 1, 9])], [1, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import os
+import time
+import queue
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from mleus.common import sweep
+from mleus.common.sweep import ExperimentGrid, ExperimentQueue, SuccessiveHalving, build_experiment, grid_configurations
+from tests.common.fixtures import grid_setup
+
+
+def _parallel_setup(configuration):
+    # runs that start processes of their own
+    return dict(grid_setup(configuration), num_workers=2, validate_every_steps=5, background_validation=True)
+
+
+class _LateQueue(object):
+    """
+    Times out on the first get even though a result arrived, as when a job reports just before the timeout.
+    """
+
+    def __init__(self, inner):
+        self.queue = inner
+        self.held = []
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def get(self, timeout=None):
+        if len(self.held) == 0:
+            self.held.append(self.queue.get())
+
+            # the job process has exited by the time the timeout is handled
+            while len(multiprocessing.active_children()) > 0:
+                time.sleep(0.05)
+
+            raise queue.Empty
+
+        return self.queue.get(timeout=timeout)
+
+    def get_nowait(self):
+        if len(self.held) > 0:
+            return self.held.pop()
+
+        return self.queue.get_nowait()
+
+
+class _LateContext(object):
+
+    def __init__(self, context):
+        self.Process = context.Process
+        self.Queue = lambda: _LateQueue(context.Queue())
+
+
+def _drain(research_interface):
+    ExperimentQueue.for_research(research_interface, heartbeat_seconds=0.05).work(research_interface, grid_setup)
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.research_interface = os.path.join(self.project_dir, 'research', 'threshold.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def test_grid_configurations(self):
+        configurations = grid_configurations({'batch_size': [4, 8], 'lr': [0.1, 0.01]}, defaults={'epochs': 1})
+
+        self.assertEqual(len(configurations), 4)
+        self.assertEqual(configurations[0], {'epochs': 1, 'batch_size': 4, 'lr': 0.1})
+
+    def test_experiment_grid(self):
+        param_space = {'batch_size': [4, 8], 'lr': [0.1, 0.01]}
+        defaults = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1}
+
+        results = ExperimentGrid(self.research_interface, param_space, grid_setup, defaults=defaults, max_workers=2).run()
+
+        self.assertEqual([result['status'] for result in results], ['done'] * 4)
+        self.assertEqual([result['configuration'] for result in results],
+                         grid_configurations(param_space, defaults=defaults))
+
+        for result in results:
+            self.assertTrue(os.path.exists(os.path.join(result['experiment_dir'], 'eval.pkl')))
+
+        results = ExperimentGrid(self.research_interface, param_space, grid_setup, defaults=defaults, max_workers=2).run()
+        self.assertEqual([result['status'] for result in results], ['skipped'] * 4)
+
+        results = ExperimentGrid(self.research_interface, {'batch_size': [4], 'lr': [0.1]}, grid_setup,
+                                 defaults=defaults, if_exists='suffix').run()
+        self.assertTrue(results[0]['experiment_dir'].endswith('lr=0.1_2'))
+
+    def test_experiment_grid_with_workers(self):
+        defaults = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1}
+
+        results = ExperimentGrid(self.research_interface, {'batch_size': [4, 8]}, _parallel_setup, defaults=defaults,
+                                 max_workers=2).run()
+
+        self.assertEqual([result['status'] for result in results], ['done'] * 2, results)
+        self.assertEqual(ExperimentGrid(self.research_interface, {'batch_size': []}, _parallel_setup, defaults=defaults).run(), [])
+
+    def test_result_after_timeout(self):
+        configuration = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1, 'batch_size': 4}
+        process_context = sweep.process_context
+        sweep.process_context = lambda: _LateContext(process_context())
+
+        try:
+            results = sweep.run_jobs([(self.research_interface, configuration, grid_setup, None)], max_workers=1)
+        finally:
+            sweep.process_context = process_context
+
+        self.assertEqual([result['status'] for result in results], ['done'])
+
+    def test_experiment_queue(self):
+        queue = ExperimentQueue.for_research(self.research_interface)
+        defaults = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1}
+        configurations = grid_configurations({'batch_size': [4, 8, 16], 'lr': [0.1, 0.01]}, defaults=defaults)
+
+        self.assertEqual(len(set(queue.submit(configurations))), 6)
+        self.assertEqual(queue.submit(configurations[:1]), queue.submit(configurations[:1]))
+        self.assertEqual(queue.status()['pending'], 6)
+
+        workers = [multiprocessing.Process(target=_drain, args=(self.research_interface,)) for _ in range(3)]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(queue.status(), {'pending': 0, 'claimed': 0, 'done': 6, 'failed': 0})
+        self.assertEqual(len(os.listdir(os.path.dirname(build_experiment(dict(defaults, batch_size=4))
+                                                        .locate(self.research_interface)))), 6)
+
+    def test_stale_claims(self):
+        queue = ExperimentQueue.for_research(self.research_interface, stale_seconds=60)
+        job_id = queue.submit([{'batch_size': 4}])[0]
+
+        self.assertEqual(queue.claim(), (job_id, {'batch_size': 4}))
+        self.assertEqual(queue.reclaim_stale(), [])
+
+        claimed_path = os.path.join(queue.queue_dir, 'claimed', job_id + '.json')
+        os.utime(claimed_path, (time.time() - 120, time.time() - 120))
+
+        self.assertEqual(queue.reclaim_stale(), [job_id])
+        self.assertEqual(queue.state_of(job_id), 'pending')
+
+    def test_claim_old_submission(self):
+        queue = ExperimentQueue.for_research(self.research_interface, stale_seconds=60)
+        job_id = queue.submit([{'batch_size': 4}])[0]
+
+        # submitted long before any worker got to it
+        pending_path = os.path.join(queue.queue_dir, 'pending', job_id + '.json')
+        os.utime(pending_path, (time.time() - 120, time.time() - 120))
+
+        self.assertEqual(queue.claim(), (job_id, {'batch_size': 4}))
+        self.assertEqual(queue.reclaim_stale(), [])
+        self.assertEqual(queue.state_of(job_id), 'claimed')
+
+    def test_reclaimed_job_reruns(self):
+        queue = ExperimentQueue.for_research(self.research_interface, heartbeat_seconds=0.05)
+        configuration = {'model': 'threshold', 'epochs': 1, 'number_classes': 2, 'input_length': 1, 'batch_size': 4}
+        job_id = queue.submit([configuration])[0]
+
+        # a worker that crashed after creating the experiment directory
+        experiment_dir = build_experiment(configuration).locate(self.research_interface)
+        os.makedirs(experiment_dir)
+
+        self.assertEqual(queue.work(self.research_interface, grid_setup), 1)
+        self.assertEqual(queue.state_of(job_id), 'done')
+        self.assertTrue(os.path.exists(os.path.join(experiment_dir, 'eval.pkl')))
+
+    def test_finish_own_claim_only(self):
+        first = ExperimentQueue.for_research(self.research_interface, stale_seconds=60)
+        second = ExperimentQueue.for_research(self.research_interface, stale_seconds=60)
+        job_id = first.submit([{'batch_size': 4}])[0]
+
+        first.claim()
+        claimed_path = os.path.join(first.queue_dir, 'claimed', job_id + '.json')
+        os.utime(claimed_path, (time.time() - 120, time.time() - 120))
+
+        self.assertEqual(second.reclaim_stale(), [job_id])
+        self.assertEqual(second.claim(), (job_id, {'batch_size': 4}))
+
+        # the stale worker finishes late, the fresh claim of the second worker stays
+        first.complete(job_id, {'status': 'done'})
+        self.assertTrue(os.path.exists(claimed_path))
+
+        second.complete(job_id, {'status': 'done'})
+        self.assertEqual(first.status(), {'pending': 0, 'claimed': 0, 'done': 1, 'failed': 0})
+
+    def test_finish_reclaimed_claim(self):
+        queue = ExperimentQueue.for_research(self.research_interface, stale_seconds=60)
+        job_id = queue.submit([{'batch_size': 4}])[0]
+
+        queue.claim()
+        claimed_path = os.path.join(queue.queue_dir, 'claimed', job_id + '.json')
+        os.utime(claimed_path, (time.time() - 120, time.time() - 120))
+        queue.reclaim_stale()
+
+        # nobody claimed it again, so it is not left pending once done
+        queue.complete(job_id, {'status': 'done'})
+        self.assertEqual(queue.status(), {'pending': 0, 'claimed': 0, 'done': 1, 'failed': 0})
+
+    def test_successive_halving(self):
+        defaults = {'model': 'threshold', 'epochs': 4, 'number_classes': 2, 'input_length': 1}
+        configurations = grid_configurations({'batch_size': [4, 8, 16, 32]}, defaults=defaults)
+
+        scheduler = SuccessiveHalving(self.research_interface, configurations, grid_setup, min_epochs=1, eta=2,
+                                      max_workers=2)
+        best = scheduler.run()
+
+        self.assertEqual([len(rung) for rung in scheduler.rungs], [4, 2, 1])
+        self.assertEqual([rung[0]['epochs'] for rung in scheduler.rungs], [1, 2, 4])
+        self.assertEqual(best, scheduler.rungs[-1][0])
+
+        for rung in scheduler.rungs:
+            for run in rung:
+                self.assertTrue(os.path.exists(os.path.join(run['experiment_dir'], 'eval.pkl')))
+                self.assertTrue(os.path.exists(os.path.join(run['experiment_dir'], 'checkpoints')))
+
+        survivors = [run['configuration'] for run in scheduler.rungs[1]]
+        self.assertTrue(all(configuration in [run['configuration'] for run in scheduler.rungs[0][:2]]
+                            for configuration in survivors))
+
+
+    def test_successive_halving_equal_configurations(self):
+        configuration = {'model': 'threshold', 'epochs': 2, 'number_classes': 2, 'input_length': 1, 'batch_size': 4}
+
+        scheduler = SuccessiveHalving(self.research_interface, [configuration, configuration], grid_setup,
+                                      min_epochs=1, eta=2, if_exists='suffix', max_workers=1)
+        scheduler.run()
+
+        self.assertEqual([len(rung) for rung in scheduler.rungs], [2, 1])
+        self.assertEqual(len(set(run['experiment_dir'] for run in scheduler.rungs[0])), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
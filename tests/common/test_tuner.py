@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from mleus.common.trainer import SupervisedTrainer
+from mleus.common.experiment import SupervisedExperiment
+from mleus.common.tuner import BatchSizeTuner, PeakRSSMonitor, current_rss_mb
+from tests.common.fixtures import IdentityEncoder
+
+
+class _SumModel(object):
+
+    def __call__(self, x):
+        return sum(x)
+
+    def calculate_gradient(self, prediction, y):
+        return 0.0
+
+    def optimize(self):
+        pass
+
+
+class TestTuner(unittest.TestCase):
+
+    def test_batch_size_tuner(self):
+        data = [{'x': i, 'y': i % 2} for i in range(2000)]
+        trainer = SupervisedTrainer(_SumModel(), ({0: 0, 1: 1}, {0: 0, 1: 1}))
+
+        tuner = BatchSizeTuner(trainer, IdentityEncoder(), data, {'X': 'x', 'Y': 'y'},
+                               start_batch_size=4, max_batch_size=256, trial_steps=2)
+        best_batch_size = tuner.run()
+
+        self.assertEqual([trial['batch_size'] for trial in tuner.trials], [4, 8, 16, 32, 64, 128, 256])
+        self.assertIn(best_batch_size, [4, 8, 16, 32, 64, 128, 256])
+        self.assertGreater(current_rss_mb(), 0)
+
+        tuner = BatchSizeTuner(trainer, IdentityEncoder(), data, {'X': 'x', 'Y': 'y'}, memory_budget_mb=1)
+
+        with self.assertRaises(ValueError):
+            tuner.run()
+
+    def test_peak_rss(self):
+        with PeakRSSMonitor() as monitor:
+            buffer = np.ones(64 * 1024 * 1024, dtype=np.uint8)
+            del buffer
+
+        # the 64 MB buffer is gone, but it is part of the peak
+        self.assertGreater(monitor.peak_mb, current_rss_mb() + 32)
+
+    def test_apply_to(self):
+        data = [{'x': i, 'y': i % 2} for i in range(200)]
+        trainer = SupervisedTrainer(_SumModel(), ({0: 0, 1: 1}, {0: 0, 1: 1}))
+
+        tuner = BatchSizeTuner(trainer, IdentityEncoder(), data, {'X': 'x', 'Y': 'y'}, max_batch_size=16, trial_steps=1)
+        tuner.run()
+
+        experiment = SupervisedExperiment(200, 160, 20, 20, 'sum', 2, 4, 2, 1, 'cpu')
+        tuner.apply_to(experiment)
+        self.assertEqual(experiment.batch_size, tuner.best_batch_size)
+
+        project_dir = tempfile.mkdtemp()
+
+        try:
+            experiment.create(os.path.join(project_dir, 'research', 'sum.py'))
+
+            # the directory and the index entry are already named after the batch size
+            with self.assertRaises(ValueError):
+                tuner.apply_to(experiment)
+        finally:
+            shutil.rmtree(project_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()